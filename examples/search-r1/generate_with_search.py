@@ -61,7 +61,7 @@ def _passages2string(retrieval_result):
     return format_reference
 
 
-async def search(query: str) -> str:
+async def search(args, query: str) -> str:
     """
     Perform search using either local search engine or Google search.
     The search backend is determined by SEARCH_R1_CONFIGS["search_backend"].
@@ -73,6 +73,7 @@ async def search(query: str) -> str:
 
         local_config = SEARCH_R1_CONFIGS["local"]
         result = await local_search(
+            args,
             local_config["search_url"],
             query,
             SEARCH_R1_CONFIGS["topk"],
@@ -83,6 +84,7 @@ async def search(query: str) -> str:
 
         google_config = SEARCH_R1_CONFIGS["google"]
         result = await google_search(
+            args,
             google_config["api_key"],
             query,
             SEARCH_R1_CONFIGS["topk"],
@@ -129,13 +131,13 @@ def postprocess_predictions(prediction: str):
     return action, content
 
 
-async def execute_predictions(prediction: str) -> str:
+async def execute_predictions(args, prediction: str) -> str:
     action, content = postprocess_predictions(prediction)
 
     if action == "search":
         search_query = content
         async with SEMAPHORE:
-            search_results = await search(search_query)
+            search_results = await search(args, search_query)
         next_obs = f"\n\n<information>{search_results.strip()}</information>\n\n"
         done = False
     elif action == "answer":
@@ -214,7 +216,7 @@ async def generate(args, sample: Sample, sampling_params) -> Sample:
         if output["meta_info"]["finish_reason"]["type"] == "length":
             break
 
-        next_obs, done = await execute_predictions(cur_response)
+        next_obs, done = await execute_predictions(args, cur_response)
         if done:
             break
 
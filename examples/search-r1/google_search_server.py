@@ -7,6 +7,8 @@ from typing import Dict, List
 import aiohttp
 import chardet
 
+from slime.utils.http_utils import service_post
+
 
 # --- Utilities ---
 def parse_snippet(snippet: str) -> List[str]:
@@ -92,29 +94,36 @@ def collect_context(snippet: str, doc: str) -> str:
     return "\n".join(ctx_paras)
 
 
-async def google_search(api_key, query, top_k=5, timeout: int = 60, proxy=None, snippet_only=False) -> List[Dict]:
-    timeout_obj = aiohttp.ClientTimeout(total=timeout)
-    session_kwargs = {}
-    if proxy:
-        session_kwargs["proxy"] = proxy
-    async with aiohttp.ClientSession(**session_kwargs) as session:
+async def _serper_search(args, api_key, query, top_k, timeout, proxy) -> Dict:
+    url = "https://google.serper.dev/search"
+    payload = {
+        "q": query,
+        "num": top_k,
+        "gl": "us",
+        "hl": "en",
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "X-API-KEY": api_key,
+    }
+    if not proxy:
+        # the pooled client of the rollout keeps the connections to the API alive.
+        return await service_post(args, url, payload, headers=headers, timeout=timeout)
+
+    # the proxy is set per client, so a proxied search gets its own session.
+    async with aiohttp.ClientSession(proxy=proxy) as session:
         async with session.post(
-            "https://google.serper.dev/search",
-            json={
-                "q": query,
-                "num": top_k,
-                "gl": "us",
-                "hl": "en",
-            },
-            headers={
-                "Content-Type": "application/json",
-                "X-API-KEY": api_key,
-            },
-            timeout=timeout_obj,
+            url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
         ) as resp:
             resp.raise_for_status()
-            response = await resp.json()
-            items = response.get("organic", [])
+            return await resp.json()
+
+
+async def google_search(
+    args, api_key, query, top_k=5, timeout: int = 60, proxy=None, snippet_only=False
+) -> List[Dict]:
+    response = await _serper_search(args, api_key, query, top_k, timeout, proxy)
+    items = response.get("organic", [])
 
     contexts = []
     if snippet_only:
@@ -22,10 +22,12 @@ Usage:
 import asyncio
 import argparse
 from typing import List, Dict, Optional
-import aiohttp
+
+from slime.utils.http_utils import service_post
 
 
 async def local_search(
+    args,
     search_url: str,
     query: str,
     top_k: int = 5,
@@ -38,8 +40,11 @@ async def local_search(
     This function provides the same interface as google_search() from google_search_server.py,
     making it a drop-in replacement. The only difference is that instead of using an API key,
     it uses a search_url parameter.
+    The requests go through the pooled client of the rollout (see `--service-*`), which keeps the connections
+    to the retrieval server alive and retries when it is overloaded.
 
     Args:
+        args: the whole args
         search_url: URL of the local retrieval server (e.g., "http://127.0.0.1:8000/retrieve")
         query: Search query string
         top_k: Number of results to retrieve
@@ -59,17 +64,9 @@ async def local_search(
     }
 
     # Send async request to local retrieval server
-    timeout_obj = aiohttp.ClientTimeout(total=timeout)
-    session_kwargs = {}
-    # Note: proxy parameter is kept for API compatibility but typically not needed for local server
-    if proxy:
-        session_kwargs["proxy"] = proxy
-
+    # Note: proxy parameter is kept for API compatibility but not needed for local server
     try:
-        async with aiohttp.ClientSession(**session_kwargs) as session:
-            async with session.post(search_url, json=payload, timeout=timeout_obj) as resp:
-                resp.raise_for_status()
-                result = await resp.json()
+        result = await service_post(args, search_url, payload, timeout=timeout)
     except Exception as e:
         print(f"Error calling local search engine at {search_url}: {e}")
         return []
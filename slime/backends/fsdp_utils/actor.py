@@ -16,9 +16,10 @@ from transformers import AutoConfig, AutoModelForCausalLM, AutoProcessor, AutoTo
 from slime.ray.train_actor import TrainRayActor
 from slime.utils import profile_utils, train_dump_utils, train_metric_utils
 from slime.utils.context_utils import with_defer
-from slime.utils.data import get_minimum_num_micro_batch_size, process_rollout_data
+from slime.utils.data import process_rollout_data
 from slime.utils.distributed_utils import get_gloo_group
 from slime.utils.memory_utils import clear_memory, print_memory
+from slime.utils.micro_batch_planner import get_micro_batch_costs, get_num_micro_batches
 from slime.utils.ppo_utils import compute_approx_kl, compute_policy_loss
 from slime.utils.ray_utils import Box
 from slime.utils.timer import Timer, inverse_timer, timer
@@ -213,6 +214,10 @@ class FSDPTrainRayActor(TrainRayActor):
         dist.barrier(group=get_gloo_group())
         print_memory("after wake_up model")
 
+    def get_dp_size(self) -> int:
+        """Every rank is a data parallel rank in the FSDP backend."""
+        return dist.get_world_size()
+
     def save_model(self, iteration: int) -> None:
         """Delegate checkpoint saving to the shared checkpoint utilities."""
         if self.args.debug_rollout_only or self.args.save is None:
@@ -312,12 +317,15 @@ class FSDPTrainRayActor(TrainRayActor):
             self.args.global_batch_size % dp_size == 0
         ), f"global_batch_size {self.args.global_batch_size} is not divisible by dp_world_size {dp_size}"
         # Use global_batch_size for splitting when max_tokens_per_gpu is enabled
+        total_lengths = [len(t) for t in tokens]
+        costs = get_micro_batch_costs(self.args, total_lengths)
         if self.args.use_dynamic_batch_size:
             for i in range(0, len(tokens), local_batch_size):
                 mbs_size_list.append(
-                    get_minimum_num_micro_batch_size(
-                        [len(t) for t in rollout_data["tokens"][i : i + local_batch_size]],
+                    get_num_micro_batches(
+                        total_lengths[i : i + local_batch_size],
                         self.args.max_tokens_per_gpu,
+                        costs[i : i + local_batch_size] if costs is not None else None,
                     )
                 )
             num_microbatches = torch.tensor(mbs_size_list, dtype=torch.int, device=torch.cuda.current_device())
@@ -344,6 +352,7 @@ class FSDPTrainRayActor(TrainRayActor):
                         rollout_data["rollout_log_probs"][start:end] if "rollout_log_probs" in rollout_data else None
                     ),
                     num_packs=mbs_size,
+                    costs=costs[start:end] if costs is not None else None,
                 )
             )
             start = end
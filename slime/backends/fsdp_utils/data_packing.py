@@ -4,7 +4,7 @@ import math
 
 import torch
 
-from slime.utils.seqlen_balancing import get_seqlen_balanced_partitions
+from slime.utils.micro_batch_planner import plan_micro_batches
 
 
 def pack_sequences(
@@ -18,6 +18,7 @@ def pack_sequences(
     rollout_log_probs: list[list[float]] | None = None,
     max_tokens_per_gpu: int | None = None,
     num_packs: int | None = None,
+    costs: list[int] | None = None,
 ) -> list[dict]:
     """
     Pack sequences into dense batches with cumulative sequence lengths.
@@ -32,6 +33,7 @@ def pack_sequences(
         returns: List of returns per sequence
         max_tokens_per_gpu: Maximum tokens per GPU pack
         num_packs: Explicit number of packs to create
+        costs: Cost of each sequence to balance across packs, defaults to the sequence lengths
 
     Returns:
         List of packed batches with tokens, masks, cu_seqlens, rewards, raw_rewards, response_lengths, advantages, returns
@@ -51,9 +53,7 @@ def pack_sequences(
         k_partitions = 1
 
     # Use balanced partitioning for optimal load distribution
-    partitions = get_seqlen_balanced_partitions(
-        seq_lengths, k_partitions=k_partitions, equal_size=False  # Allow variable sizes for better balance
-    )
+    partitions = plan_micro_batches(seq_lengths, k_partitions, costs)
 
     # Pack each partition
     result = []
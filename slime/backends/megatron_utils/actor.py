@@ -169,9 +169,11 @@ class MegatronTrainRayActor(TrainRayActor):
             mpu.get_data_parallel_world_size(with_context_parallel=False),
         )
         # TODO: this is ugly, move to somewhere else?
-        # move tokens to GPU in advance
+        # move tokens to GPU in advance, unless they are staged micro-batch by micro-batch
+        # through pinned memory by the prefetching data iterator.
+        tokens_device = "cpu" if self.args.data_prefetch_depth > 0 else torch.cuda.current_device()
         rollout_data["tokens"] = [
-            torch.tensor(t, dtype=torch.long, device=torch.cuda.current_device()) for t in rollout_data["tokens"]
+            torch.tensor(t, dtype=torch.long, device=tokens_device) for t in rollout_data["tokens"]
         ]
         rollout_data["loss_masks"] = [
             torch.tensor(t, dtype=torch.int, device=torch.cuda.current_device()) for t in rollout_data["loss_masks"]
@@ -336,6 +338,9 @@ class MegatronTrainRayActor(TrainRayActor):
 
         log_perf_data(rollout_id, self.args)
 
+    def get_dp_size(self) -> int:
+        return mpu.get_data_parallel_world_size(with_context_parallel=False)
+
     def save_model(self, iteration: int) -> None:
         if self.args.debug_rollout_only:
             return
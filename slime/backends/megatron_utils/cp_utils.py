@@ -2,9 +2,10 @@ from typing import Callable, Union
 
 import torch
 import torch.distributed as dist
-import torch.nn.functional as F
 from megatron.core import mpu
 
+from slime.utils.data_iterator import slice_tokens_with_cp
+
 
 def get_logits_and_tokens_offset_with_cp(
     total_length: int,
@@ -156,20 +157,9 @@ def all_gather_with_cp(tensor: torch.Tensor, total_length: int, response_length:
 
 
 def slice_with_cp(tokens: torch.Tensor, pad_value: int) -> torch.Tensor:
-    cp_rank = mpu.get_context_parallel_rank()
-    cp_size = mpu.get_context_parallel_world_size()
-
-    if cp_size == 1:
-        return tokens
-
-    # pad
-    chunk_size = (len(tokens) + 2 * cp_size - 1) // (2 * cp_size)
-    pad = 2 * cp_size * chunk_size - len(tokens)
-    tokens = F.pad(tokens, (0, pad), value=pad_value)
-    # get 2 chunk for thd cp
-    start_1, end_1 = chunk_size * cp_rank, chunk_size * (cp_rank + 1)
-    start_2, end_2 = chunk_size * (2 * cp_size - cp_rank - 1), chunk_size * (2 * cp_size - cp_rank)
-    return torch.cat([tokens[start_1:end_1], tokens[start_2:end_2]])
+    return slice_tokens_with_cp(
+        tokens, pad_value, mpu.get_context_parallel_rank(), mpu.get_context_parallel_world_size()
+    )
 
 
 def slice_log_prob_with_cp(
@@ -4,19 +4,18 @@ from typing import Optional, Sequence, Union
 import numpy as np
 import torch
 import torch.distributed as dist
-import torch.nn.functional as F
 import wandb
 from megatron.core import mpu
 from megatron.core.packed_seq_params import PackedSeqParams
 
 from slime.utils import train_metric_utils
-from slime.utils.data import get_minimum_num_micro_batch_size
+from slime.utils.data_iterator import DataIterator, TokenBatch, concat_tokens_with_cp
 from slime.utils.flops_utils import calculate_fwd_flops
 from slime.utils.metric_utils import compute_pass_rate
-from slime.utils.seqlen_balancing import get_seqlen_balanced_partitions
+from slime.utils.micro_batch_planner import get_micro_batch_costs, get_num_micro_batches, plan_micro_batches
 from slime.utils.types import RolloutBatch
 
-from .cp_utils import get_sum_of_sample_mean, slice_with_cp
+from .cp_utils import get_sum_of_sample_mean
 
 
 def get_batch(
@@ -32,6 +31,9 @@ def get_batch(
     - Slice tokens into two chunks for Context Parallelism (CP), concatenate, and pad to a multiple of 128.
     - Build cu_seqlens and `PackedSeqParams` with T-H-D layout (T: sequence length, H: attention heads, D: head dimension).
 
+    If the iterator prefetches, the tokens come as a `TokenBatch` already packed in pinned memory,
+    and only the host-to-device copies are done here.
+
     Returns a dict including:
     - "tokens": torch.LongTensor of shape [1, T_padded] on the current CUDA device
     - "unconcat_tokens": list[torch.LongTensor] for the micro-batch before CP slicing/concat
@@ -42,33 +44,23 @@ def get_batch(
     assert "tokens" in keys
     batch = data_iterator.get_next(keys)
 
-    packed_seq_params = None
     tokens = batch["tokens"]
-    # use 0 as the pad token id should be fine?
-    pad_token_id = 0
-
-    # for cp, we need all tokens to calculate logprob
-    batch["unconcat_tokens"] = tokens
-
-    cp_size = mpu.get_context_parallel_world_size()
-    tokens = [slice_with_cp(t, pad_token_id) for t in tokens]
-
-    cu_seqlens = [0]
-    for t in tokens:
-        cu_seqlens.append(cu_seqlens[-1] + t.size(0))
-
-    tokens = torch.cat(tokens)
-
-    # Always pad to 128 to reduce memory fragmentation and maybe make the computation faster
-    # TODO: make this configurable?
-    pad = (128 - tokens.size(0) % 128) % 128
-    if pad != 0:
-        tokens = F.pad(tokens, (0, pad), value=pad_token_id)
-        cu_seqlens.append(cu_seqlens[-1] + pad)
-
-    # thd requires the cu_seqlens to be of the origin length
-    cu_seqlens = torch.tensor(cu_seqlens, dtype=torch.int).cuda() * cp_size
-    max_seqlen = (cu_seqlens[1:] - cu_seqlens[:-1]).max().item()
+    if isinstance(tokens, TokenBatch):
+        # the micro-batch has been assembled in pinned memory by the prefetch thread.
+        device = torch.cuda.current_device()
+        batch["unconcat_tokens"] = list(
+            tokens.unconcat_tokens.to(device, non_blocking=True).split(tokens.total_lengths)
+        )
+        cu_seqlens = tokens.cu_seqlens.to(device, non_blocking=True)
+        max_seqlen = tokens.max_seqlen
+        tokens = tokens.tokens.to(device, non_blocking=True)
+    else:
+        # for cp, we need all tokens to calculate logprob
+        batch["unconcat_tokens"] = tokens
+        tokens, cu_seqlens, max_seqlen = concat_tokens_with_cp(
+            tokens, mpu.get_context_parallel_rank(), mpu.get_context_parallel_world_size()
+        )
+        cu_seqlens = cu_seqlens.cuda()
 
     packed_seq_params = PackedSeqParams(
         cu_seqlens_q=cu_seqlens,
@@ -142,70 +134,6 @@ def gather_log_data(
         return None
 
 
-class DataIterator:
-    """Micro-batch iterator over rollout dicts.
-
-    Supports either fixed contiguous micro-batches or an explicit per-step
-    index schedule (for dynamic batch sizing / sequence-length balancing).
-    """
-
-    def __init__(
-        self,
-        rollout_data: RolloutBatch,
-        micro_batch_size: Optional[int] = None,
-        micro_batch_indices: Optional[list[list[int]]] = None,
-    ) -> None:
-        """Initialize an iterator over `rollout_data`.
-
-        Args:
-            rollout_data: Dict of per-sample fields for the local step.
-            micro_batch_size: Fixed contiguous slice size when not using dynamic scheduling.
-            micro_batch_indices: Explicit indices per micro-batch when using dynamic balancing.
-                Must be mutually exclusive with `micro_batch_size`.
-        """
-        self.rollout_data = rollout_data
-        self.micro_batch_size = micro_batch_size
-        self.micro_batch_indices = micro_batch_indices
-        assert micro_batch_size is None or micro_batch_indices is None
-        self.offset = 0
-
-    def get_next(self, keys: Sequence[str]) -> dict[str, Optional[list[object]]]:
-        """Return the next micro-batch for the requested keys.
-
-        - If `micro_batch_indices` is provided, selects rows according to the current
-          index list for each requested key.
-        - Otherwise, slices a contiguous window of size `micro_batch_size` starting
-          at the current offset.
-
-        Returns a dict mapping each key to a list subset (or None if absent).
-        """
-        batch = {}
-        for key in keys:
-            vals = self.rollout_data.get(key, None)
-            if vals is None:
-                batch[key] = None
-            else:
-                if self.micro_batch_indices is not None:
-                    indices = self.micro_batch_indices[self.offset]
-                    batch[key] = [vals[i] for i in indices]
-                else:
-                    assert self.offset + self.micro_batch_size <= len(
-                        vals
-                    ), f"offset: {self.offset}, micro_batch_size: {self.micro_batch_size}, len(vals): {len(vals)}"
-                    batch[key] = vals[self.offset : self.offset + self.micro_batch_size]
-
-        if self.micro_batch_indices is not None:
-            self.offset += 1
-        else:
-            self.offset += self.micro_batch_size
-        return batch
-
-    def reset(self) -> "DataIterator":
-        """Reset internal offset to the start and return self."""
-        self.offset = 0
-        return self
-
-
 def get_data_iterator(
     args: Namespace,
     model: Union[torch.nn.Module, Sequence[torch.nn.Module]],
@@ -244,7 +172,16 @@ def get_data_iterator(
     def _generate_data_iterator(rollout_data, micro_batch_size, micro_batch_indices=None):
         data_iterator = []
         for _ in range(vpp_size):
-            data_iterator.append(DataIterator(rollout_data, micro_batch_size, micro_batch_indices))
+            data_iterator.append(
+                DataIterator(
+                    rollout_data,
+                    micro_batch_size,
+                    micro_batch_indices,
+                    prefetch_depth=args.data_prefetch_depth,
+                    cp_rank=mpu.get_context_parallel_rank(),
+                    cp_size=cp_size,
+                )
+            )
         return data_iterator
 
     if not args.use_dynamic_batch_size:
@@ -255,11 +192,16 @@ def get_data_iterator(
         # calculate the number of mirobatches for each step
         samples = rollout_data["total_lengths"]
         assert len(samples) == num_local_samples
+        costs = get_micro_batch_costs(args, samples)
         num_microbatches = []
         for i in range(num_steps_per_rollout):
             start, end = i * num_local_gbs, (i + 1) * num_local_gbs
             num_microbatches.append(
-                get_minimum_num_micro_batch_size(samples[start:end], args.max_tokens_per_gpu * cp_size)
+                get_num_micro_batches(
+                    samples[start:end],
+                    args.max_tokens_per_gpu * cp_size,
+                    costs[start:end] if costs is not None else None,
+                )
             )
 
         num_microbatches = torch.tensor(num_microbatches, dtype=torch.int, device=torch.cuda.current_device())
@@ -281,7 +223,7 @@ def get_data_iterator(
         for i, num_mbs in enumerate(num_microbatches):
             start, end = i * num_local_gbs, (i + 1) * num_local_gbs
             samples = rollout_data["total_lengths"][start:end]
-            partitions = get_seqlen_balanced_partitions(samples, num_mbs, equal_size=False)
+            partitions = plan_micro_batches(samples, num_mbs, costs[start:end] if costs is not None else None)
             for j in range(num_mbs):
                 for k in range(len(partitions[j])):
                     partitions[j][k] += start
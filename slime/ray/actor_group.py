@@ -118,6 +118,10 @@ class RayTrainGroup:
         """Do one rollout training"""
         return [actor.train.remote(rollout_id, rollout_data_ref) for actor in self._actor_handlers]
 
+    def get_dp_size(self):
+        """Get the data parallel size of the group."""
+        return ray.get(self._actor_handlers[0].get_dp_size.remote())
+
     def save_model(self, step_id):
         """Save actor model on rank 0."""
         return ray.get([actor.save_model.remote(step_id) for actor in self._actor_handlers])
@@ -153,8 +153,10 @@ def create_training_models(args, pgs, rollout_manager, wandb_run_id):
         actor_model.connect(critic_model)
 
     actor_model.set_rollout_manager(rollout_manager)
-    if args.rollout_global_dataset:
-        ray.get(rollout_manager.load.remote(args.start_rollout_id - 1))
+    dp_sizes = [actor_model.get_dp_size()] + ([critic_model.get_dp_size()] if args.use_critic else [])
+    ray.get(rollout_manager.set_train_dp_sizes.remote(dp_sizes))
+    # the data source only loads the dataset state with the global dataset, but always the buffer.
+    ray.get(rollout_manager.load.remote(args.start_rollout_id - 1))
 
     return actor_model, critic_model
 
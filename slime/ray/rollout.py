@@ -13,12 +13,14 @@ from ray.util.scheduling_strategies import PlacementGroupSchedulingStrategy
 from slime.backends.sglang_utils.sglang_engine import SGLangEngine
 from slime.ray.rollout_data_source import RolloutDataSourceWithBuffer
 from slime.rollout.base_types import call_rollout_fn
+from slime.utils.data import partition_rollout_data
 from slime.utils.health_monitor import RolloutHealthMonitor
 from slime.utils.http_utils import find_available_port, get_host_info, init_http_client
 from slime.utils.iter_utils import group_by
 from slime.utils.metric_checker import MetricChecker
 from slime.utils.metric_utils import compute_pass_rate, compute_statistics, dict_add_prefix
 from slime.utils.misc import load_function
+from slime.utils.packed_sequences import pack_rollout_data
 from slime.utils.ray_utils import Box
 from slime.utils.types import Sample
 from slime.utils.wandb_utils import init_wandb_secondary
@@ -63,6 +65,9 @@ class RolloutManager:
         self.nodes_per_engine = max(1, args.rollout_num_gpus_per_engine // args.num_gpus_per_node)
         self.rollout_engine_lock = Lock.options(num_cpus=1, num_gpus=0).remote()
 
+        # the data parallel sizes of the actor and critic, set after they are initialized.
+        self.train_dp_sizes = []
+
         self._metric_checker = MetricChecker.maybe_create(args)
         if self.args.use_fault_tolerance:
             self._health_monitor = RolloutHealthMonitor(self, args)
@@ -80,6 +85,10 @@ class RolloutManager:
     def get_rollout_engines_and_lock(self):
         return self.rollout_engines, self.rollout_engine_lock, self.num_new_engines
 
+    def set_train_dp_sizes(self, dp_sizes: List[int]):
+        """Set the data parallel sizes of the train models, the rollout data will be partitioned for each of them."""
+        self.train_dp_sizes = sorted(set(dp_sizes))
+
     def get_num_rollout_per_epoch(self):
         assert self.args.rollout_global_dataset
         return len(self.data_source.dataset) // self.args.rollout_batch_size
@@ -92,7 +101,15 @@ class RolloutManager:
             self._save_debug_rollout_data(data, rollout_id=rollout_id, evaluation=False)
             _log_rollout_data(rollout_id, self.args, data, metrics, time.time() - start_time)
             data = self._convert_samples_to_train_data(data)
-            return Box(ray.put(data))
+            if not self.train_dp_sizes:
+                return Box(ray.put(data))
+            # put one object per dp rank, so that each train rank only fetches its own partition.
+            return Box(
+                {
+                    dp_size: [ray.put(partition) for partition in partition_rollout_data(self.args, data, dp_size)]
+                    for dp_size in self.train_dp_sizes
+                }
+            )
         finally:
             if monitor_started:
                 self._health_monitor.stop()
@@ -141,6 +158,7 @@ class RolloutManager:
                 )
             metrics = None
         else:
+            self.data_source.set_rollout_id(rollout_id)
             data = call_rollout_fn(self.generate_rollout, self.args, rollout_id, self.data_source, evaluation=False)
             metrics = data.metrics
             data = data.samples
@@ -210,6 +228,8 @@ class RolloutManager:
         assert len(raw_rewards) == len(samples)
         assert len(rewards) == len(samples)
 
+        self.data_source.update_prompt_stats(samples, raw_rewards)
+
         train_data = {
             "tokens": [sample.tokens for sample in samples],
             "response_lengths": [sample.response_length for sample in samples],
@@ -222,7 +242,6 @@ class RolloutManager:
         }
 
         # loss mask
-        # TODO: compress the loss mask
         loss_masks = []
         for sample in samples:
             # always instantiate loss_mask if not provided
@@ -249,7 +268,8 @@ class RolloutManager:
         if samples[0].train_metadata is not None:
             train_data["metadata"] = [sample.train_metadata for sample in samples]
 
-        return train_data
+        # pack the per-token fields into flat arrays, which are much cheaper to put into the object store.
+        return pack_rollout_data(train_data)
 
 
 def init_rollout_engines(args, pg, all_rollout_engines):
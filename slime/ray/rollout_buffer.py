@@ -0,0 +1,137 @@
+import heapq
+import os
+import pickle
+import tempfile
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from slime.utils.types import Sample
+
+__all__ = ["RolloutBuffer"]
+
+
+class RolloutBuffer:
+    """The groups of samples waiting to be consumed by the next rollouts, e.g. partial or surplus groups.
+
+    Groups are popped in the order of `--buffer-policy`:
+    - `fifo`: the oldest first.
+    - `reward_variance`: the largest variance of the rewards first, i.e. the most informative groups for
+      group-normalized advantages. Groups without rewards (e.g. partial ones) have a zero priority.
+
+    Groups generated more than `--buffer-max-staleness` rollouts before the current one (see the
+    `start_rollout_id` tag in the sample metadata) are evicted. Beyond `--buffer-max-groups-in-memory`,
+    the new groups are pickled to `--buffer-spill-dir` and loaded back when popped.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.policy = args.buffer_policy
+        self.max_staleness = args.buffer_max_staleness
+        self.max_groups_in_memory = args.buffer_max_groups_in_memory
+        self.spill_dir = args.buffer_spill_dir
+
+        self._fifo = deque()
+        self._heap = []
+        # seq -> the rollout that started generating the group, the groups popped or evicted are removed,
+        # and lazily skipped in the queues.
+        self._start_rollout_ids: dict[int, Optional[int]] = {}
+        self._groups: dict[int, list[Sample]] = {}
+        self._spilled: dict[int, str] = {}
+        self._next_seq = 0
+        self.num_evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._start_rollout_ids)
+
+    def _priority(self, group: list[Sample]) -> float:
+        if self.policy == "fifo" or any(sample.reward is None for sample in group):
+            return 0.0
+        return float(np.var([sample.get_reward_value(self.args) for sample in group]))
+
+    @staticmethod
+    def _start_rollout_id(group: list[Sample]) -> Optional[int]:
+        start_rollout_ids = [
+            sample.metadata["start_rollout_id"] for sample in group if "start_rollout_id" in sample.metadata
+        ]
+        return min(start_rollout_ids) if start_rollout_ids else None
+
+    def push(self, group: list[Sample]) -> None:
+        seq = self._next_seq
+        self._next_seq += 1
+        self._start_rollout_ids[seq] = self._start_rollout_id(group)
+        if self.policy == "fifo":
+            self._fifo.append(seq)
+        else:
+            heapq.heappush(self._heap, (-self._priority(group), seq))
+
+        if self.max_groups_in_memory is not None and len(self._groups) >= self.max_groups_in_memory:
+            self._spill(seq, group)
+        else:
+            self._groups[seq] = group
+
+    def _spill(self, seq: int, group: list[Sample]) -> None:
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="slime_rollout_buffer_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"group_{seq}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump(group, f)
+        self._spilled[seq] = path
+
+    def _take(self, seq: int) -> list[Sample]:
+        del self._start_rollout_ids[seq]
+        if seq in self._groups:
+            return self._groups.pop(seq)
+        path = self._spilled.pop(seq)
+        with open(path, "rb") as f:
+            group = pickle.load(f)
+        os.remove(path)
+        return group
+
+    def _pop_seq(self) -> int:
+        while True:
+            seq = self._fifo.popleft() if self.policy == "fifo" else heapq.heappop(self._heap)[1]
+            if seq in self._start_rollout_ids:
+                return seq
+
+    def _is_stale(self, seq: int, rollout_id: Optional[int]) -> bool:
+        start_rollout_id = self._start_rollout_ids[seq]
+        if self.max_staleness is None or rollout_id is None or start_rollout_id is None:
+            return False
+        return rollout_id - start_rollout_id > self.max_staleness
+
+    def pop(self, num_groups: int, rollout_id: Optional[int] = None) -> list[list[Sample]]:
+        """Pop up to `num_groups` groups for the rollout `rollout_id`, skipping the stale ones."""
+        groups = []
+        while len(groups) < num_groups and len(self) > 0:
+            seq = self._pop_seq()
+            if self._is_stale(seq, rollout_id):
+                self._take(seq)
+                self.num_evicted += 1
+                continue
+            groups.append(self._take(seq))
+        return groups
+
+    def evict_stale(self, rollout_id: int) -> int:
+        """Drop all the groups too stale for the rollout `rollout_id`, return the number of dropped groups."""
+        stale = [seq for seq in self._start_rollout_ids if self._is_stale(seq, rollout_id)]
+        for seq in stale:
+            self._take(seq)
+        self.num_evicted += len(stale)
+        return len(stale)
+
+    def state_dict(self) -> dict:
+        # in the order of the sequence numbers, the priorities are recomputed when loading.
+        return {"groups": [self._peek(seq) for seq in sorted(self._start_rollout_ids)]}
+
+    def _peek(self, seq: int) -> list[Sample]:
+        if seq in self._groups:
+            return self._groups[seq]
+        with open(self._spilled[seq], "rb") as f:
+            return pickle.load(f)
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        for group in state_dict["groups"]:
+            self.push(group)
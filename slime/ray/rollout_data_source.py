@@ -1,4 +1,3 @@
-import copy
 import os
 from pathlib import Path
 
@@ -7,8 +6,11 @@ from transformers import AutoTokenizer
 
 from slime.utils.data import Dataset
 from slime.utils.misc import load_function
+from slime.utils.prompt_stats import PromptStatsStore
 from slime.utils.types import Sample
 
+from .rollout_buffer import RolloutBuffer
+
 
 # TODO may further refactor data-loading part later
 class RolloutDataSource:
@@ -40,42 +42,65 @@ class RolloutDataSource:
                 apply_chat_template=args.apply_chat_template,
                 apply_chat_template_kwargs=args.apply_chat_template_kwargs,
                 seed=args.rollout_seed,
+                cache_dir=args.prompt_cache_dir,
+                num_workers=args.prompt_data_num_workers,
             )
             if self.args.rollout_shuffle:
                 self.dataset.shuffle(self.epoch_id)
+            self.prompt_stats = PromptStatsStore(len(self.dataset))
         else:
             self.dataset = None
+            self.prompt_stats = None
 
     def get_samples(self, num_samples):
         # TODO further improve code
         if self.dataset is not None:
             if self.sample_offset + num_samples <= len(self.dataset):
-                prompt_samples = self.dataset.samples[self.sample_offset : self.sample_offset + num_samples]
+                samples = self._make_groups(range(self.sample_offset, self.sample_offset + num_samples))
                 self.sample_offset += num_samples
             else:
-                prompt_samples = self.dataset.samples[self.sample_offset :]
-                num_samples -= len(prompt_samples)
+                samples = self._make_groups(range(self.sample_offset, len(self.dataset)))
+                num_samples -= len(samples)
                 self.epoch_id += 1
                 if self.args.rollout_shuffle:
                     self.dataset.shuffle(self.epoch_id)
-                prompt_samples += self.dataset.samples[:num_samples]
+                samples += self._make_groups(range(num_samples))
                 self.sample_offset = num_samples
         else:
-            prompt_samples = [Sample() for _ in range(num_samples)]
+            samples = []
+            for _ in range(num_samples):
+                group = [Sample() for _ in range(self.args.n_samples_per_prompt)]
+                self._assign_indices(group)
+                samples.append(group)
+        return samples
 
+    def _make_groups(self, prompt_indices):
         samples = []
-        for prompt_sample in prompt_samples:
-            group = []
-            for _ in range(self.args.n_samples_per_prompt):
-                sample = copy.deepcopy(prompt_sample)
-                sample.group_index = self.sample_group_index
-                sample.index = self.sample_index
-                self.sample_index += 1
-                group.append(sample)
-            self.sample_group_index += 1
+        for idx in prompt_indices:
+            group = self.dataset.make_samples(idx, self.args.n_samples_per_prompt)
+            self._assign_indices(group)
             samples.append(group)
         return samples
 
+    def _assign_indices(self, group):
+        for sample in group:
+            sample.group_index = self.sample_group_index
+            sample.index = self.sample_index
+            self.sample_index += 1
+        self.sample_group_index += 1
+
+    def update_prompt_stats(self, samples: list[Sample], rewards: list[float]):
+        """Record the outcome of the samples of a rollout in `prompt_stats`."""
+        if self.prompt_stats is None:
+            return
+        indices = [i for i, sample in enumerate(samples) if sample.prompt_index is not None]
+        self.prompt_stats.update(
+            prompt_indices=[samples[i].prompt_index for i in indices],
+            rewards=[rewards[i] for i in indices],
+            response_lengths=[samples[i].response_length for i in indices],
+            truncated=[samples[i].status == Sample.Status.TRUNCATED for i in indices],
+        )
+
     def add_samples(self, samples: list[list[Sample]]):
         raise RuntimeError(f"Cannot add samples to {self.__class__.__name__}. This is a read-only data source.")
 
@@ -89,6 +114,7 @@ class RolloutDataSource:
             "sample_group_index": self.sample_group_index,
             "sample_index": self.sample_index,
             "metadata": self.metadata,
+            "prompt_stats": self.prompt_stats.state_dict(),
         }
         path = os.path.join(self.args.save, f"rollout/global_dataset_state_dict_{rollout_id}.pt")
         os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -114,6 +140,8 @@ class RolloutDataSource:
         self.sample_group_index = state_dict.get("sample_group_index", 0)
         self.sample_index = state_dict.get("sample_index", 0)
         self.metadata = state_dict.get("metadata", {})
+        if "prompt_stats" in state_dict:
+            self.prompt_stats.load_state_dict(state_dict["prompt_stats"])
 
         if self.args.rollout_global_dataset and self.args.rollout_shuffle:
             self.dataset.shuffle(self.epoch_id)
@@ -122,12 +150,21 @@ class RolloutDataSource:
 class RolloutDataSourceWithBuffer(RolloutDataSource):
     def __init__(self, args):
         super().__init__(args)
-        self.buffer = []
+        # the rollout being generated, set by the rollout manager
+        self.rollout_id = None
         if self.args.buffer_filter_path is None:
-            self.buffer_filter = pop_first
+            self.buffer = RolloutBuffer(args)
+            self.buffer_filter = None
         else:
+            # custom filters select from a plain list of groups
+            self.buffer = []
             self.buffer_filter = load_function(self.args.buffer_filter_path)
 
+    def set_rollout_id(self, rollout_id: int):
+        self.rollout_id = rollout_id
+        if isinstance(self.buffer, RolloutBuffer) and (num_evicted := self.buffer.evict_stale(rollout_id)):
+            print(f"Evicted {num_evicted} stale groups from the rollout buffer, {len(self.buffer)} groups left.")
+
     def get_samples(self, num_samples: int) -> list[list[Sample]]:
         """
         Return num_samples samples
@@ -146,8 +183,9 @@ class RolloutDataSourceWithBuffer(RolloutDataSource):
         if len(self.buffer) == 0 or num_samples == 0:
             return []
 
-        samples = self.buffer_filter(self.args, None, self.buffer, num_samples)
-        return samples
+        if self.buffer_filter is None:
+            return self.buffer.pop(num_samples, self.rollout_id)
+        return self.buffer_filter(self.args, self.rollout_id, self.buffer, num_samples)
 
     def add_samples(self, samples: list[list[Sample]]):
         """
@@ -162,7 +200,38 @@ class RolloutDataSourceWithBuffer(RolloutDataSource):
                 len(samples[i]) == self.args.n_samples_per_prompt
             ), f"the length of the elements of samples must be equal to n_samples_per_prompt, got {len(samples[i])} != {self.args.n_samples_per_prompt}"
             group = samples[i]  # type: ignore
-            self.buffer.append(group)
+            if isinstance(self.buffer, RolloutBuffer):
+                self.buffer.push(group)
+            else:
+                self.buffer.append(group)
+
+    def save(self, rollout_id):
+        super().save(rollout_id)
+        if len(self.buffer) == 0:
+            return
+
+        # the samples are arbitrary python objects, so they are saved apart from the `weights_only` state dict.
+        groups = self.buffer.state_dict()["groups"] if isinstance(self.buffer, RolloutBuffer) else self.buffer
+        path = os.path.join(self.args.save, f"rollout/buffer_{rollout_id}.pt")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        torch.save({"groups": [[sample.to_dict() for sample in group] for group in groups]}, path)
+
+    def load(self, rollout_id=None):
+        super().load(rollout_id)
+        if self.args.load is None:
+            return
+
+        path = os.path.join(self.args.load, f"rollout/buffer_{rollout_id}.pt")
+        if not os.path.exists(path):
+            return
+
+        groups = torch.load(path, weights_only=False)["groups"]
+        groups = [[Sample.from_dict(sample) for sample in group] for group in groups]
+        print(f"load {len(groups)} buffered groups from {path}")
+        if isinstance(self.buffer, RolloutBuffer):
+            self.buffer.load_state_dict({"groups": groups})
+        else:
+            self.buffer.extend(groups)
 
     # TODO remove
     def update_metadata(self, metadata: dict):
@@ -177,6 +246,7 @@ class RolloutDataSourceWithBuffer(RolloutDataSource):
 
 
 def pop_first(args, rollout_id, buffer: list[list[Sample]], num_samples: int) -> list[list[Sample]]:
+    """The FIFO filter for a plain list buffer, same as the default `fifo` policy of `RolloutBuffer`."""
     num_to_pop = min(len(buffer), num_samples)
     samples = buffer[:num_to_pop]
     del buffer[:num_to_pop]
@@ -99,6 +99,10 @@ class TrainRayActor(RayActor):
     def train(self, rollout_id, rollout_data_ref):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_dp_size(self):
+        raise NotImplementedError
+
     @abc.abstractmethod
     def save_model(self, iteration):
         raise NotImplementedError
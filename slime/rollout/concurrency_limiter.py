@@ -0,0 +1,219 @@
+import asyncio
+import math
+import time
+from argparse import Namespace
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from slime.utils.misc import load_function
+
+__all__ = [
+    "ConcurrencyLimiter",
+    "StaticLimiter",
+    "AIMDLimiter",
+    "GradientLimiter",
+    "create_concurrency_limiter",
+]
+
+
+class ConcurrencyLimiter:
+    """Bound the number of in-flight generation requests, with a limit that a subclass may adapt.
+
+    Requests acquire a weight (e.g. the number of samples sent in the request) and report back the
+    latency per generated token and whether they were dropped (aborted or failed) when they release it.
+    A request heavier than the limit is let through alone, so that it cannot deadlock.
+    """
+
+    def __init__(self, limit: float, min_limit: float = 1, max_limit: Optional[float] = None) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit if max_limit is not None else limit
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        self.in_flight = 0
+        self.num_waiting = 0
+        self._condition = asyncio.Condition()
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._num_requests = 0
+        self._num_drops = 0
+        self._wait_time = 0.0
+        self._max_in_flight = 0
+        self._limits = []
+
+    async def acquire(self, weight: int = 1) -> None:
+        start = time.monotonic()
+        async with self._condition:
+            self.num_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + weight <= self.limit)
+            finally:
+                self.num_waiting -= 1
+            self.in_flight += weight
+        self._wait_time += time.monotonic() - start
+        self._max_in_flight = max(self._max_in_flight, self.in_flight)
+
+    async def release(self, weight: int = 1, latency: Optional[float] = None, dropped: bool = False) -> None:
+        """Release `weight` and update the limit.
+
+        Args:
+            latency: Seconds per generated token of the request, None if unknown.
+            dropped: Whether the request was aborted by the engine or failed.
+        """
+        async with self._condition:
+            self.in_flight -= weight
+            self._num_requests += 1
+            self._num_drops += int(dropped)
+            self.update(latency=latency, dropped=dropped)
+            self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+            self._limits.append(self.limit)
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1):
+        """Hold `weight` for the duration of the block.
+
+        The block can call `report(latency=..., dropped=...)` on the yielded object to feed the policy.
+        """
+        await self.acquire(weight)
+        report = _Report()
+        try:
+            yield report
+        except BaseException:
+            report.dropped = True
+            raise
+        finally:
+            await self.release(weight, latency=report.latency, dropped=report.dropped)
+
+    def update(self, latency: Optional[float], dropped: bool) -> None:
+        """Adapt `self.limit` after a request, called with the lock held."""
+
+    def collect_metrics(self) -> dict[str, float]:
+        """Return the metrics since the last call, to be logged with the rollout."""
+        metrics = {
+            "perf/concurrency_limit": self.limit,
+            "perf/concurrency_max_in_flight": self._max_in_flight,
+            "perf/concurrency_wait_time": self._wait_time,
+            "perf/concurrency_drop_rate": self._num_drops / max(self._num_requests, 1),
+        }
+        if self._limits:
+            metrics["perf/concurrency_limit_mean"] = sum(self._limits) / len(self._limits)
+        self._reset_metrics()
+        return metrics
+
+
+class _Report:
+    __slots__ = ("latency", "dropped")
+
+    def __init__(self) -> None:
+        self.latency = None
+        self.dropped = False
+
+    def __call__(self, latency: Optional[float] = None, dropped: bool = False) -> None:
+        self.latency = latency
+        self.dropped = dropped
+
+
+class StaticLimiter(ConcurrencyLimiter):
+    """A fixed limit, same as a semaphore."""
+
+
+class AIMDLimiter(ConcurrencyLimiter):
+    """Additive increase, multiplicative decrease.
+
+    The limit shrinks by `backoff` when a request is dropped or when its latency per token exceeds
+    `latency_tolerance` times the best latency seen so far, and grows by one request per limit's worth
+    of successful requests while requests are waiting for the limit.
+    """
+
+    def __init__(
+        self,
+        limit: float,
+        min_limit: float = 1,
+        max_limit: Optional[float] = None,
+        backoff: float = 0.9,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        super().__init__(limit, min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.min_latency = None
+
+    def update(self, latency: Optional[float], dropped: bool) -> None:
+        if latency is not None:
+            self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+        slow = latency is not None and latency > self.latency_tolerance * self.min_latency
+        if dropped or slow:
+            self.limit *= self.backoff
+        elif self.num_waiting > 0:
+            self.limit += 1 / self.limit
+
+
+class GradientLimiter(ConcurrencyLimiter):
+    """Scale the limit by the ratio of the no-load latency per token to the recent latency per token.
+
+    The no-load latency is the lowest latency seen, slowly drifting upwards so that it follows changes
+    of the workload, and the recent latency is a short moving average. The limit shrinks proportionally
+    once the recent latency exceeds `tolerance` times the no-load one, and `sqrt(limit)` extra requests
+    are allowed while requests are waiting for the limit, so that the limit keeps probing upwards when
+    the latency is stable. Drops count as a halved gradient.
+    """
+
+    def __init__(
+        self,
+        limit: float,
+        min_limit: float = 1,
+        max_limit: Optional[float] = None,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        short_window: int = 10,
+        drift: float = 1e-3,
+    ) -> None:
+        super().__init__(limit, min_limit, max_limit)
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.short_alpha = 2 / (short_window + 1)
+        self.drift = drift
+        self.no_load_latency = None
+        self.short_latency = None
+
+    def update(self, latency: Optional[float], dropped: bool) -> None:
+        if latency is not None:
+            if self.no_load_latency is None:
+                self.no_load_latency = self.short_latency = latency
+            self.no_load_latency = min(self.no_load_latency * (1 + self.drift), latency)
+            self.short_latency += self.short_alpha * (latency - self.short_latency)
+        if dropped:
+            gradient = 0.5
+        elif self.short_latency:
+            gradient = max(0.5, min(1.0, self.tolerance * self.no_load_latency / self.short_latency))
+        else:
+            return
+        new_limit = self.limit * gradient + (math.sqrt(self.limit) if self.num_waiting > 0 else 0)
+        # one full smoothing step per limit's worth of completed requests.
+        smoothing = self.smoothing / self.limit
+        self.limit = (1 - smoothing) * self.limit + smoothing * new_limit
+
+
+CONCURRENCY_LIMITERS = {
+    "static": StaticLimiter,
+    "aimd": AIMDLimiter,
+    "gradient": GradientLimiter,
+}
+
+
+def create_concurrency_limiter(args: Namespace) -> ConcurrencyLimiter:
+    """Create the limiter of `--rollout-concurrency-limiter`, a builtin name or the path of a `ConcurrencyLimiter` class.
+
+    The limits are given per engine in the arguments. Requests are load-balanced over the engines by the
+    router, so the limiter bounds the total number of in-flight requests. The limit starts from
+    `--sglang-server-concurrency`, and adapts between `--rollout-min-concurrency` and `--rollout-max-concurrency`.
+    """
+    num_engines = args.rollout_num_gpus // args.rollout_num_gpus_per_engine
+    name = args.rollout_concurrency_limiter
+    limiter_cls = CONCURRENCY_LIMITERS[name] if name in CONCURRENCY_LIMITERS else load_function(name)
+    max_concurrency = args.rollout_max_concurrency or args.sglang_server_concurrency
+    return limiter_cls(
+        limit=args.sglang_server_concurrency * num_engines,
+        min_limit=args.rollout_min_concurrency * num_engines,
+        max_limit=max_concurrency * num_engines,
+    )
@@ -1,8 +1,30 @@
 from dataclasses import dataclass
 from typing import Optional
 
+from slime.utils.types import Sample
+
 
 @dataclass
 class DynamicFilterOutput:
     keep: bool
     reason: Optional[str] = None
+
+
+class StreamingDynamicFilter:
+    """A dynamic sampling filter that can also judge a group before all its samples are finished.
+
+    `__call__` is the usual filter on the whole group. `on_partial_group` is called by the rollout
+    each time a sample of the group finishes, and when it does not keep the group, the requests of
+    the remaining samples are aborted and the group is dropped. Point `--dynamic-sampling-filter-path`
+    to an instance of a subclass to enable it.
+    """
+
+    def __call__(self, args, samples: list[Sample], **kwargs) -> DynamicFilterOutput:
+        raise NotImplementedError
+
+    def on_partial_group(self, args, samples: list[Sample], group_size: int, **kwargs) -> DynamicFilterOutput:
+        """Judge a group from its finished samples, `group_size` is the total number of samples of the group.
+
+        `kwargs` contains `prompt_stats`, the `PromptStatsStore` of the data source if available.
+        """
+        return DynamicFilterOutput(keep=True)
@@ -1,9 +1,9 @@
 import torch
 
-from slime.rollout.filter_hub.base_types import DynamicFilterOutput
+from slime.rollout.filter_hub.base_types import DynamicFilterOutput, StreamingDynamicFilter
 from slime.utils.types import Sample
 
-__all__ = ["check_reward_nonzero_std"]
+__all__ = ["check_reward_nonzero_std", "check_reward_nonzero_std_streaming"]
 
 
 def check_reward_nonzero_std(args, samples: list[Sample], **kwargs):
@@ -13,3 +13,36 @@ def check_reward_nonzero_std(args, samples: list[Sample], **kwargs):
         keep=keep,
         reason=None if keep else f"zero_std_{round(rewards[0], 1)}",
     )
+
+
+class RewardNonzeroStdStreamingFilter(StreamingDynamicFilter):
+    """`check_reward_nonzero_std`, which also gives up a group early.
+
+    A group is cancelled when its first `min_finished_ratio` finished samples all got the same reward,
+    and all the past groups of the prompt (at least `min_history` of them) had a zero std with the same mean reward,
+    i.e. the prompt is always solved or never solved.
+    """
+
+    def __init__(self, min_finished_ratio: float = 0.5, min_history: int = 2):
+        self.min_finished_ratio = min_finished_ratio
+        self.min_history = min_history
+
+    def __call__(self, args, samples: list[Sample], **kwargs):
+        return check_reward_nonzero_std(args, samples, **kwargs)
+
+    def on_partial_group(self, args, samples: list[Sample], group_size: int, prompt_stats=None, **kwargs):
+        prompt_index = samples[0].prompt_index
+        if prompt_stats is None or prompt_index is None or len(samples) < self.min_finished_ratio * group_size:
+            return DynamicFilterOutput(keep=True)
+
+        rewards = [sample.get_reward_value(args) for sample in samples]
+        if any(reward != rewards[0] for reward in rewards):
+            return DynamicFilterOutput(keep=True)
+        if not prompt_stats.is_saturated(prompt_index, min_groups=self.min_history):
+            return DynamicFilterOutput(keep=True)
+        if abs(prompt_stats.reward_mean[prompt_index].item() - rewards[0]) > 1e-6:
+            return DynamicFilterOutput(keep=True)
+        return DynamicFilterOutput(keep=False, reason=f"early_zero_std_{round(rewards[0], 1)}")
+
+
+check_reward_nonzero_std_streaming = RewardNonzeroStdStreamingFilter()
@@ -1,8 +1,7 @@
 import asyncio
 from typing import Union
 
-import aiohttp
-
+from slime.utils.http_utils import get_request_batcher, service_post
 from slime.utils.misc import load_function
 from slime.utils.types import Sample
 
@@ -20,11 +19,10 @@ async def remote_rm(args, sample: Sample):
         "response": sample.response,
         "label": sample.label,
     }
-    session_kwargs = {}
-    async with aiohttp.ClientSession(**session_kwargs) as session:
-        async with session.post(args.rm_url, json=payload) as resp:
-            resp.raise_for_status()
-            return await resp.json()
+    if args.rm_batch_size > 1:
+        batcher = get_request_batcher(args, args.rm_url, args.rm_batch_size, args.rm_batch_wait)
+        return await batcher.submit(payload)
+    return await service_post(args, args.rm_url, payload)
 
 
 async def async_rm(args, sample: Sample, **kwargs):
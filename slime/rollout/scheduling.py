@@ -0,0 +1,84 @@
+from typing import Optional
+
+from slime.utils.prompt_stats import PromptStatsStore
+from slime.utils.types import Sample
+
+__all__ = ["ResponseLengthPredictor", "sort_groups_by_predicted_length"]
+
+
+class ResponseLengthPredictor:
+    """Predict the response length of a group of samples before generating it.
+
+    Prompts seen in a previous epoch are predicted with the moving average of their past response lengths,
+    or with the statistics of `prompt_stats` (e.g. restored from a checkpoint).
+    Other prompts fall back to a least squares fit of the response length on the prompt length in characters,
+    updated online from all the finished groups.
+    """
+
+    def __init__(self, momentum: float = 0.5, prompt_stats: Optional[PromptStatsStore] = None) -> None:
+        self.momentum = momentum
+        self.prompt_stats = prompt_stats
+        self.history: dict[int, float] = {}
+        # sufficient statistics of the linear regression
+        self._n = 0
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+        self._sum_xx = 0.0
+        self._sum_xy = 0.0
+
+    @staticmethod
+    def _key(group: list[Sample]) -> int:
+        if group[0].prompt_index is not None:
+            return group[0].prompt_index
+        return hash(str(group[0].prompt))
+
+    @staticmethod
+    def _prompt_length(group: list[Sample]) -> int:
+        # in characters, the groups are predicted before their prompts are tokenized.
+        return len(str(group[0].prompt))
+
+    def predict(self, group: list[Sample]) -> Optional[float]:
+        """Return the predicted mean response length of the group, None if nothing has been observed yet."""
+        if (length := self.history.get(self._key(group))) is not None:
+            return length
+        prompt_index = group[0].prompt_index
+        if self.prompt_stats is not None and prompt_index is not None and self.prompt_stats.num_groups[prompt_index]:
+            return self.prompt_stats.response_length_mean[prompt_index].item()
+        if self._n == 0:
+            return None
+        x = self._prompt_length(group)
+        mean_x, mean_y = self._sum_x / self._n, self._sum_y / self._n
+        var_x = self._sum_xx / self._n - mean_x**2
+        if var_x <= 0:
+            return mean_y
+        slope = (self._sum_xy / self._n - mean_x * mean_y) / var_x
+        return max(0.0, mean_y + slope * (x - mean_x))
+
+    def update(self, group: list[Sample]) -> None:
+        """Record the response lengths of a finished group."""
+        length = sum(sample.response_length for sample in group) / len(group)
+        key = self._key(group)
+        if key in self.history:
+            self.history[key] = self.momentum * self.history[key] + (1 - self.momentum) * length
+        else:
+            self.history[key] = length
+
+        x = self._prompt_length(group)
+        self._n += 1
+        self._sum_x += x
+        self._sum_y += length
+        self._sum_xx += x * x
+        self._sum_xy += x * length
+
+
+def sort_groups_by_predicted_length(
+    predictor: ResponseLengthPredictor, groups: list[list[Sample]]
+) -> list[list[Sample]]:
+    """Order the groups longest predicted first, so that long groups do not start last and form the tail.
+
+    The engines are fed by the least loaded routing of the router, so this is the longest-processing-time-first
+    heuristic for balancing them. Groups without a prediction keep their order and go first.
+    """
+    predictions = [predictor.predict(group) for group in groups]
+    order = sorted(range(len(groups)), key=lambda i: (predictions[i] is not None, -(predictions[i] or 0), i))
+    return [groups[i] for i in order]
@@ -1,26 +1,32 @@
 import asyncio
 import base64
-import copy
 import io
+import time
+import uuid
 from argparse import Namespace
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable, Optional, Union
 
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
 from transformers import AutoTokenizer
 
 from slime.rollout.base_types import RolloutFnEvalOutput, RolloutFnTrainOutput
-from slime.rollout.filter_hub.base_types import DynamicFilterOutput
+from slime.rollout.filter_hub.base_types import DynamicFilterOutput, StreamingDynamicFilter
 from slime.utils.async_utils import run
 from slime.utils.data import Dataset
 from slime.utils.eval_config import EvalDatasetConfig
 from slime.utils.http_utils import get, post
 from slime.utils.mask_utils import get_response_lengths
 from slime.utils.misc import SingletonMeta, load_function
+from slime.utils.prompt_stats import PromptStatsStore
 from slime.utils.types import Sample
 
+from .concurrency_limiter import create_concurrency_limiter
 from .rm_hub import async_rm, batched_async_rm
+from .scheduling import ResponseLengthPredictor, sort_groups_by_predicted_length
 
 __all__ = ["generate_rollout"]
 
@@ -35,6 +41,10 @@ def _load_and_encode_image(path: str) -> str:
         return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
 
+# the number of `/abort_request` sent at the same time for the groups dropped by the streaming dynamic filter.
+_MAX_CONCURRENT_ABORTS = 64
+
+
 class GenerateState(metaclass=SingletonMeta):
     """
     The global state for the generation process.
@@ -44,8 +54,22 @@ class GenerateState(metaclass=SingletonMeta):
         # persistant state for the generation process
         self.args = args
         self.tokenizer = AutoTokenizer.from_pretrained(args.hf_checkpoint, trust_remote_code=True)
-        self.semaphore = asyncio.Semaphore(
-            args.sglang_server_concurrency * args.rollout_num_gpus // args.rollout_num_gpus_per_engine
+        # tokenize off the event loop, the fast tokenizers release the GIL.
+        # the semaphore bounds the number of texts waiting for the executor.
+        self.tokenizer_executor = ThreadPoolExecutor(
+            max_workers=args.rollout_tokenizer_workers, thread_name_prefix="rollout-tokenizer"
+        )
+        self.tokenizer_semaphore = asyncio.Semaphore(2 * args.rollout_tokenizer_workers)
+        # bounds the aborts of the groups dropped by the streaming dynamic filter, not to compete with the generation.
+        self.abort_semaphore = asyncio.Semaphore(_MAX_CONCURRENT_ABORTS)
+        self.limiter = create_concurrency_limiter(args)
+        # kept across rollouts, to predict the response lengths from the previous epochs.
+        self.length_predictor = ResponseLengthPredictor()
+        # the per-prompt statistics of the data source, if any, the groups dropped by the dynamic filter are
+        # recorded in it by the rollout, and the kept ones by the rollout manager.
+        self.prompt_stats = None
+        self.dynamic_filter = (
+            load_function(args.dynamic_sampling_filter_path) if args.dynamic_sampling_filter_path is not None else None
         )
         self.sampling_params: dict[str, Any] = dict(
             temperature=args.rollout_temperature,
@@ -69,20 +93,35 @@ class GenerateState(metaclass=SingletonMeta):
         self.remaining_batch_size = 0
         self.pendings = set()
         self.aborted = False
+        # submit time and predicted response length of the pending tasks
+        self.task_info = {}
+        # the requests aborted by the streaming dynamic filter, and the filter outputs of their groups.
+        self.cancelled_rids = set()
+        self.early_dropped_groups = {}
+        self.worker_urls = None
+
+    async def tokenize(self, text: str) -> list[int]:
+        async with self.tokenizer_semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.tokenizer_executor, lambda: self.tokenizer(text, add_special_tokens=False)["input_ids"]
+            )
 
     def submit_generate_tasks(self, samples: list[list[Sample]]) -> None:
+        if self.args.rollout_length_aware_scheduling:
+            # tasks wait for the concurrency limiter in submission order.
+            samples = sort_groups_by_predicted_length(self.length_predictor, samples)
         for group in samples:
-            self.pendings.add(
-                asyncio.create_task(
-                    # submit a group of samples as a single task.
-                    generate_and_rm_group(
-                        self.args,
-                        group,
-                        sampling_params=self.sampling_params.copy(),
-                        evaluation=False,
-                    )
+            task = asyncio.create_task(
+                # submit a group of samples as a single task.
+                generate_and_rm_group(
+                    self.args,
+                    group,
+                    sampling_params=self.sampling_params.copy(),
+                    evaluation=False,
                 )
             )
+            self.pendings.add(task)
+            self.task_info[task] = (time.monotonic(), self.length_predictor.predict(group))
         self.remaining_batch_size += len(samples)
 
 
@@ -118,8 +157,7 @@ async def generate(args: Namespace, sample: Sample, sampling_params: dict[str, A
 
     if len(sample.response) > 0:
         # Adjust max_new_tokens for subsequent generation turns
-        prompt_len = len(state.tokenizer(text_prompt, add_special_tokens=False)["input_ids"])
-        sampling_params["max_new_tokens"] -= len(sample.tokens) - prompt_len
+        sampling_params["max_new_tokens"] -= sample.response_length
 
     assert (
         sampling_params["max_new_tokens"] >= 0
@@ -135,20 +173,24 @@ async def generate(args: Namespace, sample: Sample, sampling_params: dict[str, A
     }
     if image_data:
         payload["image_data"] = image_data
+    if sample.rid is not None:
+        payload["rid"] = sample.rid
 
-    # Use existing tokens for multi-turn or tokenize the new prompt
-    if len(sample.response) > 0:
+    # Use existing tokens for multi-turn or prompt tokens from the prompt cache, otherwise tokenize the new prompt
+    if len(sample.response) > 0 or (sample.tokens and isinstance(sample.prompt, str)):
         payload["input_ids"] = sample.tokens
     else:
-        prompt_token_ids = state.tokenizer(text_prompt, add_special_tokens=False)["input_ids"]
+        prompt_token_ids = await state.tokenize(text_prompt)
         payload["input_ids"] = prompt_token_ids
         if not sample.tokens:  # Initialize sample.tokens for the first turn
             sample.tokens = prompt_token_ids
 
     output = await post(url, payload)
+    return await _process_output(args, sample, output)
 
-    # Extract new response tokens
 
+async def _process_output(args: Namespace, sample: Sample, output: dict[str, Any]) -> Sample:
+    """Append the output of a `/generate` request to the sample."""
     if args.use_slime_router and "RadixTreeMiddleware" in args.slime_router_middleware_paths:
         assert not args.partial_rollout, "Currently parital rollout is not suppurted when using slime router"
         retrieve_url = f"http://{args.sglang_router_ip}:{args.sglang_router_port}/retrieve_from_text"
@@ -214,17 +256,29 @@ async def generate_and_rm(
     state = GenerateState(args)
 
     # generate
-    async with state.semaphore:
-        if state.aborted:
+    async with state.limiter.slot() as report:
+        if state.aborted or sample.rid in state.cancelled_rids:
             sample.status = Sample.Status.ABORTED
             return sample
 
+        start_time = time.monotonic()
+        start_response_length = sample.response_length
         if args.custom_generate_function_path is not None:
             custom_generate_func = load_function(args.custom_generate_function_path)
             sample = await custom_generate_func(args, sample, sampling_params)
         else:
             sample = await generate(args, sample, sampling_params)
 
+        # feed the latency per generated token to the concurrency limiter,
+        # the aborts of the end of the rollout are not caused by the load.
+        samples = sample if isinstance(sample, list) else [sample]
+        num_new_tokens = sum(s.response_length for s in samples) - start_response_length
+        report(
+            latency=(time.monotonic() - start_time) / num_new_tokens if num_new_tokens > 0 else None,
+            dropped=not state.aborted
+            and any(s.status == Sample.Status.ABORTED and s.rid not in state.cancelled_rids for s in samples),
+        )
+
     # for the rm that need the whole group, we will not do the rm here
     if args.group_rm:
         return sample
@@ -250,6 +304,66 @@ async def generate_and_rm(
     return sample
 
 
+def _can_generate_group(args: Namespace, group: list[Sample]) -> bool:
+    """Whether the group can be generated by a single batched request, i.e. new samples of the same prompt tokens."""
+    return (
+        args.rollout_group_generate
+        and args.custom_generate_function_path is None
+        and not (args.use_slime_router and "RadixTreeMiddleware" in args.slime_router_middleware_paths)
+        and all(
+            sample.status == Sample.Status.PENDING
+            and isinstance(sample.prompt, str)
+            and sample.tokens
+            and sample.tokens == group[0].tokens
+            for sample in group
+        )
+    )
+
+
+async def generate_and_rm_batched(
+    args: Namespace, group: list[Sample], group_sampling_params: list[dict[str, Any]], evaluation: bool = False
+) -> list[Sample]:
+    """Generate the samples of a group with one batched `/generate` request, and reward them.
+
+    The prompt is sent once per sample in the batch, so that each sample keeps its own sampling parameters
+    (e.g. the seeds of `group_sampling_seeds`), and the engine shares the prompt prefix within the batch.
+    """
+    state = GenerateState(args)
+    url = f"http://{args.sglang_router_ip}:{args.sglang_router_port}/generate"
+
+    async with state.limiter.slot(weight=len(group)) as report:
+        if state.aborted:
+            for sample in group:
+                sample.status = Sample.Status.ABORTED
+            return group
+
+        start_time = time.monotonic()
+        payload = {
+            "input_ids": [sample.tokens for sample in group],
+            "sampling_params": group_sampling_params,
+            "return_logprob": True,
+        }
+        outputs = await post(url, payload)
+        for sample, output in zip(group, outputs):
+            await _process_output(args, sample, output)
+
+        num_new_tokens = sum(sample.response_length for sample in group)
+        report(
+            latency=(time.monotonic() - start_time) / num_new_tokens if num_new_tokens > 0 else None,
+            dropped=not state.aborted and any(sample.status == Sample.Status.ABORTED for sample in group),
+        )
+
+    # for the rm that need the whole group, we will not do the rm here
+    if args.group_rm:
+        return group
+
+    samples_need_reward = [sample for sample in group if sample.status != Sample.Status.ABORTED]
+    rewards = await asyncio.gather(*[async_rm(args, sample) for sample in samples_need_reward])
+    for sample, reward in zip(samples_need_reward, rewards):
+        sample.reward = reward
+    return group
+
+
 async def generate_and_rm_group(
     args: Namespace, group: list[Sample], sampling_params: dict[str, Any], evaluation: bool = False
 ) -> list[Sample]:
@@ -258,15 +372,52 @@ async def generate_and_rm_group(
     if state.aborted:
         return group
 
-    tasks = []
-    for idx, sample in enumerate(group):
+    # the samples of a group share the same prompt, tokenize it once for the whole group.
+    if (
+        args.custom_generate_function_path is None
+        and isinstance(group[0].prompt, str)
+        and all(
+            sample.status == Sample.Status.PENDING and not sample.tokens and sample.prompt == group[0].prompt
+            for sample in group
+        )
+    ):
+        prompt_token_ids = await state.tokenize(group[0].prompt)
+        for sample in group:
+            sample.tokens = list(prompt_token_ids)
+
+    streaming_filter = (
+        state.dynamic_filter
+        if isinstance(state.dynamic_filter, StreamingDynamicFilter)
+        and not evaluation
+        and not args.group_rm
+        and args.custom_generate_function_path is None
+        else None
+    )
+
+    group_sampling_params = []
+    for idx in range(len(group)):
         current_sampling_params = sampling_params.copy()
         if getattr(args, "sglang_enable_deterministic_inference", False):
             seed = state.group_sampling_seeds[idx]
             current_sampling_params["sampling_seed"] = seed
-        tasks.append(generate_and_rm(args, sample, current_sampling_params, evaluation=evaluation))
+        group_sampling_params.append(current_sampling_params)
 
-    group = await asyncio.gather(*tasks)
+    if streaming_filter is None and _can_generate_group(args, group):
+        group = await generate_and_rm_batched(args, group, group_sampling_params, evaluation=evaluation)
+    else:
+        tasks = []
+        for sample, current_sampling_params in zip(group, group_sampling_params):
+            if streaming_filter is not None and sample.status in (Sample.Status.PENDING, Sample.Status.ABORTED):
+                # a request id per sample, to be able to abort it alone.
+                sample.rid = uuid.uuid4().hex
+            tasks.append(
+                asyncio.create_task(generate_and_rm(args, sample, current_sampling_params, evaluation=evaluation))
+            )
+
+        if streaming_filter is not None:
+            await _stream_group_to_filter(args, streaming_filter, group, tasks)
+
+        group = await asyncio.gather(*tasks)
 
     # for the rm that need the whole group, we will not do the rm here
     if not state.aborted and args.group_rm:
@@ -277,7 +428,95 @@ async def generate_and_rm_group(
     return group
 
 
-async def abort(args: Namespace, rollout_id: int) -> list[list[Sample]]:
+async def _stream_group_to_filter(
+    args: Namespace, streaming_filter: StreamingDynamicFilter, group: list[Sample], tasks: list[asyncio.Task]
+) -> None:
+    """Feed the finished samples of the group to the streaming filter, and abort the rest if the group is dropped."""
+    state = GenerateState(args)
+    finished = []
+    for next_finished in asyncio.as_completed(tasks):
+        sample = await next_finished
+        if state.aborted:
+            return
+        if sample.status == Sample.Status.ABORTED:
+            continue
+        finished.append(sample)
+        if len(finished) == len(group):
+            return
+        output = streaming_filter.on_partial_group(args, finished, len(group), prompt_stats=state.prompt_stats)
+        if not output.keep:
+            break
+    else:
+        return
+
+    state.early_dropped_groups[group[0].group_index] = output
+    rids = [sample.rid for sample, task in zip(group, tasks) if not task.done()]
+    # mark the requests first, so that the samples not sent yet are not sent at all.
+    state.cancelled_rids.update(rids)
+    await _abort_requests(args, rids)
+
+
+async def _abort_requests(args: Namespace, rids: list[str]) -> None:
+    """Abort the requests `rids` on the engines, best-effort.
+
+    The router does not tell which worker serves a request, so the abort is sent to every worker, with at most
+    `_MAX_CONCURRENT_ABORTS` requests at a time and without retries. A request that is not aborted runs to the end,
+    and its group is dropped all the same.
+    """
+    state = GenerateState(args)
+    try:
+        if state.worker_urls is None:
+            response = await get(f"http://{args.sglang_router_ip}:{args.sglang_router_port}/list_workers")
+            state.worker_urls = response["urls"]
+    except Exception as e:
+        print(f"Failed to list the workers to abort {len(rids)} requests: {e}")
+        return
+
+    async def abort_request(url: str, rid: str) -> None:
+        async with state.abort_semaphore:
+            await post(f"{url}/abort_request", {"rid": rid}, max_retries=1)
+
+    results = await asyncio.gather(
+        *[abort_request(url, rid) for url in state.worker_urls for rid in rids], return_exceptions=True
+    )
+    if errors := [result for result in results if isinstance(result, Exception)]:
+        # e.g. an engine restarted, list the workers again for the next aborts.
+        state.worker_urls = None
+        print(f"Failed to send {len(errors)} of the {len(results)} aborts of a dropped group: {errors[0]}")
+
+
+def _flatten_group(group: list) -> list[Sample]:
+    return sum(group, []) if isinstance(group[0], list) else group
+
+
+def _update_prompt_stats(args: Namespace, prompt_stats: Optional[PromptStatsStore], group: list) -> None:
+    if prompt_stats is None:
+        return
+    # the samples cancelled by a streaming filter have no reward.
+    samples = [
+        sample
+        for sample in _flatten_group(group)
+        if sample.prompt_index is not None and sample.status != Sample.Status.ABORTED and sample.reward is not None
+    ]
+    prompt_stats.update(
+        prompt_indices=[sample.prompt_index for sample in samples],
+        rewards=[sample.get_reward_value(args) for sample in samples],
+        response_lengths=[sample.response_length for sample in samples],
+        truncated=[sample.status == Sample.Status.TRUNCATED for sample in samples],
+    )
+
+
+def _recycle_group(group: list, rollout_id: int) -> list:
+    # tag the samples with the rollout that generated them, to know their staleness when they are reused.
+    for sample in _flatten_group(group):
+        if sample.response and "start_rollout_id" not in sample.metadata:
+            sample.metadata["start_rollout_id"] = rollout_id
+    return group
+
+
+async def abort(
+    args: Namespace, rollout_id: int, metric_gatherer: Optional["_MetricGatherer"] = None
+) -> list[list[Sample]]:
     aborted_samples = []
 
     state = GenerateState(args)
@@ -295,20 +534,24 @@ async def abort(args: Namespace, rollout_id: int) -> list[list[Sample]]:
     while state.pendings:
         done, state.pendings = await asyncio.wait(state.pendings, return_when=asyncio.FIRST_COMPLETED)
 
-        if not args.partial_rollout:
-            continue
-
-        # for partial rollout, collect the partial samples into the data buffer
         for task in done:
             group = task.result()
-            for sample in group:
-                if sample.response and "start_rollout_id" not in sample.metadata:
-                    sample.metadata["start_rollout_id"] = rollout_id
-            aborted_samples.append(group)
-            count += len(group)
-
-    if args.partial_rollout:
-        print(f"Collected {count} partial samples into the data buffer", flush=True)
+            samples = _flatten_group(group)
+            finished = all(sample.status != Sample.Status.ABORTED for sample in samples)
+            early_dropped = state.early_dropped_groups.pop(samples[0].group_index, None) is not None
+            if early_dropped:
+                _update_prompt_stats(args, state.prompt_stats, group)
+            # for partial rollout, collect the partial samples into the data buffer,
+            # the groups that finished before being aborted can be reused as is,
+            # but not the groups given up by the streaming dynamic filter.
+            if not early_dropped and (args.partial_rollout or (args.rollout_reuse_surplus_groups and finished)):
+                aborted_samples.append(_recycle_group(group, rollout_id))
+                count += len(group)
+            elif metric_gatherer is not None:
+                metric_gatherer.on_group_wasted(group)
+
+    if args.partial_rollout or args.rollout_reuse_surplus_groups:
+        print(f"Collected {count} unused samples into the data buffer", flush=True)
 
     return aborted_samples
 
@@ -332,10 +575,7 @@ async def generate_rollout_async(
 
     state = GenerateState(args)
 
-    # instantiate data filters
-    dynamic_filter = (
-        load_function(args.dynamic_sampling_filter_path) if args.dynamic_sampling_filter_path is not None else None
-    )
+    dynamic_filter = state.dynamic_filter
 
     metric_gatherer = _MetricGatherer()
 
@@ -343,6 +583,7 @@ async def generate_rollout_async(
     target_data_size = args.rollout_batch_size
 
     data = []
+    surplus_groups = []
     do_print = True
     pbar = tqdm(total=target_data_size * args.n_samples_per_prompt, desc="Rollout generation")
     while len(data) < target_data_size:
@@ -355,6 +596,10 @@ async def generate_rollout_async(
         done, state.pendings = await asyncio.wait(state.pendings, return_when=asyncio.FIRST_COMPLETED)
         for task in done:
             group: list[Sample] = task.result()
+            submit_time, predicted_length = state.task_info.pop(task)
+            if not isinstance(group[0], list) and all(sample.status != Sample.Status.ABORTED for sample in group):
+                metric_gatherer.on_group_done(group, time.monotonic() - submit_time, predicted_length)
+                state.length_predictor.update(group)
 
             if do_print:
                 sample = group[0][0] if isinstance(group[0], list) else group[0]
@@ -365,17 +610,26 @@ async def generate_rollout_async(
                 do_print = False
 
             assert len(group) == args.n_samples_per_prompt
-            dynamic_filter_output = _call_dynamic_filter(dynamic_filter, args, group)
+            if (dynamic_filter_output := state.early_dropped_groups.pop(group[0].group_index, None)) is None:
+                dynamic_filter_output = _call_dynamic_filter(dynamic_filter, args, group)
             if not dynamic_filter_output.keep:
                 metric_gatherer.on_dynamic_filter_drop(reason=dynamic_filter_output.reason)
+                metric_gatherer.on_group_wasted(group)
+                # the dropped groups never reach the training data, record them here for the streaming filters.
+                _update_prompt_stats(args, state.prompt_stats, group)
                 state.remaining_batch_size -= 1
                 continue
 
             # add the samples to the data
-            # NOTE: here we have not stored all the unused samples back to the data buffer.
             if len(data) < target_data_size:
                 data.append(group)
+                metric_gatherer.on_group_used(group, rollout_id)
                 pbar.update(args.n_samples_per_prompt)
+            elif args.rollout_reuse_surplus_groups:
+                # finished after the batch was full, keep it for the next rollout.
+                surplus_groups.append(_recycle_group(group, rollout_id))
+            else:
+                metric_gatherer.on_group_wasted(group)
 
     pbar.close()
     sample = data[-1][0][0] if isinstance(data[-1][0], list) else data[-1][0]
@@ -385,14 +639,15 @@ async def generate_rollout_async(
     )
 
     # there are still some unfinished requests, abort them
-    aborted_samples = await abort(args, rollout_id)
+    aborted_samples = surplus_groups + await abort(args, rollout_id, metric_gatherer)
 
     assert len(data) == args.rollout_batch_size, f"Got {len(data)} samples, expected {args.rollout_batch_size}"
     data = sorted(data, key=lambda group: group[0][0].index if isinstance(group[0], list) else group[0].index)
 
     # reset the global state to prevent effects on the next rollout or eval.
     state.reset()
-    return RolloutFnTrainOutput(samples=data, metrics=metric_gatherer.collect()), aborted_samples
+    metrics = metric_gatherer.collect() | state.limiter.collect_metrics()
+    return RolloutFnTrainOutput(samples=data, metrics=metrics), aborted_samples
 
 
 def _call_dynamic_filter(fn, *args, **kwargs):
@@ -411,17 +666,52 @@ def _call_dynamic_filter(fn, *args, **kwargs):
 class _MetricGatherer:
     def __init__(self):
         self._dynamic_filter_drop_reason_count = defaultdict(lambda: 0)
+        self._group_latencies = []
+        self._length_prediction_errors = []
+        self._reused_tokens = 0
+        self._wasted_tokens = 0
 
     def on_dynamic_filter_drop(self, reason: Optional[str]):
         if not reason:
             return
         self._dynamic_filter_drop_reason_count[reason] += 1
 
+    def on_group_done(self, group: list[Sample], latency: float, predicted_length: Optional[float]):
+        self._group_latencies.append(latency)
+        if predicted_length is not None:
+            length = sum(sample.response_length for sample in group) / len(group)
+            self._length_prediction_errors.append(abs(predicted_length - length) / max(length, 1))
+
+    def on_group_used(self, group: list, rollout_id: int):
+        # the tokens generated by a previous rollout, recycled through the data buffer.
+        self._reused_tokens += sum(
+            sample.response_length
+            for sample in _flatten_group(group)
+            if sample.metadata.get("start_rollout_id", rollout_id) < rollout_id
+        )
+
+    def on_group_wasted(self, group: list):
+        self._wasted_tokens += sum(sample.response_length for sample in _flatten_group(group))
+
     def collect(self):
-        return {
+        metrics = {
             f"rollout/dynamic_filter/drop_{reason}": count
             for reason, count in self._dynamic_filter_drop_reason_count.items()
         }
+        metrics["rollout/reused_tokens"] = self._reused_tokens
+        metrics["rollout/wasted_tokens"] = self._wasted_tokens
+        if self._group_latencies:
+            # the latency from submission to completion of the groups, the tail dominates the rollout time.
+            p50, p90, p99 = np.percentile(self._group_latencies, [50, 90, 99]).tolist()
+            metrics |= {
+                "perf/rollout_group_latency_p50": p50,
+                "perf/rollout_group_latency_p90": p90,
+                "perf/rollout_group_latency_p99": p99,
+                "perf/rollout_group_latency_max": max(self._group_latencies),
+            }
+        if self._length_prediction_errors:
+            metrics["rollout/length_prediction_rel_error"] = float(np.mean(self._length_prediction_errors))
+        return metrics
 
 
 EVAL_PROMPT_DATASET = {}
@@ -490,6 +780,8 @@ async def eval_rollout_single_dataset(
             tool_key=tool_key,
             apply_chat_template=args.apply_chat_template,
             apply_chat_template_kwargs=args.apply_chat_template_kwargs,
+            cache_dir=args.prompt_cache_dir,
+            num_workers=args.prompt_data_num_workers,
         )
     dataset = EVAL_PROMPT_DATASET[cache_key]
 
@@ -534,10 +826,9 @@ async def eval_rollout_single_dataset(
     tasks = []
     # do multiple samples for eval prompts
     sample_index = 0
-    for i, prompt_sample in enumerate(dataset.samples):
-        for j in range(n_samples_per_prompt):
-            # use the same prompt for multiple samples
-            sample = copy.deepcopy(prompt_sample)
+    for i in range(len(dataset)):
+        # use the same prompt for multiple samples
+        for j, sample in enumerate(dataset.make_samples(i, n_samples_per_prompt)):
             sample.index = sample_index
             sample_index += 1
             sample.metadata = dataset_cfg.inject_metadata(getattr(sample, "metadata", None))
@@ -601,6 +892,10 @@ def generate_rollout(
     Returns:
         list[list[Sample]]: a list of list of samples generated by the rollout
     """
+    if not evaluation:
+        # the per-prompt statistics of the data source, for the length predictor and the streaming filters.
+        state = GenerateState(args)
+        state.prompt_stats = state.length_predictor.prompt_stats = getattr(data_buffer, "prompt_stats", None)
     output, aborted_samples = generate_abortable_samples(
         args, rollout_id, data_buffer.get_samples, evaluation=evaluation
     )
@@ -5,10 +5,19 @@ String-based Radix Trie for efficient prefix matching and token caching.
 Optimized for string prefixes with corresponding token IDs.
 """
 
+import bisect
+import heapq
+import itertools
 import threading
 import time
+from array import array
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+# Typecodes of the compact per-node payloads.
+TOKEN_TYPECODE = "i"
+LOGP_TYPECODE = "d"
+LOSS_MASK_TYPECODE = "b"
 
 
 @dataclass
@@ -26,18 +35,35 @@ class MatchResult:
 class StringTreeNode:
     """Tree node for string-based radix trie."""
 
+    __slots__ = (
+        "_children",
+        "parent",
+        "string_key",
+        "token_ids",
+        "logp",
+        "loss_mask",
+        "last_access_time",
+        "access_count",
+        "ref_count",
+        "weight_version",
+        "id",
+    )
+
     counter = 0
 
     def __init__(self, node_id: Optional[int] = None):
         # Core tree structure
-        self.children: List[StringTreeNode] = []  # Use list to store children
+        # Nodes are never split, so siblings may prefix each other. The children are bucketed by the first
+        # character of their string key, and each bucket is sorted longest key first, so that the first key
+        # prefixing the text is the longest match. The buckets are copied on write and swapped.
+        self._children: Dict[str, Tuple[StringTreeNode, ...]] = {}
         self.parent: Optional[StringTreeNode] = None
 
         # Node data
         self.string_key: str = ""  # The string fragment this node represents
-        self.token_ids: Optional[List[int]] = None  # Token IDs for this node only (not cumulative)
-        self.logp: Optional[List[float]] = None  # Log probabilities for this node's tokens
-        self.loss_mask: Optional[List[int]] = None  # Loss mask for model generation parts
+        self.token_ids: Optional[array] = None  # Token IDs for this node only (not cumulative)
+        self.logp: Optional[array] = None  # Log probabilities for this node's tokens
+        self.loss_mask: Optional[array] = None  # Loss mask for model generation parts
 
         # Access tracking
         self.last_access_time = time.monotonic()
@@ -53,10 +79,47 @@ class StringTreeNode:
         self.id = StringTreeNode.counter if node_id is None else node_id
         StringTreeNode.counter += 1
 
+    @property
+    def children(self) -> List[StringTreeNode]:
+        """All the children of this node."""
+        return [child for bucket in list(self._children.values()) for child in bucket]
+
     @property
     def is_leaf(self) -> bool:
         """Check if this node is a leaf node."""
-        return len(self.children) == 0
+        return len(self._children) == 0
+
+    # The writers replace a whole bucket with a single assignment, so a reader sees the bucket before or after
+    # the change. It may miss a child being added or see one being removed, but never a half-updated bucket.
+    def add_child(self, child: StringTreeNode):
+        """Add a child, must be called with the lock of the trie held."""
+        key = child.string_key
+        bucket = [node for node in self._children.get(key[0], ()) if node.string_key != key]
+        index = bisect.bisect_left(bucket, -len(key), key=lambda node: -len(node.string_key))
+        bucket.insert(index, child)
+        self._children[key[0]] = tuple(bucket)
+
+    def remove_child(self, child: StringTreeNode) -> bool:
+        """Remove a child, return whether it was a child of this node. Must be called with the lock of the trie held."""
+        first_char = child.string_key[:1]
+        bucket = self._children.get(first_char, ())
+        if not any(node is child for node in bucket):
+            return False
+        bucket = tuple(node for node in bucket if node is not child)
+        if bucket:
+            self._children[first_char] = bucket
+        else:
+            del self._children[first_char]
+        return True
+
+    def match_child(self, text: str, start: int = 0) -> Optional[StringTreeNode]:
+        """Return the child with the longest string key that prefixes `text[start:]`, None if there is none."""
+        if start >= len(text):
+            return None
+        for child in self._children.get(text[start], ()):
+            if text.startswith(child.string_key, start):
+                return child
+        return None
 
     @property
     def has_value(self) -> bool:
@@ -78,6 +141,15 @@ class StringTreeNode:
 
         return True
 
+    @property
+    def nbytes(self) -> int:
+        """Approximate size of the data cached by this node, its text and payloads."""
+        size = len(self.string_key)
+        for payload in (self.token_ids, self.logp, self.loss_mask):
+            if payload is not None:
+                size += len(payload) * payload.itemsize
+        return size
+
     @property
     def is_evictable(self) -> bool:
         """Check if this node can be evicted."""
@@ -99,12 +171,21 @@ class StringRadixTrie:
     Features:
     - Efficient string prefix matching
     - Token ID caching for matched prefixes
-    - Thread-safe operations
+    - Thread-safe operations: lock-free lookups, and the writers (insert, remove, GC) serialized by a lock
     - Weight version tracking
     - Automatic garbage collection based on weight version thresholds
+    - LRU or LFU eviction of the leaves within a byte budget
     """
 
-    def __init__(self, max_cache_size: int = 10000, gc_threshold_k: int = 5, tokenizer=None, verbose: bool = False):
+    def __init__(
+        self,
+        max_cache_size: int = 10000,
+        gc_threshold_k: int = 5,
+        tokenizer=None,
+        verbose: bool = False,
+        max_cache_bytes: Optional[int] = None,
+        eviction_policy: str = "lru",
+    ):
         """
         Initialize the String Radix Trie.
         Args:
@@ -112,11 +193,18 @@ class StringRadixTrie:
             gc_threshold_k: GC threshold - nodes with weight_version < (current_version - k) will be removed
             tokenizer: Optional tokenizer for converting text to tokens when not found in cache
             verbose: Whether to print debug information and tree structure
+            max_cache_bytes: Maximum size of the cached text and payloads, the leaves are evicted beyond it.
+                Not bounded if None.
+            eviction_policy: "lru" to evict the least recently used leaves first,
+                "lfu" the least frequently used ones, then the least recently used.
         """
+        assert eviction_policy in ("lru", "lfu"), f"Unknown eviction policy: {eviction_policy}"
         self.max_cache_size = max_cache_size
         self.gc_threshold_k = gc_threshold_k
         self.tokenizer = tokenizer
         self.verbose = verbose
+        self.max_cache_bytes = max_cache_bytes
+        self.eviction_policy = eviction_policy
 
         # Tree structure
         self.root = StringTreeNode()
@@ -128,6 +216,12 @@ class StringRadixTrie:
         self.cache_hits = 0
         self.cache_misses = 0
         self.cur_cache_size = 0  # Total number of token IDs across all nodes
+        self.cur_cache_bytes = 0  # Total size of the nodes, see `StringTreeNode.nbytes`
+
+        # Candidates for eviction: (priority, seq, node) of the leaves, maintained incrementally.
+        # Entries are checked lazily when popped, as the nodes may have been accessed, got children or been removed.
+        self._leaf_heap = []
+        self._leaf_seq = itertools.count()
 
         # Thread safety
         self._lock = threading.RLock()
@@ -140,63 +234,60 @@ class StringRadixTrie:
         Returns:
             MatchResult containing matched prefix, token IDs, logp, and remaining string
         """
-        with self._lock:
-            if not text:
-                return MatchResult("", [], [], [], text, self.root)
-
-            matched_tokens = []
-            matched_logp = []
-            matched_loss_mask = []
-            matched_prefix = ""
-            current_node = self.root
-            remaining_text = text
-
-            while remaining_text:
-                # Find the best matching child that completely matches from start
-                best_child = None
-                best_key_len = 0
-
-                for child_node in current_node.children:
-                    # Only consider complete startswith matches using node's string_key
-                    if remaining_text.startswith(child_node.string_key):
-                        if len(child_node.string_key) > best_key_len:
-                            best_child = child_node
-                            best_key_len = len(child_node.string_key)
-
-                if best_child is None:
-                    # No complete startswith match found
-                    break
-
-                # Move to the best matching child
-                best_child.touch()
-                current_node = best_child
-                matched_prefix += best_child.string_key
-                remaining_text = remaining_text[best_key_len:]
+        # Lock-free, see `StringTreeNode.add_child`. The statistics may miss concurrent increments.
+        if not text:
+            return MatchResult("", [], [], [], text, self.root)
 
-                # Accumulate tokens, logp, and loss_mask from this node
-                if best_child.has_value:
-                    matched_tokens.extend(best_child.token_ids)
-                    matched_logp.extend(best_child.logp)
-                    if best_child.loss_mask is not None:
-                        matched_loss_mask.extend(best_child.loss_mask)
-                    else:
-                        # If no loss_mask is stored, create default mask same as logp
-                        matched_loss_mask.extend([1] * len(best_child.token_ids))
-                    self.cache_hits += 1
-
-            if not matched_tokens:
-                self.cache_misses += 1
-
-            result = MatchResult(
-                matched_prefix, matched_tokens, matched_logp, matched_loss_mask, remaining_text, current_node
-            )
+        matched_tokens = array(TOKEN_TYPECODE)
+        matched_logp = array(LOGP_TYPECODE)
+        matched_loss_mask = array(LOSS_MASK_TYPECODE)
+        current_node = self.root
+        # offset of the remaining text
+        pos = 0
+
+        while pos < len(text):
+            # Find the best matching child that completely matches from start
+            best_child = current_node.match_child(text, pos)
+            if best_child is None:
+                # No complete startswith match found
+                break
 
-            # Print tree structure if verbose is enabled
-            if self.verbose:
-                print("Tree structure after find_longest_prefix:")
-                self.pretty_print()
+            # Move to the best matching child
+            best_child.touch()
+            current_node = best_child
+            pos += len(best_child.string_key)
+
+            # Accumulate tokens, logp, and loss_mask from this node
+            # token_ids is assigned last by the writer, so logp and loss_mask are set when it is.
+            token_ids = best_child.token_ids
+            if token_ids is not None:
+                matched_tokens.extend(token_ids)
+                matched_logp.extend(best_child.logp)
+                if best_child.loss_mask is not None:
+                    matched_loss_mask.extend(best_child.loss_mask)
+                else:
+                    # If no loss_mask is stored, create default mask same as logp
+                    matched_loss_mask.extend([1] * len(token_ids))
+                self.cache_hits += 1
+
+        if not matched_tokens:
+            self.cache_misses += 1
+
+        result = MatchResult(
+            text[:pos],
+            matched_tokens.tolist(),
+            matched_logp.tolist(),
+            matched_loss_mask.tolist(),
+            text[pos:],
+            current_node,
+        )
 
-            return result
+        # Print tree structure if verbose is enabled
+        if self.verbose:
+            print("Tree structure after find_longest_prefix:")
+            self.pretty_print()
+
+        return result
 
     def insert(
         self,
@@ -266,6 +357,11 @@ class StringRadixTrie:
                 if self.verbose:
                     print(f"[RadixTree] GC removed {gc_removed} nodes, new cache size: {self.cur_cache_size}")
 
+            if self.max_cache_bytes is not None and self.cur_cache_bytes > self.max_cache_bytes:
+                evicted = self.evict()
+                if self.verbose:
+                    print(f"[RadixTree] Evicted {evicted} leaves, new cache bytes: {self.cur_cache_bytes}")
+
             # Print tree structure if verbose is enabled
             if self.verbose:
                 print("Tree structure after insert:")
@@ -282,71 +378,71 @@ class StringRadixTrie:
         weight_version: Optional[int] = None,
     ) -> bool:
         """Insert tokens - skip tokens for existing nodes just like we skip text."""
+        token_ids = array(TOKEN_TYPECODE, token_ids)
+        logp = array(LOGP_TYPECODE, logp)
+        loss_mask = array(LOSS_MASK_TYPECODE, loss_mask)
 
         current_node = self.root
-        remaining_text = text
-        remaining_tokens = token_ids[:]  # Copy the tokens list
-        remaining_logp = logp[:]  # Copy the logp list
-        remaining_loss_mask = loss_mask[:]  # Copy the loss_mask list
-
-        # Track all nodes traversed during insert for weight version update
-        traversed_nodes = [current_node]
+        # offsets of the remaining text and tokens, the payloads are only copied into the new node.
+        pos = 0
+        offset = 0
         new_node = None
+        # Track all nodes traversed during insert for weight version update
+        traversed_nodes = []
 
-        while remaining_text:
+        while pos < len(text):
             # Find best startswith match
-            best_child = None
-            best_key_len = 0
-
-            for child_node in current_node.children:
-                if remaining_text.startswith(child_node.string_key) and len(child_node.string_key) > best_key_len:
-                    best_child = child_node
-                    best_key_len = len(child_node.string_key)
+            best_child = current_node.match_child(text, pos)
 
             if best_child is not None:
                 # Found existing node - skip its text and tokens
                 current_node = best_child
                 traversed_nodes.append(current_node)
-                remaining_text = remaining_text[best_key_len:]
+                pos += len(best_child.string_key)
 
                 # Skip the tokens that this existing node covers
                 if best_child.has_value:
-                    tokens_to_skip = len(best_child.token_ids)
-                    remaining_tokens = remaining_tokens[tokens_to_skip:]
-                    remaining_logp = remaining_logp[tokens_to_skip:]
-                    remaining_loss_mask = remaining_loss_mask[tokens_to_skip:]
+                    offset += len(best_child.token_ids)
             else:
                 # Create new node for remaining text with remaining tokens
                 new_node = StringTreeNode()
                 new_node.parent = current_node
-                new_node.string_key = remaining_text
+                new_node.string_key = text[pos:]
 
-                if remaining_tokens:  # Only assign if there are tokens left
-                    new_node.token_ids = remaining_tokens
-                    new_node.logp = remaining_logp
-                    new_node.loss_mask = remaining_loss_mask
+                if offset < len(token_ids):  # Only assign if there are tokens left
+                    new_node.logp = logp[offset:]
+                    new_node.loss_mask = loss_mask[offset:]
+                    new_node.token_ids = token_ids[offset:]
                     new_node.touch()
                     # Increment cache size by number of tokens added
-                    self.cur_cache_size += len(remaining_tokens)
+                    self.cur_cache_size += len(new_node.token_ids)
 
-                current_node.children.append(new_node)
+                current_node.add_child(new_node)
                 traversed_nodes.append(new_node)
                 self.total_entries += 1
+                self.cur_cache_bytes += new_node.nbytes
+                self._push_leaf(new_node)
                 break
 
         # If we've traversed the entire text and the last node doesn't have tokens,
         # assign remaining tokens to it
-        if remaining_text == "" and not current_node.has_value:
-            if remaining_tokens:  # Only assign if there are tokens left
-                current_node.token_ids = remaining_tokens
-                current_node.logp = remaining_logp
-                current_node.loss_mask = remaining_loss_mask
+        if pos == len(text) and not current_node.has_value:
+            if offset < len(token_ids):  # Only assign if there are tokens left
+                # token_ids last, the readers do not take the lock.
+                nbytes = current_node.nbytes
+                current_node.logp = logp[offset:]
+                current_node.loss_mask = loss_mask[offset:]
+                current_node.token_ids = token_ids[offset:]
                 current_node.touch()
-                self.cur_cache_size += len(remaining_tokens)
+                self.cur_cache_size += len(current_node.token_ids)
+                self.cur_cache_bytes += current_node.nbytes - nbytes
 
-        # Update weight version for all traversed nodes
-        if weight_version is not None and new_node:
-            new_node.weight_version = weight_version
+        # Update weight version for all traversed nodes, so that the ancestors of a node are never older than it,
+        # as expected by the GC.
+        if weight_version is not None:
+            for node in traversed_nodes:
+                if node.weight_version is None or node.weight_version < weight_version:
+                    node.weight_version = weight_version
 
         return True
 
@@ -423,19 +519,58 @@ class StringRadixTrie:
 
         # Remove this node from its parent
         if self._remove_node_from_parent(node):
-            # Update count for the node structure itself
-            pass  # _remove_node_from_parent already decrements total_entries
+            # _remove_node_from_parent already decrements total_entries
+            self.cur_cache_bytes -= node.nbytes
 
         return removed_count
 
     def _remove_node_from_parent(self, node: StringTreeNode) -> bool:
-        """Remove a node from its parent's children list."""
-        if node.parent and node in node.parent.children:
-            node.parent.children.remove(node)
+        """Remove a node from its parent's children."""
+        parent = node.parent
+        if parent and parent.remove_child(node):
+            node.parent = None
             self.total_entries -= 1
+            if parent is not self.root and parent.is_leaf:
+                self._push_leaf(parent)
             return True
         return False
 
+    def _eviction_priority(self, node: StringTreeNode) -> tuple:
+        if self.eviction_policy == "lfu":
+            return (node.access_count, node.last_access_time)
+        return (node.last_access_time,)
+
+    def _push_leaf(self, node: StringTreeNode):
+        if self.max_cache_bytes is None:
+            return
+        heapq.heappush(self._leaf_heap, (self._eviction_priority(node), next(self._leaf_seq), node))
+        # drop the entries of the removed and inner nodes once they are the majority.
+        if len(self._leaf_heap) > 2 * self.total_entries + 64:
+            self._leaf_heap = [entry for entry in self._leaf_heap if entry[2].parent is not None and entry[2].is_leaf]
+            heapq.heapify(self._leaf_heap)
+
+    def evict(self) -> int:
+        """
+        Evict leaves by the eviction policy until the cache fits in max_cache_bytes.
+        The parents of the evicted leaves become candidates once they are leaves.
+        Returns:
+            Number of evicted nodes
+        """
+        with self._lock:
+            evicted = 0
+            while self.cur_cache_bytes > self.max_cache_bytes and self._leaf_heap:
+                priority, _, node = heapq.heappop(self._leaf_heap)
+                if node.parent is None or not node.is_leaf or node.ref_count > 0:
+                    # removed, not a leaf anymore, or protected
+                    continue
+                if priority != self._eviction_priority(node):
+                    # accessed since it was pushed
+                    self._push_leaf(node)
+                    continue
+                self._remove_node_and_descendants(node)
+                evicted += 1
+            return evicted
+
     def gc_by_weight_version(self, current_weight_version: Optional[int] = None) -> int:
         """
         Perform garbage collection based on weight version.
@@ -535,6 +670,9 @@ class StringRadixTrie:
                 "max_cache_size": self.max_cache_size,
                 "cur_cache_size": self.cur_cache_size,
                 "gc_threshold_k": self.gc_threshold_k,
+                "max_cache_bytes": self.max_cache_bytes,
+                "cur_cache_bytes": self.cur_cache_bytes,
+                "eviction_policy": self.eviction_policy,
             }
 
     def clear(self):
@@ -547,6 +685,8 @@ class StringRadixTrie:
             self.cache_hits = 0
             self.cache_misses = 0
             self.cur_cache_size = 0
+            self.cur_cache_bytes = 0
+            self._leaf_heap = []
 
     def pretty_print(self):
         """Print the trie structure in a readable format."""
@@ -564,11 +704,11 @@ class StringRadixTrie:
         key_repr = repr(node.string_key) if node.string_key else "<root>"
         token_info = ""
         if node.has_value:
-            token_info = f" -> tokens: {node.token_ids}"
+            token_info = f" -> tokens: {node.token_ids.tolist()}"
             if node.logp:
                 token_info += f", logp: {[round(p, 3) for p in node.logp]}"
             if node.loss_mask:
-                token_info += f", loss_mask: {node.loss_mask}"
+                token_info += f", loss_mask: {node.loss_mask.tolist()}"
         access_info = f" (accessed: {node.access_count}, ref: {node.ref_count})"
 
         print(f"{indent}{key_repr}{token_info}{access_info}")
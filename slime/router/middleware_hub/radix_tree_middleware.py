@@ -1,5 +1,5 @@
+import asyncio
 import json
-from time import sleep
 
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -7,8 +7,14 @@ from starlette.requests import Request
 from starlette.responses import Response
 from transformers import AutoTokenizer
 
+from slime.utils.http_utils import decode_body
+
 from .radix_tree import StringRadixTrie
 
+# Attempts of the aborted requests, and the max seconds to wait for a weight update between them.
+_MAX_ATTEMPTS = 5
+_ABORT_RETRY_TIMEOUT = 30
+
 # Hop-by-hop headers that should not be forwarded
 HOP_BY_HOP = {
     "content-length",
@@ -31,9 +37,7 @@ def _filter_headers(headers):
 async def _materialize_response(resp):
     """Convert streaming-like Response into a regular Response/JSONResponse safely."""
     # Collect all bytes from the streaming response
-    body = b""
-    async for chunk in resp.body_iterator:
-        body += chunk
+    body = b"".join([chunk async for chunk in resp.body_iterator])
 
     # Try to parse as JSON based on content-type
     ct = resp.headers.get("content-type", "")
@@ -58,7 +62,13 @@ class RadixTreeMiddleware(BaseHTTPMiddleware):
         self.router = router
         self.args = router.args
         self.tokenizer = AutoTokenizer.from_pretrained(self.args.hf_checkpoint, trust_remote_code=True)
-        self.radix_tree = StringRadixTrie(max_cache_size=10000, tokenizer=self.tokenizer, verbose=False)
+        self.radix_tree = StringRadixTrie(
+            max_cache_size=10000,
+            tokenizer=self.tokenizer,
+            verbose=False,
+            max_cache_bytes=self.args.radix_tree_max_cache_bytes,
+            eviction_policy=self.args.radix_tree_eviction_policy,
+        )
         self.router.radix_tree = self.radix_tree
 
     async def dispatch(self, request: Request, call_next):
@@ -68,24 +78,25 @@ class RadixTreeMiddleware(BaseHTTPMiddleware):
         if path != "/generate":
             return await call_next(request)
 
-        request_json = await request.json()
+        request_json = decode_body(await request.body(), request.headers.get("content-type"))
         if "text" in request_json:
             input_text = request_json.pop("text", "")
         elif "input_ids" in request_json:
-            input_text = self.tokenizer.decode(request_json["input_ids"])
+            input_text = await asyncio.to_thread(self.tokenizer.decode, request_json["input_ids"])
         else:
             input_text = None
         if not input_text:
             return await call_next(request)
-        input_tokens, input_logprobs, input_loss_mask = self.radix_tree.retrieve_from_text(
-            input_text, return_logprob=True
+        # the tokenization and the trie work run in threads, so that they do not block the event loop of the router.
+        input_tokens, input_logprobs, input_loss_mask = await asyncio.to_thread(
+            self.radix_tree.retrieve_from_text, input_text, return_logprob=True
         )
         request_json["input_tokens"] = input_tokens
         request_json["stream"] = False
         request._json = request_json
 
         response_data = None
-        for _ in range(5):
+        for attempt in range(_MAX_ATTEMPTS):
             response = await call_next(request)
 
             # If upstream returned a streaming response, materialize it to avoid Content-Length issues
@@ -94,7 +105,7 @@ class RadixTreeMiddleware(BaseHTTPMiddleware):
             # Try to parse JSON from the current response for meta inspection
             try:
                 if hasattr(response, "body") and isinstance(response.body, (bytes, bytearray)):
-                    response_data = json.loads(response.body.decode("utf-8"))
+                    response_data = decode_body(response.body, response.headers.get("content-type"))
                 elif hasattr(response, "content") and isinstance(response.content, (dict, list)):
                     response_data = response.content  # JSONResponse.content is already a dict/list
             except Exception:
@@ -107,45 +118,58 @@ class RadixTreeMiddleware(BaseHTTPMiddleware):
                 and response_data["meta_info"]["finish_reason"]["type"] != "abort"
             ):
                 break
-            # await 30 seconds for aborted responses
-            sleep(30)
+            if attempt + 1 < _MAX_ATTEMPTS:
+                # aborted responses are usually caused by a weight update, retry once it is done,
+                # without blocking the other requests of the router.
+                weight_version = (
+                    response_data.get("meta_info", {}).get("weight_version")
+                    if isinstance(response_data, dict)
+                    else None
+                )
+                await self.router.wait_for_weight_update(weight_version, timeout=_ABORT_RETRY_TIMEOUT)
 
         if isinstance(response_data, dict) and "text" in response_data and "output_ids" in response_data:
-            generated_text = response_data["text"]
-
-            full_text = input_text + generated_text
-            if full_text:
-                try:
-                    if "output_token_logprobs" in response_data.get("meta_info", {}):
-                        generated_token_logprobs = [
-                            item[0] for item in response_data["meta_info"]["output_token_logprobs"]
-                        ]
-                        generated_token_ids = [item[1] for item in response_data["meta_info"]["output_token_logprobs"]]
-                        full_logprobs = input_logprobs + generated_token_logprobs
-                        full_token_ids = input_tokens + generated_token_ids
-                        full_loss_mask = input_loss_mask + [1] * len(generated_token_ids)
-                        self.radix_tree.insert(
-                            full_text,
-                            full_token_ids,
-                            full_logprobs,
-                            full_loss_mask,
-                            weight_version=response_data["meta_info"]["weight_version"],
-                        )
-                    else:
-                        generated_token_ids = self.tokenizer(generated_text, add_special_tokens=False)["input_ids"]
-                        full_token_ids = input_tokens + generated_token_ids
-                        full_loss_mask = input_loss_mask + [1] * len(generated_token_ids)
-                        self.radix_tree.insert(
-                            full_text,
-                            full_token_ids,
-                            None,
-                            full_loss_mask,
-                            weight_version=response_data["meta_info"]["weight_version"],
-                        )
-
-                    if getattr(self.router, "verbose", False):
-                        print(f"[slime-router] Successfully cached trajectory with {len(full_token_ids)} tokens")
-                except Exception as e:
-                    if getattr(self.router, "verbose", False):
-                        print(f"[slime-router] Warning: Failed to cache trajectory: {e}")
+            await asyncio.to_thread(
+                self._cache_trajectory, input_text, input_tokens, input_logprobs, input_loss_mask, response_data
+            )
         return response
+
+    def _cache_trajectory(self, input_text, input_tokens, input_logprobs, input_loss_mask, response_data):
+        """Insert the prompt and the generated response into the radix tree."""
+        generated_text = response_data["text"]
+
+        full_text = input_text + generated_text
+        if full_text:
+            try:
+                if "output_token_logprobs" in response_data.get("meta_info", {}):
+                    generated_token_logprobs = [
+                        item[0] for item in response_data["meta_info"]["output_token_logprobs"]
+                    ]
+                    generated_token_ids = [item[1] for item in response_data["meta_info"]["output_token_logprobs"]]
+                    full_logprobs = input_logprobs + generated_token_logprobs
+                    full_token_ids = input_tokens + generated_token_ids
+                    full_loss_mask = input_loss_mask + [1] * len(generated_token_ids)
+                    self.radix_tree.insert(
+                        full_text,
+                        full_token_ids,
+                        full_logprobs,
+                        full_loss_mask,
+                        weight_version=response_data["meta_info"]["weight_version"],
+                    )
+                else:
+                    generated_token_ids = self.tokenizer(generated_text, add_special_tokens=False)["input_ids"]
+                    full_token_ids = input_tokens + generated_token_ids
+                    full_loss_mask = input_loss_mask + [1] * len(generated_token_ids)
+                    self.radix_tree.insert(
+                        full_text,
+                        full_token_ids,
+                        None,
+                        full_loss_mask,
+                        weight_version=response_data["meta_info"]["weight_version"],
+                    )
+
+                if getattr(self.router, "verbose", False):
+                    print(f"[slime-router] Successfully cached trajectory with {len(full_token_ids)} tokens")
+            except Exception as e:
+                if getattr(self.router, "verbose", False):
+                    print(f"[slime-router] Warning: Failed to cache trajectory: {e}")
@@ -1,14 +1,41 @@
 import argparse
+import asyncio
 import json
 
 import httpx
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from starlette.responses import Response
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
 
+from slime.utils.http_utils import MSGPACK_CONTENT_TYPE, decode_body, is_msgpack
 from slime.utils.misc import load_function
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Headers describing the body, which are not valid anymore once the body is transcoded.
+_BODY_HEADERS = {"content-length", "content-type", "content-encoding", "transfer-encoding"}
+
+# Hop-by-hop headers, which are not forwarded with the streamed body.
+_HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Backoff of the polling of the weight version of the workers, in seconds.
+_WEIGHT_VERSION_POLL_INITIAL_DELAY = 0.2
+_WEIGHT_VERSION_POLL_MAX_DELAY = 5.0
+
 
 def run_router(args):
     """
@@ -32,13 +59,19 @@ class SlimeRouter:
         # Worker information
         self.worker_urls: dict[str, int] = {}
         self.max_weight_version = None
+        # number of changes of the weight version seen by the polling, see `wait_for_weight_update`.
+        self._weight_version_changes = 0
+        self._weight_version_changed = asyncio.Condition()
+        self._num_weight_version_waiters = 0
+        self._weight_version_poller = None
+        # number of waits that timed out, e.g. the workers are down or the weights were not updated.
+        self.num_weight_update_timeouts = 0
 
         # TODO: remove this hardcode
+        max_concurrency = max(args.sglang_server_concurrency, args.rollout_max_concurrency or 0)
         self.client = httpx.AsyncClient(
             limits=httpx.Limits(
-                max_connections=args.sglang_server_concurrency
-                * args.rollout_num_gpus
-                // args.rollout_num_gpus_per_engine
+                max_connections=max_concurrency * args.rollout_num_gpus // args.rollout_num_gpus_per_engine
             ),
             timeout=httpx.Timeout(None),
         )
@@ -51,6 +84,10 @@ class SlimeRouter:
             middleware = load_function(middleware_path)
             self.app.add_middleware(middleware, router=self)
 
+        if msgpack is None:
+            # outermost, the rollout falls back to JSON on 415.
+            self.app.middleware("http")(self._reject_msgpack)
+
     def _setup_routes(self):
         """Setup all the HTTP routes"""
         # sglang-router api
@@ -60,6 +97,11 @@ class SlimeRouter:
         # Catch-all route for proxying to SGLang - must be registered LAST
         self.app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])(self.proxy)
 
+    async def _reject_msgpack(self, request: Request, call_next):
+        if is_msgpack(request.headers.get("content-type")):
+            return JSONResponse(status_code=415, content={"error": "msgpack is not installed on the slime router"})
+        return await call_next(request)
+
     async def health_check(self, request: Request):
         # TODO: do health check in background
         pass
@@ -74,31 +116,59 @@ class SlimeRouter:
         # Get request body and headers
         body = await request.body()
         headers = dict(request.headers)
+        # sglang only speaks JSON, transcode the msgpack requests from the rollout, and answer in msgpack.
+        reply_msgpack = is_msgpack(request.headers.get("accept"))
+        if is_msgpack(request.headers.get("content-type")):
+            body = json.dumps(decode_body(body, MSGPACK_CONTENT_TYPE)).encode("utf-8")
+            headers = {k: v for k, v in headers.items() if k.lower() not in _BODY_HEADERS}
+            headers["content-type"] = "application/json"
 
         try:
-            response = await self.client.request(request.method, url, content=body, headers=headers)
-            # Eagerly read content so we can return JSON (not streaming)
-            content = await response.aread()
-            content_type = response.headers.get("content-type", "")
+            upstream = await self.client.send(
+                self.client.build_request(request.method, url, content=body, headers=headers), stream=True
+            )
+        except BaseException:
+            self._finish_url(worker_url)
+            raise
+
+        content_type = upstream.headers.get("content-type", "")
+        if reply_msgpack and msgpack is not None and "application/json" in content_type:
             try:
-                # Prefer parsing JSON if possible
-                data = json.loads(content)
-                return JSONResponse(
-                    content=data,
-                    status_code=response.status_code,
-                    headers=dict(response.headers),
-                )
-            except Exception:
-                # Fall back to raw body with original content type
-                return Response(
-                    content=content,
-                    status_code=response.status_code,
-                    headers=dict(response.headers),
-                    media_type=content_type or None,
-                )
+                content = await upstream.aread()
+            finally:
+                await upstream.aclose()
+                self._finish_url(worker_url)
+            return Response(
+                content=msgpack.packb(json.loads(content)),
+                status_code=upstream.status_code,
+                headers={k: v for k, v in upstream.headers.items() if k.lower() not in _BODY_HEADERS},
+                media_type=MSGPACK_CONTENT_TYPE,
+            )
 
-        finally:
-            self._finish_url(worker_url)
+        # Pass the body through without parsing it, the middlewares that need it read it themselves.
+        released = False
+
+        async def release():
+            nonlocal released
+            if not released:
+                released = True
+                await upstream.aclose()
+                self._finish_url(worker_url)
+
+        async def stream():
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await release()
+
+        return StreamingResponse(
+            stream(),
+            status_code=upstream.status_code,
+            headers={k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS},
+            # in case the stream is never started, e.g. the client disconnected.
+            background=BackgroundTask(release),
+        )
 
     async def add_worker(self, request: Request):
         """Add a new worker to the router.
@@ -113,7 +183,7 @@ class SlimeRouter:
         # 2) Fallback to JSON body
         if not worker_url:
             body = await request.body()
-            payload = json.loads(body) if body else {}
+            payload = decode_body(body, request.headers.get("content-type")) if body else {}
             worker_url = payload.get("url") or payload.get("worker_url")
 
         if not worker_url:
@@ -136,12 +206,15 @@ class SlimeRouter:
     async def retrieve_from_text(self, request: Request):
         """Get token information from text input"""
         body = await request.body()
-        payload = json.loads(body) if body else {}
+        payload = decode_body(body, request.headers.get("content-type")) if body else {}
 
         text = payload.get("text", "")
 
         # Use radix tree's retrieve_from_text method (no need to fetch weight version here)
-        token_ids, logp, loss_mask = self.radix_tree.retrieve_from_text(text, return_logprob=True)
+        # in a thread, the tokenization of the uncached suffix would block the event loop.
+        token_ids, logp, loss_mask = await asyncio.to_thread(
+            self.radix_tree.retrieve_from_text, text, return_logprob=True
+        )
 
         # Handle the result based on whether logp was requested
         result = {
@@ -159,6 +232,65 @@ class SlimeRouter:
 
         return result
 
+    async def wait_for_weight_update(self, weight_version=None, timeout: float = 30.0) -> bool:
+        """Wait until the workers report a new weight version, at most `timeout` seconds.
+
+        The workers are polled on `/get_weight_version` with a capped exponential backoff,
+        by a single task shared by the concurrent waiters.
+        Args:
+            weight_version: The weight version the caller knows about, e.g. the one of an aborted request,
+                return right away if the workers already report another one.
+        Returns:
+            Whether the weight version changed.
+        """
+
+        def changed():
+            if weight_version is not None and self.max_weight_version not in (None, weight_version):
+                return True
+            return self._weight_version_changes > changes
+
+        async with self._weight_version_changed:
+            changes = self._weight_version_changes
+            if changed():
+                return True
+            self._num_weight_version_waiters += 1
+            if self._weight_version_poller is None or self._weight_version_poller.done():
+                self._weight_version_poller = asyncio.create_task(self._poll_weight_version())
+            try:
+                await asyncio.wait_for(self._weight_version_changed.wait_for(changed), timeout)
+                return True
+            except asyncio.TimeoutError:
+                self.num_weight_update_timeouts += 1
+                print(
+                    f"[slime-router] No weight update after {timeout}s, the workers report version "
+                    f"{self.max_weight_version} ({self.num_weight_update_timeouts} timeouts so far)."
+                )
+                return False
+            finally:
+                self._num_weight_version_waiters -= 1
+
+    async def _poll_weight_version(self):
+        delay = _WEIGHT_VERSION_POLL_INITIAL_DELAY
+        while self._num_weight_version_waiters > 0:
+            versions = await asyncio.gather(
+                *[self._get_weight_version(url) for url in list(self.worker_urls)], return_exceptions=True
+            )
+            versions = {version for version in versions if not isinstance(version, BaseException)}
+            # wait for all the workers to be updated.
+            if len(versions) == 1 and (version := versions.pop()) != self.max_weight_version:
+                async with self._weight_version_changed:
+                    if self.max_weight_version is not None:
+                        self._weight_version_changes += 1
+                    self.max_weight_version = version
+                    self._weight_version_changed.notify_all()
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, _WEIGHT_VERSION_POLL_MAX_DELAY)
+
+    async def _get_weight_version(self, worker_url):
+        response = await self.client.get(f"{worker_url}/get_weight_version", timeout=_WEIGHT_VERSION_POLL_MAX_DELAY)
+        response.raise_for_status()
+        return response.json()["weight_version"]
+
     def _use_url(self):
         """Select a worker URL using round-robin strategy"""
         assert len(self.worker_urls) > 0, "No workers available"
@@ -1,3 +1,10 @@
-from .arguments import parse_args
-
 __all__ = ["parse_args"]
+
+
+def __getattr__(name):
+    # imported lazily, the arguments pull in sglang, which the standalone utils do not need.
+    if name == "parse_args":
+        from .arguments import parse_args
+
+        return parse_args
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
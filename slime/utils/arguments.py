@@ -225,6 +225,54 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "This is useful when you want to use the response as a prompt for the next rollout."
                 ),
             )
+            parser.add_argument(
+                "--rollout-length-aware-scheduling",
+                action="store_true",
+                default=False,
+                help=(
+                    "Submit the generation requests of each batch longest predicted response first, "
+                    "so that long groups do not start late and dominate the rollout time. "
+                    "The response lengths are predicted from the previous epochs, "
+                    "or from the prompt length for the prompts not seen yet."
+                ),
+            )
+            parser.add_argument(
+                "--rollout-concurrency-limiter",
+                type=str,
+                default="static",
+                help=(
+                    "The policy bounding the number of in-flight generation requests. "
+                    "`static` keeps `--sglang-server-concurrency` requests per engine, "
+                    "`aimd` and `gradient` adapt the limit to the observed latency per token and the aborted requests, "
+                    "from `--sglang-server-concurrency` per engine, between `--rollout-min-concurrency` "
+                    "and `--rollout-max-concurrency` per engine. "
+                    "Could also be the path of a subclass of `slime.rollout.concurrency_limiter.ConcurrencyLimiter`."
+                ),
+            )
+            parser.add_argument(
+                "--rollout-min-concurrency",
+                type=int,
+                default=1,
+                help="The lower bound per engine of the adaptive concurrency limit, see `--rollout-concurrency-limiter`.",
+            )
+            parser.add_argument(
+                "--rollout-max-concurrency",
+                type=int,
+                default=None,
+                help=(
+                    "The upper bound per engine of the adaptive concurrency limit, see `--rollout-concurrency-limiter`. "
+                    "Defaults to `--sglang-server-concurrency`, i.e. the limit can only shrink."
+                ),
+            )
+            parser.add_argument(
+                "--rollout-tokenizer-workers",
+                type=int,
+                default=4,
+                help=(
+                    "Number of threads to tokenize the prompts during rollout, "
+                    "so that the tokenization does not block the event loop sending the requests."
+                ),
+            )
             parser.add_argument(
                 "--rollout-stop",
                 type=str,
@@ -299,6 +347,27 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "This is useful for long responses."
                 ),
             )
+            parser.add_argument(
+                "--rollout-group-generate",
+                action="store_true",
+                default=False,
+                help=(
+                    "Whether to generate the samples of a group with one batched request to the engine, "
+                    "instead of one request per sample. This reduces the HTTP overhead and makes sure that "
+                    "the prompt prefix is shared. Only for new text prompts without custom generate function."
+                ),
+            )
+            parser.add_argument(
+                "--rollout-reuse-surplus-groups",
+                action="store_true",
+                default=False,
+                help=(
+                    "Whether to push the groups that finished generating after the rollout batch was full "
+                    "back to the data buffer, instead of dropping them. "
+                    "They are tagged with `start_rollout_id` and consumed first by the next rollout. "
+                    "Use `--partial-rollout` to also recycle the unfinished groups."
+                ),
+            )
             parser.add_argument(
                 "--custom-generate-function-path",
                 type=str,
@@ -319,6 +388,38 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "The function should take list[list[Sample]] and return list[list[Sample]]."
                 ),
             )
+            parser.add_argument(
+                "--buffer-policy",
+                type=str,
+                choices=["fifo", "reward_variance"],
+                default="fifo",
+                help=(
+                    "The order in which the buffered groups (e.g. partial or surplus groups) are reused, "
+                    "the oldest first, or the largest variance of the rewards first. "
+                    "Ignored when --buffer-filter-path is set."
+                ),
+            )
+            parser.add_argument(
+                "--buffer-max-staleness",
+                type=int,
+                default=None,
+                help=(
+                    "Evict the buffered groups started more than this number of rollouts ago, "
+                    "to bound the off-policyness of the reused samples. Not bounded by default."
+                ),
+            )
+            parser.add_argument(
+                "--buffer-max-groups-in-memory",
+                type=int,
+                default=None,
+                help="Spill the buffered groups beyond this number to --buffer-spill-dir. Not bounded by default.",
+            )
+            parser.add_argument(
+                "--buffer-spill-dir",
+                type=str,
+                default=None,
+                help="The directory of the spilled buffered groups, a temporary directory by default.",
+            )
             # update weight
             parser.add_argument(
                 "--update-weight-buffer-size",
@@ -460,6 +561,26 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "When need to add tools during apply_chat_template, you should provide the key for the tools in the prompt dataset."
                 ),
             )
+            parser.add_argument(
+                "--prompt-cache-dir",
+                type=str,
+                default=None,
+                help=(
+                    "Directory to cache the rendered prompts and their token ids of the prompt and eval datasets. "
+                    "The cache is keyed by the data file, the tokenizer and the chat template settings, "
+                    "so restarts skip the tokenization and the rollout reuses the cached token ids. "
+                    "Not used for multimodal datasets."
+                ),
+            )
+            parser.add_argument(
+                "--prompt-data-num-workers",
+                type=int,
+                default=0,
+                help=(
+                    "Number of processes used to apply the chat template and tokenize the prompt and eval datasets. "
+                    "0 means preparing them in the rollout manager process, still tokenizing in batches."
+                ),
+            )
 
             parser.add_argument(
                 "--start-rollout-id",
@@ -509,6 +630,17 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "Note that this may allocate the different response of the same prompt into different training steps."
                 ),
             )
+            parser.add_argument(
+                "--balance-data-across-steps",
+                action="store_true",
+                default=False,
+                help=(
+                    "Reorder the samples of a rollout across the training steps and data parallel ranks, "
+                    "so that every rank has a similar number of tokens in every step. "
+                    "This reduces the empty micro batches caused by the all-reduced number of micro batches "
+                    "with dynamic batch size. Works with --balance-data to keep the responses of the same prompt together."
+                ),
+            )
 
             parser.add_argument(
                 "--use-dynamic-batch-size",
@@ -531,6 +663,28 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                     "`max_response_len // cp_size` instead of `max_response_len`."
                 ),
             )
+            parser.add_argument(
+                "--micro-batch-cost",
+                type=str,
+                choices=["tokens", "flops"],
+                default="tokens",
+                help=(
+                    "The cost to balance between micro batches with dynamic batch size. "
+                    "`tokens` balances the number of tokens, "
+                    "`flops` balances the forward flops, which accounts for the quadratic attention cost of long sequences. "
+                    "The number of tokens per micro batch is still bounded by `max_tokens_per_gpu`."
+                ),
+            )
+            parser.add_argument(
+                "--data-prefetch-depth",
+                type=int,
+                default=0,
+                help=(
+                    "Number of micro batches to assemble ahead of the training step in a background thread. "
+                    "The tokens are sliced for CP, concatenated and padded in pinned CPU memory, "
+                    "and copied to GPU asynchronously. 0 disables the prefetching."
+                ),
+            )
             parser.add_argument(
                 "--log-probs-max-tokens-per-gpu",
                 type=int,
@@ -780,6 +934,22 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                 nargs="+",
                 default="",
             )
+            parser.add_argument(
+                "--radix-tree-max-cache-bytes",
+                type=int,
+                default=None,
+                help=(
+                    "Max size in bytes of the text, tokens, logprobs and loss masks cached by the radix tree "
+                    "of the RadixTreeMiddleware. The leaves are evicted beyond it. Not bounded by default."
+                ),
+            )
+            parser.add_argument(
+                "--radix-tree-eviction-policy",
+                type=str,
+                choices=["lru", "lfu"],
+                default="lru",
+                help="Evict the least recently used, or the least frequently used leaves of the radix tree first.",
+            )
             return parser
 
         # wandb
@@ -945,6 +1115,18 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
         def add_network_arguments(parser):
             parser.add_argument("--http-proxy", type=str, default=None)
             parser.add_argument("--use-distributed-post", action="store_true", default=False)
+            parser.add_argument(
+                "--rollout-wire-format",
+                type=str,
+                choices=["json", "msgpack"],
+                default="json",
+                help=(
+                    "The encoding of the generation requests and responses during rollout. "
+                    "`msgpack` is much cheaper to encode and decode for long token lists, it is only understood by "
+                    "the slime router, so it requires `--use-slime-router` and the other endpoints are sent JSON. "
+                    "Requires `msgpack`."
+                ),
+            )
             return parser
 
         def add_reward_model_arguments(parser):
@@ -978,6 +1160,66 @@ def get_slime_extra_args_provider(add_custom_arguments=None):
                 default=None,
                 help="URL for the reward model service for --rm-type remote_rm, e.g. http://localhost:8000",
             )
+            parser.add_argument(
+                "--rm-batch-size",
+                type=int,
+                default=1,
+                help=(
+                    "Send the concurrent remote_rm requests in batches of up to this number of samples. "
+                    "The service should then accept a list of payloads and return a list of rewards."
+                ),
+            )
+            parser.add_argument(
+                "--rm-batch-wait",
+                type=float,
+                default=0.01,
+                help="Seconds to wait for more samples before sending an incomplete remote_rm batch.",
+            )
+            parser.add_argument(
+                "--service-max-connections",
+                type=int,
+                default=256,
+                help=(
+                    "Max number of connections of the pooled client shared by the reward model and tool calls, "
+                    "see `slime.utils.http_utils.service_post`."
+                ),
+            )
+            parser.add_argument(
+                "--service-max-keepalive-connections",
+                type=int,
+                default=64,
+                help="Max number of idle connections kept alive by the pooled client of the reward model and tools.",
+            )
+            parser.add_argument(
+                "--service-timeout",
+                type=float,
+                default=60,
+                help="Timeout in seconds of the reward model and tool calls.",
+            )
+            parser.add_argument(
+                "--service-http2",
+                action="store_true",
+                default=False,
+                help="Whether to use HTTP/2 for the reward model and tool calls, requires `httpx[http2]`.",
+            )
+            parser.add_argument(
+                "--service-max-retries",
+                type=int,
+                default=3,
+                help="Number of retries of the reward model and tool calls on connection errors or overload.",
+            )
+            parser.add_argument(
+                "--service-backoff-base",
+                type=float,
+                default=0.5,
+                help="Base delay in seconds of the exponential backoff between retries, with full jitter.",
+            )
+            parser.add_argument(
+                "--service-backoff-max",
+                type=float,
+                default=30,
+                help="Max delay in seconds between retries of the reward model and tool calls.",
+            )
             parser.add_argument(
                 "--custom-rm-path",
                 type=str,
@@ -1,36 +1,118 @@
+import collections
+import copy
+import itertools
 import json
+import multiprocessing
 import random
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-import pandas as pd
 import ray
 import torch.distributed as dist
 
 from slime.utils.types import Sample
+from .micro_batch_planner import get_num_micro_batches
+from .packed_sequences import PackedSequences, unpack_rollout_data
+from .prompt_cache import PromptCache, get_prompt_cache_path
 from .seqlen_balancing import get_seqlen_balanced_partitions
 from .timer import Timer
 
 __all__ = ["Dataset"]
 
+# number of rows materialized as python dicts at a time when streaming a file.
+_READ_BATCH_SIZE = 4096
+
 
-# TODO: don't read the whole file into memory.
 def read_file(path):
+    """Lazily yield the rows of a .jsonl or .parquet file as dicts.
+
+    Rows are streamed in blocks (jsonl lines / parquet record batches), so the
+    whole file is never held in memory. The `path@[start:end]` syntax only reads
+    the rows inside the slice.
+    """
     path, row_slice = _parse_generalized_path(path)
 
     if path.endswith(".jsonl"):
-        df = pd.read_json(path, lines=True, dtype={"label": str})
+        num_rows_fn, read_fn = _count_jsonl_rows, _read_jsonl
     elif path.endswith(".parquet"):
-        df = pd.read_parquet(path, dtype_backend="pyarrow")
+        num_rows_fn, read_fn = _count_parquet_rows, _read_parquet
     else:
         raise ValueError(f"Unsupported file format: {path}. Supported formats are .jsonl and .parquet.")
 
+    start, stop = 0, None
     if row_slice is not None:
-        print(f"read_file path={path} slice {len(df)=} rows into {row_slice=}")
-        df = df.iloc[row_slice]
+        if _slice_needs_num_rows(row_slice):
+            num_rows = num_rows_fn(path)
+            start, stop, _ = row_slice.indices(num_rows)
+            print(f"read_file path={path} slice {num_rows=} rows into {row_slice=}")
+        else:
+            start, stop = row_slice.start or 0, row_slice.stop
+            print(f"read_file path={path} slice rows into {row_slice=}")
+        if stop is not None and stop <= start:
+            return
+
+    yield from read_fn(path, start, stop)
+
+
+def _slice_needs_num_rows(row_slice: slice) -> bool:
+    # only negative bounds depend on the total number of rows.
+    return any(x is not None and x < 0 for x in (row_slice.start, row_slice.stop))
+
+
+def _count_jsonl_rows(path):
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _read_jsonl(path, start, stop):
+    with open(path, "r", encoding="utf-8") as f:
+        lines = itertools.islice((line for line in f if line.strip()), start, stop)
+        while block := list(itertools.islice(lines, _READ_BATCH_SIZE)):
+            for line in block:
+                row = json.loads(line)
+                # keep the label as string, same as `pd.read_json(..., dtype={"label": str})`
+                if row.get("label") is not None and not isinstance(row["label"], str):
+                    row["label"] = str(row["label"])
+                yield row
+
+
+def _count_parquet_rows(path):
+    import pyarrow.parquet as pq
+
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def _read_parquet(path, start, stop):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+
+    # only read the row groups overlapping with [start, stop)
+    row_groups = []
+    first_row = None
+    offset = 0
+    for i in range(metadata.num_row_groups):
+        num_rows = metadata.row_group(i).num_rows
+        if offset + num_rows > start and (stop is None or offset < stop):
+            row_groups.append(i)
+            if first_row is None:
+                first_row = offset
+        offset += num_rows
+    if not row_groups:
+        return
 
-    for _, row in df.iterrows():
-        yield row.to_dict()
+    offset = first_row
+    for batch in parquet_file.iter_batches(batch_size=_READ_BATCH_SIZE, row_groups=row_groups):
+        batch_start = max(start - offset, 0)
+        batch_end = batch.num_rows if stop is None else min(stop - offset, batch.num_rows)
+        offset += batch.num_rows
+        if batch_start >= batch_end:
+            continue
+        yield from batch.slice(batch_start, batch_end - batch_start).to_pylist()
+        if stop is not None and offset >= stop:
+            return
 
 
 def _parse_generalized_path(s: str):
@@ -43,6 +125,101 @@ def _parse_generalized_path(s: str):
     return s, None
 
 
+def _render_prompt(
+    data, tokenizer, *, prompt_key, multimodal_keys, tool_key, apply_chat_template, apply_chat_template_kwargs
+):
+    if multimodal_keys:
+        prompt_content = []
+        if prompt_key in data:
+            prompt_content.append({"type": "text", "text": data[prompt_key]})
+        for media_type, data_key in multimodal_keys.items():
+            if data_key in data:
+                media_path = data[data_key]
+                prompt_content.append({"type": media_type, "path": media_path})
+    else:
+        prompt_content = data.get(prompt_key)
+
+    if not apply_chat_template:
+        return prompt_content
+
+    if tool_key is not None:
+        tools = data[tool_key]
+        if isinstance(tools, str):
+            tools = json.loads(tools)
+        elif isinstance(tools, np.ndarray):
+            tools = tools.tolist()
+        assert isinstance(tools, list), f"tools must be a list, got {type(tools)} instead"
+    else:
+        tools = None
+    template_input = [{"role": "user", "content": prompt_content}] if multimodal_keys else prompt_content
+    return tokenizer.apply_chat_template(
+        template_input,
+        tools,
+        tokenize=False,
+        add_generation_prompt=True,
+        **(apply_chat_template_kwargs or {}),
+    )
+
+
+def _prepare_batch(rows, tokenizer, tokenize, render_kwargs):
+    """Render the prompts of a batch of rows and, if needed, tokenize them with a single batched call."""
+    prompts = [_render_prompt(data, tokenizer, **render_kwargs) for data in rows]
+    if not tokenize:
+        return prompts, [None] * len(prompts)
+    if all(isinstance(prompt, str) for prompt in prompts):
+        # fast tokenizers encode a batch in parallel on the rust side.
+        token_ids = tokenizer(prompts, add_special_tokens=False)["input_ids"]
+    else:
+        token_ids = [tokenizer.encode(prompt, add_special_tokens=False) for prompt in prompts]
+    return prompts, token_ids
+
+
+_WORKER_TOKENIZER = None
+
+
+def _init_prepare_worker(tokenizer):
+    global _WORKER_TOKENIZER
+    _WORKER_TOKENIZER = tokenizer
+
+
+def _prepare_batch_in_worker(rows, tokenize, render_kwargs):
+    return _prepare_batch(rows, _WORKER_TOKENIZER, tokenize, render_kwargs)
+
+
+def _iter_prepared_rows(path, tokenizer, *, tokenize, num_workers, render_kwargs):
+    """Yield `(data, prompt, prompt_token_ids)` for every row of the file, in the original order.
+
+    Rows are rendered and tokenized in batches of `_READ_BATCH_SIZE`. With `num_workers > 0`,
+    the batches are sharded over a process pool, with at most `2 * num_workers` batches in flight.
+    """
+    rows_iter = read_file(path)
+    batches = iter(lambda: list(itertools.islice(rows_iter, _READ_BATCH_SIZE)), [])
+
+    if num_workers <= 0:
+        for rows in batches:
+            prompts, token_ids = _prepare_batch(rows, tokenizer, tokenize, render_kwargs)
+            yield from zip(rows, prompts, token_ids)
+        return
+
+    # use spawn as forking a process with running threads (e.g. inside a ray actor) is unsafe.
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_prepare_worker,
+        initargs=(tokenizer,),
+    ) as executor:
+        pendings = collections.deque()
+        for rows in batches:
+            pendings.append((rows, executor.submit(_prepare_batch_in_worker, rows, tokenize, render_kwargs)))
+            # consume the oldest batch first to keep the output in order.
+            while len(pendings) >= 2 * num_workers:
+                done_rows, future = pendings.popleft()
+                yield from zip(done_rows, *future.result())
+        while pendings:
+            done_rows, future = pendings.popleft()
+            yield from zip(done_rows, *future.result())
+
+
 class Dataset:
     def __init__(
         self,
@@ -58,163 +235,280 @@ class Dataset:
         seed=42,
         apply_chat_template=False,
         apply_chat_template_kwargs=None,
+        cache_dir=None,
+        num_workers=0,
     ):
-        self.origin_samples = []
-        for data in read_file(path):
-            if multimodal_keys:
-                prompt_content = []
-                if prompt_key in data:
-                    prompt_content.append({"type": "text", "text": data[prompt_key]})
-                for media_type, data_key in multimodal_keys.items():
-                    if data_key in data:
-                        media_path = data[data_key]
-                        prompt_content.append({"type": media_type, "path": media_path})
-            else:
-                prompt_content = data.get(prompt_key)
-
-            if apply_chat_template:
-                if tool_key is not None:
-                    tools = data[tool_key]
-                    if isinstance(tools, str):
-                        tools = json.loads(tools)
-                    elif isinstance(tools, np.ndarray):
-                        tools = tools.tolist()
-                    assert isinstance(tools, list), f"tools must be a list, got {type(tools)} instead"
-                else:
-                    tools = None
-                template_input = [{"role": "user", "content": prompt_content}] if multimodal_keys else prompt_content
-                prompt = tokenizer.apply_chat_template(
-                    template_input,
-                    tools,
-                    tokenize=False,
-                    add_generation_prompt=True,
-                    **apply_chat_template_kwargs,
-                )
-
-            else:
-                prompt = prompt_content
-
-            # TODO: this is slow.
-            if max_length is not None:
-                raw_prompt_ids = tokenizer.encode(prompt, add_special_tokens=False)
-                if not multimodal_keys:
+        # the prompt cache only stores text prompts.
+        cache, cache_path = None, None
+        if cache_dir is not None and not multimodal_keys:
+            cache_path = get_prompt_cache_path(
+                cache_dir,
+                path,
+                tokenizer,
+                prompt_key=prompt_key,
+                tool_key=tool_key,
+                apply_chat_template=apply_chat_template,
+                apply_chat_template_kwargs=apply_chat_template_kwargs,
+            )
+            cache = PromptCache.load(cache_path)
+        # rendered prompts and token ids of every row, used to build the cache on a miss.
+        cache_prompts, cache_token_ids = ([], []) if cache_path is not None and cache is None else (None, None)
+
+        # the samples are stored column by column, `Sample` objects are only created when sampled.
+        prompts, labels, metadata, cache_rows = [], [], [], []
+
+        def add_sample(row, data, prompt):
+            prompts.append(prompt)
+            labels.append(data[label_key] if label_key is not None else None)
+            metadata.append(data.get(metadata_key) or {})
+            cache_rows.append(row)
+
+        if cache is not None:
+            for row, data in enumerate(read_file(path)):
+                if max_length is not None and cache.lengths[row] > max_length:
+                    continue
+                add_sample(row, data, cache.get_prompt(row))
+        else:
+            prepared_rows = _iter_prepared_rows(
+                path,
+                tokenizer,
+                tokenize=max_length is not None or cache_prompts is not None,
+                num_workers=num_workers,
+                render_kwargs=dict(
+                    prompt_key=prompt_key,
+                    multimodal_keys=multimodal_keys,
+                    tool_key=tool_key,
+                    apply_chat_template=apply_chat_template,
+                    apply_chat_template_kwargs=apply_chat_template_kwargs,
+                ),
+            )
+            for row, (data, prompt, raw_prompt_ids) in enumerate(prepared_rows):
+                if cache_prompts is not None:
+                    if isinstance(prompt, str):
+                        cache_prompts.append(prompt)
+                        cache_token_ids.append(raw_prompt_ids)
+                    else:
+                        # e.g. a list of messages without chat template, cannot be cached.
+                        cache_prompts, cache_token_ids, cache_path = None, None, None
+
+                if max_length is not None and not multimodal_keys:
                     if len(raw_prompt_ids) > max_length:
                         continue
 
-            self.origin_samples.append(
-                Sample(
-                    prompt=prompt,
-                    label=data[label_key] if label_key is not None else None,
-                    metadata=data.get(metadata_key) or {},
-                )
-            )
+                add_sample(row, data, prompt)
 
+        if cache_prompts is not None:
+            PromptCache.save(cache_path, cache_prompts, cache_token_ids)
+            cache = PromptCache.load(cache_path)
+
+        self.prompt_cache = cache
+        # with the prompt cache, the prompts are read from the memory-mapped cache instead.
+        self.prompts = prompts if cache is None else None
+        self.labels = labels
+        self.metadata = metadata
+        self.cache_rows = np.asarray(cache_rows, dtype=np.int64)
+        # the shuffled order of the samples, None means the original order.
+        self.permutation = None
         self.epoch_id = -1
         self.seed = seed
-        self.samples = self.origin_samples
 
     def shuffle(self, new_epoch_id):
         if self.epoch_id == new_epoch_id:
             return
 
-        random.seed(self.seed + new_epoch_id)
-        permutation = list(range(len(self.samples)))
-        random.shuffle(permutation)
-        self.samples = [self.origin_samples[i] for i in permutation]
+        # the same order as the former `random.seed(seed + epoch_id); random.shuffle(...)` of the sample list,
+        # so that the `sample_offset` of existing checkpoints still points at the same samples.
+        permutation = list(range(len(self)))
+        random.Random(self.seed + new_epoch_id).shuffle(permutation)
+        self.permutation = np.asarray(permutation, dtype=np.int64)
         self.epoch_id = new_epoch_id
 
+    def _get_row(self, idx):
+        return int(self.permutation[idx]) if self.permutation is not None else idx
+
+    def get_prompt_token_ids(self, idx):
+        """Return the cached token ids of the `idx`-th sample, or None if the prompt cache is disabled."""
+        if self.prompt_cache is None:
+            return None
+        return self.prompt_cache.get_token_ids(self.cache_rows[self._get_row(idx)])
+
+    def make_samples(self, idx, n=1):
+        """Create `n` independent samples of the `idx`-th prompt, e.g. a group of rollouts."""
+        i = self._get_row(idx)
+        if self.prompt_cache is not None:
+            cache_row = self.cache_rows[i]
+            prompt = self.prompt_cache.get_prompt(cache_row)
+            tokens = self.prompt_cache.get_token_ids(cache_row)
+        else:
+            prompt, tokens = self.prompts[i], []
+
+        samples = []
+        for _ in range(n):
+            samples.append(
+                Sample(
+                    prompt_index=i,
+                    # text prompts are immutable, only the multimodal ones need a copy.
+                    prompt=prompt if isinstance(prompt, str) else copy.deepcopy(prompt),
+                    tokens=list(tokens),
+                    label=self.labels[i],
+                    metadata=copy.deepcopy(self.metadata[i]),
+                )
+            )
+        return samples
+
+    @property
+    def samples(self):
+        # kept for backward compatibility, this creates a sample per prompt.
+        return [self[i] for i in range(len(self))]
+
     def __getitem__(self, idx):
-        return self.samples[idx]
+        return self.make_samples(idx)[0]
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.labels)
 
 
 def get_minimum_num_micro_batch_size(total_lengths, max_tokens_per_gpu):
-    # use first fit to get the number of micro batches
-    batches = []
-    for l in total_lengths:
-        for i in range(len(batches)):
-            if batches[i] + l <= max_tokens_per_gpu:
-                batches[i] += l
-                break
-        else:
-            batches.append(l)
+    return get_num_micro_batches(total_lengths, max_tokens_per_gpu)
 
-    return len(batches)
 
+def get_rollout_partitions(args, total_lengths, dp_size):
+    """Return the indices of the samples assigned to each dp rank."""
+    if getattr(args, "balance_data_across_steps", False):
+        return _get_step_balanced_partitions(args, total_lengths, dp_size)
 
-def process_rollout_data(args, rollout_data_ref, dp_rank, dp_size):
-    rollout_data = {}
+    if not args.balance_data:
+        return [list(range(dp_rank, len(total_lengths), dp_size)) for dp_rank in range(dp_size)]
 
-    rank = dist.get_rank()
-    if rank == 0:
-        data = ray.get(rollout_data_ref.inner)
-        dist.broadcast_object_list([data], src=0)
-    else:
-        data = [None]
-        dist.broadcast_object_list(data, src=0)
-        data = data[0]
+    # Group-aware partitioning to keep each group together
+    n_samples_per_prompt = getattr(args, "n_samples_per_prompt", 1)
+    group_lengths = _get_group_lengths(total_lengths, n_samples_per_prompt)
 
-    # save the unprocessed reward for logging
-    rollout_data["raw_reward"] = data["raw_reward"]
+    # Get partitions at group level
+    group_partitions = get_seqlen_balanced_partitions(group_lengths, dp_size, equal_size=True)
 
-    if "prompt" in data:
-        rollout_data["prompt"] = data["prompt"]
+    # Expand group partitions to trajectory level
+    return [_expand_groups(dp_rank_groups, n_samples_per_prompt) for dp_rank_groups in group_partitions]
 
-    total_lengths = [len(t) for t in data["tokens"]]
-    data["total_lengths"] = total_lengths
 
-    # save the seqlen of the whole rollout batch
-    Timer().seq_lens = total_lengths
+def _get_group_lengths(total_lengths, n_samples_per_prompt):
+    # Calculate group-level lengths (sum of lengths for each group)
+    num_groups = len(total_lengths) // n_samples_per_prompt
+    group_lengths = []
+    for i in range(num_groups):
+        start_idx = i * n_samples_per_prompt
+        end_idx = start_idx + n_samples_per_prompt
+        group_total_length = sum(total_lengths[start_idx:end_idx])
+        group_lengths.append(group_total_length)
+    return group_lengths
+
+
+def _expand_groups(group_indices, n_samples_per_prompt):
+    trajectory_indices = []
+    for group_idx in group_indices:
+        # Add all trajectories in this group
+        start_idx = group_idx * n_samples_per_prompt
+        end_idx = start_idx + n_samples_per_prompt
+        trajectory_indices.extend(range(start_idx, end_idx))
+    return trajectory_indices
+
+
+def _get_step_balanced_partitions(args, total_lengths, dp_size):
+    """Jointly assign the samples to (train step, dp rank), balancing the tokens of every pair.
+
+    The samples are first split into the train steps of the rollout, then each step into the dp ranks,
+    both with Karmarkar-Karp, so that every rank has a similar number of tokens in every step and
+    the all-reduced (MAX) number of micro batches is not driven by a single unlucky rank.
+    The samples of each rank are ordered by step, as expected by the data iterators.
+    With `--balance-data`, the samples of the same prompt are kept together.
+    """
+    num_steps = len(total_lengths) // args.global_batch_size
+    assert num_steps >= 1, f"{len(total_lengths)=} is smaller than {args.global_batch_size=}"
 
     if args.balance_data:
-        # Group-aware partitioning to keep each group together
         n_samples_per_prompt = getattr(args, "n_samples_per_prompt", 1)
-        # Calculate group-level lengths (sum of lengths for each group)
-        num_groups = len(total_lengths) // n_samples_per_prompt
-        group_lengths = []
-        for i in range(num_groups):
-            start_idx = i * n_samples_per_prompt
-            end_idx = start_idx + n_samples_per_prompt
-            group_total_length = sum(total_lengths[start_idx:end_idx])
-            group_lengths.append(group_total_length)
-
-        # Get partitions at group level
-        group_partitions = get_seqlen_balanced_partitions(group_lengths, dp_size, equal_size=True)
-
-        # Expand group partitions to trajectory level
-        parititions = []
-        for dp_rank_groups in group_partitions:
-            trajectory_indices = []
-            for group_idx in dp_rank_groups:
-                # Add all trajectories in this group
-                start_idx = group_idx * n_samples_per_prompt
-                end_idx = start_idx + n_samples_per_prompt
-                trajectory_indices.extend(range(start_idx, end_idx))
-            parititions.append(trajectory_indices)
-
-    def get_partition(val):
-        if args.balance_data:
-            return [val[i] for i in parititions[dp_rank]]
+        lengths = _get_group_lengths(total_lengths, n_samples_per_prompt)
+    else:
+        n_samples_per_prompt = 1
+        lengths = total_lengths
+    assert (
+        len(lengths) % (num_steps * dp_size) == 0
+    ), f"{len(lengths)} samples (or groups) cannot be evenly split into {num_steps} steps and {dp_size} dp ranks"
+
+    partitions = [[] for _ in range(dp_size)]
+    for step_indices in get_seqlen_balanced_partitions(lengths, num_steps, equal_size=True):
+        step_partitions = get_seqlen_balanced_partitions([lengths[i] for i in step_indices], dp_size, equal_size=True)
+        for dp_rank, local_indices in enumerate(step_partitions):
+            partitions[dp_rank].extend(_expand_groups([step_indices[i] for i in local_indices], n_samples_per_prompt))
+    return partitions
+
+
+def partition_rollout_data(args, data, dp_size, dp_ranks=None):
+    """Split the rollout data of `RolloutManager` into the partitions of the given dp ranks (default to all).
+
+    Each partition is a dict with the fields of the local samples (still packed) under `rollout_data`
+    and the seqlens of the whole rollout batch under `seq_lens`.
+    """
+    if isinstance(data["tokens"], PackedSequences):
+        total_lengths = data["tokens"].lengths.tolist()
+    else:
+        total_lengths = [len(t) for t in data["tokens"]]
+    data = {**data, "total_lengths": total_lengths}
+
+    partitions = get_rollout_partitions(args, total_lengths, dp_size)
+    if dp_ranks is None:
+        dp_ranks = range(dp_size)
+
+    # unpack the bit-packed values once for all the dp ranks.
+    unpacked_values = {key: val.unpacked_values() for key, val in data.items() if isinstance(val, PackedSequences)}
+
+    def get_partition(key, indices):
+        val = data[key]
+        if isinstance(val, PackedSequences):
+            return val.select(indices, values=unpacked_values[key])
+        return [val[i] for i in indices]
+
+    results = []
+    for dp_rank in dp_ranks:
+        # save the unprocessed reward for logging
+        rollout_data = {"raw_reward": data["raw_reward"]}
+        for key in [
+            "tokens",
+            "total_lengths",
+            "response_lengths",
+            "rewards",
+            "truncated",
+            "loss_masks",
+            "round_number",
+            "sample_indices",
+            "rollout_log_probs",
+            "prompt",
+        ]:
+            if key not in data:
+                continue
+            rollout_data[key] = get_partition(key, partitions[dp_rank])
+        results.append({"rollout_data": rollout_data, "seq_lens": total_lengths})
+    return results
+
+
+def process_rollout_data(args, rollout_data_ref, dp_rank, dp_size):
+    inner = rollout_data_ref.inner
+    if isinstance(inner, dict) and dp_size in inner:
+        # RolloutManager has put one partition per dp rank, only fetch the local one.
+        partition = ray.get(inner[dp_size][dp_rank])
+    else:
+        assert not isinstance(inner, dict), f"rollout data is not partitioned for {dp_size=}, got {list(inner)}"
+        rank = dist.get_rank()
+        if rank == 0:
+            data = ray.get(inner)
+            dist.broadcast_object_list([data], src=0)
         else:
-            return val[dp_rank::dp_size]
-
-    for key in [
-        "tokens",
-        "total_lengths",
-        "response_lengths",
-        "rewards",
-        "truncated",
-        "loss_masks",
-        "round_number",
-        "sample_indices",
-        "rollout_log_probs",
-        "prompt",
-    ]:
-        if key not in data:
-            continue
-        val = get_partition(data[key])
-        rollout_data[key] = val
+            data = [None]
+            dist.broadcast_object_list(data, src=0)
+            data = data[0]
+        partition = partition_rollout_data(args, data, dp_size, dp_ranks=[dp_rank])[0]
+
+    # save the seqlen of the whole rollout batch
+    Timer().seq_lens = partition["seq_lens"]
 
-    return rollout_data
+    return unpack_rollout_data(partition["rollout_data"])
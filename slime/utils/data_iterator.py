@@ -0,0 +1,222 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+
+from slime.utils.types import RolloutBatch
+
+
+def slice_tokens_with_cp(tokens: torch.Tensor, pad_value: int, cp_rank: int, cp_size: int) -> torch.Tensor:
+    """Return the 2 chunks of the sequence of the CP rank for the thd layout, padded to a multiple of `2 * cp_size`."""
+    if cp_size == 1:
+        return tokens
+
+    # pad
+    chunk_size = (len(tokens) + 2 * cp_size - 1) // (2 * cp_size)
+    pad = 2 * cp_size * chunk_size - len(tokens)
+    tokens = F.pad(tokens, (0, pad), value=pad_value)
+    # get 2 chunk for thd cp
+    start_1, end_1 = chunk_size * cp_rank, chunk_size * (cp_rank + 1)
+    start_2, end_2 = chunk_size * (2 * cp_size - cp_rank - 1), chunk_size * (2 * cp_size - cp_rank)
+    return torch.cat([tokens[start_1:end_1], tokens[start_2:end_2]])
+
+
+def concat_tokens_with_cp(
+    tokens: list[torch.Tensor], cp_rank: int, cp_size: int
+) -> tuple[torch.Tensor, torch.Tensor, int]:
+    """Slice the sequences for CP, concatenate and pad them, on the device of `tokens`.
+
+    Returns the packed tokens, the cu_seqlens (as int on CPU) and the max seqlen.
+    """
+    # use 0 as the pad token id should be fine?
+    pad_token_id = 0
+
+    tokens = [slice_tokens_with_cp(t, pad_token_id, cp_rank, cp_size) for t in tokens]
+
+    cu_seqlens = [0]
+    for t in tokens:
+        cu_seqlens.append(cu_seqlens[-1] + t.size(0))
+
+    tokens = torch.cat(tokens)
+
+    # Always pad to 128 to reduce memory fragmentation and maybe make the computation faster
+    # TODO: make this configurable?
+    pad = (128 - tokens.size(0) % 128) % 128
+    if pad != 0:
+        tokens = F.pad(tokens, (0, pad), value=pad_token_id)
+        cu_seqlens.append(cu_seqlens[-1] + pad)
+
+    # thd requires the cu_seqlens to be of the origin length
+    cu_seqlens = torch.tensor(cu_seqlens, dtype=torch.int) * cp_size
+    # computed on CPU, so that it does not need a device sync.
+    max_seqlen = (cu_seqlens[1:] - cu_seqlens[:-1]).max().item()
+    return tokens, cu_seqlens, max_seqlen
+
+
+@dataclass
+class TokenBatch:
+    """The tokens of a micro-batch, assembled ahead of time by `DataIterator` in (pinned) CPU memory."""
+
+    tokens: torch.Tensor
+    cu_seqlens: torch.Tensor
+    max_seqlen: int
+    # the sequences before CP slicing, concatenated
+    unconcat_tokens: torch.Tensor
+    total_lengths: list[int]
+
+    @classmethod
+    def build(cls, tokens: list[torch.Tensor], cp_rank: int, cp_size: int) -> "TokenBatch":
+        packed_tokens, cu_seqlens, max_seqlen = concat_tokens_with_cp(tokens, cp_rank, cp_size)
+        token_batch = cls(
+            tokens=packed_tokens,
+            cu_seqlens=cu_seqlens,
+            max_seqlen=max_seqlen,
+            unconcat_tokens=torch.cat(tokens),
+            total_lengths=[t.size(0) for t in tokens],
+        )
+        if torch.cuda.is_available():
+            token_batch.tokens = token_batch.tokens.pin_memory()
+            token_batch.cu_seqlens = token_batch.cu_seqlens.pin_memory()
+            token_batch.unconcat_tokens = token_batch.unconcat_tokens.pin_memory()
+        return token_batch
+
+
+class DataIterator:
+    """Micro-batch iterator over rollout dicts.
+
+    Supports either fixed contiguous micro-batches or an explicit per-step
+    index schedule (for dynamic batch sizing / sequence-length balancing).
+
+    With `prefetch_depth > 0`, the tokens (CPU tensors) of the next micro-batches are packed into
+    `TokenBatch`es by a background thread, so that `get_batch` does not wait for the batch assembly.
+    """
+
+    def __init__(
+        self,
+        rollout_data: RolloutBatch,
+        micro_batch_size: Optional[int] = None,
+        micro_batch_indices: Optional[list[list[int]]] = None,
+        prefetch_depth: int = 0,
+        cp_rank: int = 0,
+        cp_size: int = 1,
+    ) -> None:
+        """Initialize an iterator over `rollout_data`.
+
+        Args:
+            rollout_data: Dict of per-sample fields for the local step.
+            micro_batch_size: Fixed contiguous slice size when not using dynamic scheduling.
+            micro_batch_indices: Explicit indices per micro-batch when using dynamic balancing.
+                Must be mutually exclusive with `micro_batch_size`.
+            prefetch_depth: Number of micro-batches of tokens to assemble ahead in a background thread.
+            cp_rank: Context parallel rank, to slice the prefetched tokens.
+            cp_size: Context parallel size, to slice the prefetched tokens.
+        """
+        self.rollout_data = rollout_data
+        self.micro_batch_size = micro_batch_size
+        self.micro_batch_indices = micro_batch_indices
+        assert micro_batch_size is None or micro_batch_indices is None
+        self.offset = 0
+        self.prefetch_depth = prefetch_depth
+        self.cp_rank = cp_rank
+        self.cp_size = cp_size
+        self._prefetch_queue = None
+        self._prefetch_stop = None
+        self._prefetch_thread = None
+
+    def get_next(self, keys: Sequence[str]) -> dict[str, Optional[list[object]]]:
+        """Return the next micro-batch for the requested keys.
+
+        - If `micro_batch_indices` is provided, selects rows according to the current
+          index list for each requested key.
+        - Otherwise, slices a contiguous window of size `micro_batch_size` starting
+          at the current offset.
+
+        Returns a dict mapping each key to a list subset (or None if absent).
+        When prefetching, "tokens" is a `TokenBatch` instead.
+        """
+        batch = {}
+        for key in keys:
+            vals = self.rollout_data.get(key, None)
+            if vals is None:
+                batch[key] = None
+            elif key == "tokens" and self.prefetch_depth > 0:
+                batch[key] = self._get_prefetched()
+            else:
+                if self.micro_batch_indices is not None:
+                    indices = self.micro_batch_indices[self.offset]
+                    batch[key] = [vals[i] for i in indices]
+                else:
+                    assert self.offset + self.micro_batch_size <= len(
+                        vals
+                    ), f"offset: {self.offset}, micro_batch_size: {self.micro_batch_size}, len(vals): {len(vals)}"
+                    batch[key] = vals[self.offset : self.offset + self.micro_batch_size]
+
+        if self.micro_batch_indices is not None:
+            self.offset += 1
+        else:
+            self.offset += self.micro_batch_size
+        return batch
+
+    def reset(self) -> "DataIterator":
+        """Reset internal offset to the start and return self."""
+        self.offset = 0
+        self._stop_prefetch()
+        return self
+
+    def _iter_micro_batch_indices(self):
+        if self.micro_batch_indices is not None:
+            yield from self.micro_batch_indices
+        else:
+            num_samples = len(self.rollout_data["tokens"])
+            for start in range(0, num_samples - self.micro_batch_size + 1, self.micro_batch_size):
+                yield range(start, start + self.micro_batch_size)
+
+    def _get_prefetched(self) -> "TokenBatch":
+        if self._prefetch_thread is None:
+            self._start_prefetch()
+        token_batch = self._prefetch_queue.get()
+        if isinstance(token_batch, BaseException):
+            raise token_batch
+        return token_batch
+
+    def _start_prefetch(self) -> None:
+        tokens = self.rollout_data["tokens"]
+        micro_batch_indices = list(self._iter_micro_batch_indices())
+        # start from the current micro-batch
+        skip = self.offset if self.micro_batch_indices is not None else self.offset // self.micro_batch_size
+        prefetch_queue = queue.Queue(maxsize=self.prefetch_depth)
+        stop = threading.Event()
+
+        def _put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    prefetch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _worker():
+            try:
+                for indices in micro_batch_indices[skip:]:
+                    if not _put(TokenBatch.build([tokens[i] for i in indices], self.cp_rank, self.cp_size)):
+                        return
+            except BaseException as e:
+                _put(e)
+
+        self._prefetch_queue = prefetch_queue
+        self._prefetch_stop = stop
+        self._prefetch_thread = threading.Thread(target=_worker, daemon=True)
+        self._prefetch_thread.start()
+
+    def _stop_prefetch(self) -> None:
+        if self._prefetch_thread is None:
+            return
+        self._prefetch_stop.set()
+        self._prefetch_thread.join()
+        self._prefetch_queue = None
+        self._prefetch_stop = None
+        self._prefetch_thread = None
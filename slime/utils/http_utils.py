@@ -1,4 +1,5 @@
 import asyncio
+import json
 import multiprocessing
 import os
 import random
@@ -7,7 +8,13 @@ from typing import Optional
 
 import httpx
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 SLIME_HOST_IP_ENV = "SLIME_HOST_IP"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
 
 
 def find_available_port(base_port: int):
@@ -84,6 +91,11 @@ def terminate_process(process: multiprocessing.Process, timeout: float = 1.0) ->
 _http_client: Optional[httpx.AsyncClient] = None
 _client_concurrency: int = 0
 
+# The slime router URL prefix when `--rollout-wire-format msgpack` is used, only the slime router understands msgpack.
+_msgpack_url_prefix: Optional[str] = None
+# Endpoints that rejected a msgpack payload with 415, and are only sent JSON afterwards.
+_json_only_urls: set[str] = set()
+
 # Optional Ray-based distributed POST dispatch
 _distributed_post_enabled: bool = False
 _post_actors = []  # type: List[object]
@@ -99,16 +111,44 @@ def _next_actor():
     return actor
 
 
-async def _post(client, url, payload, max_retries=60):
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return content_type is not None and MSGPACK_CONTENT_TYPE in content_type
+
+
+def decode_body(content: bytes, content_type: Optional[str]):
+    """Decode a msgpack or JSON body according to its content type, fall back to text."""
+    if is_msgpack(content_type):
+        return msgpack.unpackb(content)
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode("utf-8", errors="replace")
+
+
+async def _send(client, url, payload, msgpack_url_prefix):
+    if msgpack_url_prefix is not None and url.startswith(msgpack_url_prefix) and url not in _json_only_urls:
+        response = await client.post(
+            url,
+            content=msgpack.packb(payload or {}),
+            headers={"Content-Type": MSGPACK_CONTENT_TYPE, "Accept": f"{MSGPACK_CONTENT_TYPE}, application/json"},
+        )
+        if response.status_code == 415:
+            # the endpoint does not understand msgpack, e.g. a router without msgpack installed.
+            print(f"[http_utils] {url} rejected the msgpack payload, falling back to JSON.")
+            _json_only_urls.add(url)
+        else:
+            return response
+    return await client.post(url, json=payload or {})
+
+
+async def _post(client, url, payload, max_retries=60, msgpack_url_prefix=None):
+    msgpack_url_prefix = msgpack_url_prefix or _msgpack_url_prefix
     retry_count = 0
     while retry_count < max_retries:
         try:
-            response = await client.post(url, json=payload or {})
+            response = await _send(client, url, payload, msgpack_url_prefix)
             response.raise_for_status()
-            try:
-                output = response.json()
-            except:
-                output = response.text
+            output = decode_body(response.content, response.headers.get("content-type"))
         except Exception as e:
             retry_count += 1
             print(f"Error: {e}, retrying... (attempt {retry_count}/{max_retries}, url={url})")
@@ -124,11 +164,21 @@ async def _post(client, url, payload, max_retries=60):
 
 def init_http_client(args):
     """Initialize HTTP client and optionally enable distributed POST via Ray."""
-    global _http_client, _client_concurrency, _distributed_post_enabled
+    global _http_client, _client_concurrency, _distributed_post_enabled, _msgpack_url_prefix
     if not args.rollout_num_gpus:
         return
 
-    _client_concurrency = args.sglang_server_concurrency * args.rollout_num_gpus // args.rollout_num_gpus_per_engine
+    if args.rollout_wire_format == "msgpack":
+        if msgpack is None:
+            raise ImportError("--rollout-wire-format msgpack requires msgpack, install it with `pip install msgpack`.")
+        if args.use_slime_router:
+            _msgpack_url_prefix = f"http://{args.sglang_router_ip}:{args.sglang_router_port}/"
+        else:
+            print("[http_utils] --rollout-wire-format msgpack requires --use-slime-router, falling back to JSON.")
+
+    # enough connections for the highest limit of the rollout concurrency limiter.
+    max_concurrency = max(args.sglang_server_concurrency, args.rollout_max_concurrency or 0)
+    _client_concurrency = max_concurrency * args.rollout_num_gpus // args.rollout_num_gpus_per_engine
     if _http_client is None:
         _http_client = httpx.AsyncClient(
             limits=httpx.Limits(max_connections=_client_concurrency),
@@ -162,15 +212,16 @@ def _init_ray_distributed_post(args):
     # Define the async actor
     @ray.remote
     class _HttpPosterActor:
-        def __init__(self, concurrency: int):
+        def __init__(self, concurrency: int, msgpack_url_prefix: Optional[str]):
             # Lazy creation to this actor's event loop
             self._client = httpx.AsyncClient(
                 limits=httpx.Limits(max_connections=max(1, concurrency)),
                 timeout=httpx.Timeout(None),
             )
+            self._msgpack_url_prefix = msgpack_url_prefix
 
         async def do_post(self, url, payload, max_retries=60):
-            return await _post(self._client, url, payload, max_retries)
+            return await _post(self._client, url, payload, max_retries, msgpack_url_prefix=self._msgpack_url_prefix)
 
     # Create actors per node
     created = []
@@ -188,7 +239,7 @@ def _init_ray_distributed_post(args):
                 max_concurrency=per_actor_conc,
                 # Use tiny CPU to schedule
                 num_cpus=0.001,
-            ).remote(per_actor_conc)
+            ).remote(per_actor_conc, _msgpack_url_prefix)
             created.append(actor)
 
     _post_actors = created
@@ -217,3 +268,111 @@ async def get(url):
     response.raise_for_status()
     output = response.json()
     return output
+
+
+# Shared client for the external services called during the rollout, e.g. the reward model or the tools,
+# so that the connections are kept alive across the samples.
+_service_client: Optional[httpx.AsyncClient] = None
+_request_batchers: dict[str, "RequestBatcher"] = {}
+
+# Overloaded or restarting services, the other status codes are raised right away.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def get_service_client(args) -> httpx.AsyncClient:
+    """Return the pooled client for the reward model and tool services, created on the first call."""
+    global _service_client
+    if _service_client is None:
+        if args.service_http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise ImportError("--service-http2 requires h2, install it with `pip install httpx[http2]`.")
+        _service_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=args.service_max_connections,
+                max_keepalive_connections=args.service_max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(args.service_timeout),
+            http2=args.service_http2,
+        )
+    return _service_client
+
+
+async def service_post(args, url, payload, max_retries=None, **kwargs):
+    """POST a JSON payload to a service with the pooled client, `kwargs` are passed to `httpx.AsyncClient.post`.
+
+    Connection errors, timeouts and the status codes of an overloaded service are retried
+    with exponential backoff and full jitter, so that the retries of concurrent samples do not synchronize.
+    """
+    client = get_service_client(args)
+    max_retries = args.service_max_retries if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.post(url, json=payload, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in _RETRYABLE_STATUS_CODES
+            if not retryable or attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(args.service_backoff_max, args.service_backoff_base * 2**attempt))
+            print(f"Error: {e}, retrying in {delay:.2f}s... (attempt {attempt + 1}/{max_retries}, url={url})")
+            await asyncio.sleep(delay)
+
+
+class RequestBatcher:
+    """Gather the concurrent requests to an endpoint that accepts a list of payloads into batched requests.
+
+    A batch is sent once it has `max_batch_size` payloads, or `max_wait` seconds after its first payload.
+    The endpoint should return a list with one output per payload, in order.
+    """
+
+    def __init__(self, args, url: str, max_batch_size: int, max_wait: float) -> None:
+        self.args = args
+        self.url = url
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        # the batches being sent, the event loop only keeps weak references to the tasks.
+        self._tasks = set()
+
+    async def submit(self, payload):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch) -> None:
+        try:
+            outputs = await service_post(self.args, self.url, [payload for payload, _ in batch])
+            if not isinstance(outputs, list) or len(outputs) != len(batch):
+                raise ValueError(f"{self.url} should return a list of {len(batch)} outputs, got {outputs!r}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+
+def get_request_batcher(args, url: str, max_batch_size: int, max_wait: float) -> RequestBatcher:
+    if url not in _request_batchers:
+        _request_batchers[url] = RequestBatcher(args, url, max_batch_size, max_wait)
+    return _request_batchers[url]
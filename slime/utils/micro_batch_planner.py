@@ -0,0 +1,64 @@
+from argparse import Namespace
+from typing import Optional
+
+from .flops_utils import calculate_fwd_flops
+from .seqlen_balancing import get_seqlen_balanced_partitions
+
+__all__ = ["get_micro_batch_costs", "get_num_micro_batches", "plan_micro_batches"]
+
+
+def get_micro_batch_costs(args: Namespace, total_lengths: list[int]) -> Optional[list[int]]:
+    """Return the cost of each sample used to balance the micro batches, None means the number of tokens.
+
+    With `--micro-batch-cost flops`, the cost is the forward flops of the sequence from `flops_utils`,
+    which grows quadratically with the length because of the attention.
+    """
+    if getattr(args, "micro_batch_cost", "tokens") != "flops":
+        return None
+    if getattr(args, "hidden_size", None) is None:
+        # e.g. the FSDP backend does not have the megatron model arguments.
+        return None
+    return [calculate_fwd_flops([seqlen], args) for seqlen in total_lengths]
+
+
+def _first_fit_decreasing(total_lengths: list[int], max_tokens_per_gpu: int) -> int:
+    bins = []
+    for length in sorted(total_lengths, reverse=True):
+        for i in range(len(bins)):
+            if bins[i] + length <= max_tokens_per_gpu:
+                bins[i] += length
+                break
+        else:
+            bins.append(length)
+    return len(bins)
+
+
+def _fits(total_lengths: list[int], partitions: list[list[int]], max_tokens_per_gpu: int) -> bool:
+    # a single sample longer than the budget can only be put in a micro batch of its own.
+    return all(len(p) == 1 or sum(total_lengths[i] for i in p) <= max_tokens_per_gpu for p in partitions)
+
+
+def get_num_micro_batches(total_lengths: list[int], max_tokens_per_gpu: int, costs: Optional[list[int]] = None) -> int:
+    """Return the number of micro batches needed so that no micro batch exceeds `max_tokens_per_gpu`.
+
+    Starts from the first-fit-decreasing bin count, and increases it until the partitions
+    of `plan_micro_batches`, which balance the costs instead of packing the tokens, fit in the budget.
+    """
+    if not total_lengths:
+        return 0
+    num_micro_batches = _first_fit_decreasing(total_lengths, max_tokens_per_gpu)
+    while num_micro_batches < len(total_lengths):
+        partitions = plan_micro_batches(total_lengths, num_micro_batches, costs)
+        if _fits(total_lengths, partitions, max_tokens_per_gpu):
+            break
+        num_micro_batches += 1
+    return num_micro_batches
+
+
+def plan_micro_batches(
+    total_lengths: list[int], num_micro_batches: int, costs: Optional[list[int]] = None
+) -> list[list[int]]:
+    """Split the samples into `num_micro_batches` micro batches minimizing the maximum cost of a micro batch."""
+    return get_seqlen_balanced_partitions(
+        costs if costs is not None else total_lengths, num_micro_batches, equal_size=False
+    )
@@ -0,0 +1,96 @@
+import itertools
+from typing import Optional
+
+import numpy as np
+
+__all__ = ["PackedSequences", "pack_rollout_data", "unpack_rollout_data"]
+
+
+class PackedSequences:
+    """A list of variable-length sequences stored as a flat numpy array and offsets.
+
+    Compared with a list of python lists, it is pickled as a few contiguous buffers,
+    which ray can pass through the object store without copying.
+    With `bitpack=True`, the values must be 0/1 and are stored with `np.packbits`, e.g. for loss masks.
+    """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray, bitpack: bool = False):
+        self.values = values
+        self.offsets = offsets
+        self.bitpack = bitpack
+
+    @classmethod
+    def from_lists(cls, sequences: list, dtype, bitpack: bool = False) -> "PackedSequences":
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum([len(seq) for seq in sequences], out=offsets[1:])
+        values = np.fromiter(itertools.chain.from_iterable(sequences), dtype=dtype, count=offsets[-1])
+        if bitpack:
+            assert ((values == 0) | (values == 1)).all(), "only 0/1 values can be bit-packed"
+            values = np.packbits(values)
+        return cls(values, offsets, bitpack)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def unpacked_values(self) -> np.ndarray:
+        """The flat values, with the bit-packed values unpacked."""
+        return np.unpackbits(self.values, count=self.offsets[-1]) if self.bitpack else self.values
+
+    def __getitem__(self, idx: int) -> list:
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        if not self.bitpack:
+            return self.values[start:end].tolist()
+        bits = np.unpackbits(self.values[start // 8 : (end + 7) // 8])
+        return bits[start % 8 : start % 8 + end - start].tolist()
+
+    def select(self, indices, values: Optional[np.ndarray] = None) -> "PackedSequences":
+        """Return the sequences at `indices`, still packed.
+
+        `values` are the `unpacked_values()`, pass them to unpack the bit-packed values only once
+        when selecting several times from the same sequences.
+        """
+        if values is None:
+            values = self.unpacked_values()
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, lengths = self.offsets[:-1][indices], self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # gather all the selected values at once, the i-th output value comes from `starts[j] + i - offsets[j]`.
+        gather_indices = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        selected = values[gather_indices]
+        if self.bitpack:
+            selected = np.packbits(selected)
+        return PackedSequences(selected, offsets, self.bitpack)
+
+    def to_lists(self) -> list[list]:
+        values = self.unpacked_values()
+        return [values[start:end].tolist() for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+
+
+def _pack(sequences: Optional[list], dtype, bitpack: bool = False):
+    # keep the data as is if some sequences are missing, e.g. samples without rollout log probs.
+    if sequences is None or any(seq is None for seq in sequences):
+        return sequences
+    return PackedSequences.from_lists(sequences, dtype=dtype, bitpack=bitpack)
+
+
+def pack_rollout_data(data: dict) -> dict:
+    """Pack the per-token fields of the rollout data in place."""
+    data["tokens"] = _pack(data["tokens"], np.int32)
+    data["loss_masks"] = _pack(data["loss_masks"], np.uint8, bitpack=True)
+    if "rollout_log_probs" in data:
+        # float64 like the python floats, the log probs feed the importance ratios and must round trip exactly.
+        data["rollout_log_probs"] = _pack(data["rollout_log_probs"], np.float64)
+    return data
+
+
+def unpack_rollout_data(data: dict) -> dict:
+    """Convert the packed fields back to lists of python lists in place."""
+    for key, val in data.items():
+        if isinstance(val, PackedSequences):
+            data[key] = val.to_lists()
+    return data
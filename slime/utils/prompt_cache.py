@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+__all__ = ["PromptCache", "get_prompt_cache_path"]
+
+
+def _file_fingerprint(path: str) -> dict:
+    from slime.utils.data import _parse_generalized_path
+
+    real_path, row_slice = _parse_generalized_path(path)
+    stat = os.stat(real_path)
+    return {
+        "path": os.path.realpath(real_path),
+        "slice": None if row_slice is None else [row_slice.start, row_slice.stop],
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _tokenizer_fingerprint(tokenizer) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(type(tokenizer).__name__.encode())
+    hasher.update(str(getattr(tokenizer, "chat_template", None)).encode())
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        # fast tokenizers can serialize the full vocab, merges and normalizers.
+        hasher.update(backend_tokenizer.to_str().encode())
+    else:
+        hasher.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    return hasher.hexdigest()
+
+
+def get_prompt_cache_path(cache_root: str, path: str, tokenizer, **config) -> str:
+    """Return the cache directory for a prompt file.
+
+    The key covers the file fingerprint (path, slice, size, mtime), the tokenizer
+    and every option that changes the rendered prompt (e.g. prompt_key, chat template kwargs).
+    """
+    key = {
+        "file": _file_fingerprint(path),
+        "tokenizer": _tokenizer_fingerprint(tokenizer),
+        "config": config,
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+    return os.path.join(cache_root, digest[:32])
+
+
+class PromptCache:
+    """Memory-mapped store of rendered prompts and their token ids.
+
+    Row `i` of the cache corresponds to row `i` of the prompt file (before any length filtering).
+    All columns are flat numpy arrays with offsets, loaded with `mmap_mode="r"`, so
+    opening a cache is O(1) and the pages are shared between processes.
+    """
+
+    _FILES = ("prompt_bytes", "prompt_offsets", "token_ids", "token_offsets")
+
+    def __init__(self, cache_path: str):
+        arrays = {name: np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode="r") for name in self._FILES}
+        self._prompt_bytes = arrays["prompt_bytes"]
+        self._prompt_offsets = arrays["prompt_offsets"]
+        self._token_ids = arrays["token_ids"]
+        self._token_offsets = arrays["token_offsets"]
+        self.lengths = np.diff(self._token_offsets)
+
+    @classmethod
+    def load(cls, cache_path: str) -> Optional["PromptCache"]:
+        if not all(os.path.exists(os.path.join(cache_path, f"{name}.npy")) for name in cls._FILES):
+            return None
+        print(f"Load prompt cache from {cache_path}")
+        return cls(cache_path)
+
+    @staticmethod
+    def save(cache_path: str, prompts: list[str], token_ids: list[list[int]]) -> None:
+        assert len(prompts) == len(token_ids), f"{len(prompts)} != {len(token_ids)}"
+        encoded_prompts = [prompt.encode("utf-8") for prompt in prompts]
+        arrays = {
+            "prompt_bytes": np.frombuffer(b"".join(encoded_prompts), dtype=np.uint8),
+            "prompt_offsets": np.cumsum([0] + [len(p) for p in encoded_prompts], dtype=np.int64),
+            "token_ids": np.fromiter((t for ids in token_ids for t in ids), dtype=np.int32),
+            "token_offsets": np.cumsum([0] + [len(ids) for ids in token_ids], dtype=np.int64),
+        }
+
+        # write into a temporary directory and rename it, so that concurrent readers never see a partial cache.
+        parent = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix=".tmp_prompt_cache_")
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+            os.rename(tmp_path, cache_path)
+            print(f"Save prompt cache of {len(prompts)} prompts to {cache_path}")
+        except OSError:
+            # another process has written the same cache.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def get_prompt(self, idx: int) -> str:
+        start, end = self._prompt_offsets[idx], self._prompt_offsets[idx + 1]
+        return self._prompt_bytes[start:end].tobytes().decode("utf-8")
+
+    def get_token_ids(self, idx: int) -> list[int]:
+        start, end = self._token_offsets[idx], self._token_offsets[idx + 1]
+        return self._token_ids[start:end].tolist()
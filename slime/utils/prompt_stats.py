@@ -0,0 +1,76 @@
+import numpy as np
+import torch
+
+__all__ = ["PromptStatsStore"]
+
+
+class PromptStatsStore:
+    """Per-prompt statistics of the past rollouts, stored as numpy columns indexed by `Sample.prompt_index`.
+
+    Each update aggregates the samples of a prompt in the rollout batch, and the means are moving
+    averages with `momentum`, initialized by the first observation. Lookups are O(1) array reads,
+    e.g. `store.reward_mean[prompt_index]`, and `num_groups == 0` means that the prompt was never observed.
+    """
+
+    _FIELDS = ("num_groups", "zero_std_groups", "reward_mean", "response_length_mean", "truncated_rate")
+
+    def __init__(self, num_prompts: int, momentum: float = 0.5):
+        self.momentum = momentum
+        # the number of rollout batches in which the prompt appeared
+        self.num_groups = np.zeros(num_prompts, dtype=np.int32)
+        # the number of those in which all the responses of the prompt got the same reward
+        self.zero_std_groups = np.zeros(num_prompts, dtype=np.int32)
+        self.reward_mean = np.zeros(num_prompts, dtype=np.float32)
+        self.response_length_mean = np.zeros(num_prompts, dtype=np.float32)
+        self.truncated_rate = np.zeros(num_prompts, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.num_groups)
+
+    def update(self, prompt_indices, rewards, response_lengths, truncated) -> None:
+        """Record the responses of a rollout batch, one entry per sample."""
+        prompt_indices = np.asarray(prompt_indices, dtype=np.int64)
+        if len(prompt_indices) == 0:
+            return
+        prompts, inverse, counts = np.unique(prompt_indices, return_inverse=True, return_counts=True)
+
+        def _mean(values):
+            return np.bincount(inverse, weights=np.asarray(values, dtype=np.float64)) / counts
+
+        rewards = np.asarray(rewards, dtype=np.float64)
+        reward_mean = _mean(rewards)
+        reward_var = np.maximum(_mean(rewards**2) - reward_mean**2, 0)
+        zero_std = reward_var <= 1e-12
+
+        seen = self.num_groups[prompts] > 0
+        for name, value in (
+            ("reward_mean", reward_mean),
+            ("response_length_mean", _mean(response_lengths)),
+            ("truncated_rate", _mean(truncated)),
+        ):
+            column = getattr(self, name)
+            column[prompts] = np.where(seen, self.momentum * column[prompts] + (1 - self.momentum) * value, value)
+        self.num_groups[prompts] += 1
+        self.zero_std_groups[prompts] += zero_std
+
+    def get(self, prompt_index: int) -> dict:
+        return {name: getattr(self, name)[prompt_index].item() for name in self._FIELDS}
+
+    def is_saturated(self, prompt_index: int, min_groups: int = 1) -> bool:
+        """Whether all the past groups of the prompt had a zero reward std, i.e. the prompt is always or never solved."""
+        num_groups = self.num_groups[prompt_index]
+        return num_groups >= min_groups and self.zero_std_groups[prompt_index] == num_groups
+
+    def state_dict(self) -> dict:
+        # tensors, so that the state can be loaded by `torch.load` with `weights_only=True`.
+        return {name: torch.from_numpy(getattr(self, name).copy()) for name in self._FIELDS}
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        if len(state_dict["num_groups"]) != len(self):
+            print(
+                f"Prompt stats of {len(state_dict['num_groups'])} prompts do not match the {len(self)} prompts "
+                "of the dataset, ignore them."
+            )
+            return
+        for name in self._FIELDS:
+            setattr(self, name, np.asarray(state_dict[name], dtype=getattr(self, name).dtype))
@@ -15,87 +15,86 @@
 
 import copy
 import heapq
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class _State:
+    """A partial solution of k sets, stored as numpy arrays and kept in decreasing order of the sets.
+
+    Sets are ordered by (sum, number of items, items) as in the original python implementation.
+    As every index belongs to a single set, comparing the items of two non-empty sets is the same
+    as comparing the index of their first item, which makes the order a single `np.lexsort`.
+    """
+
+    __slots__ = ("sums", "counts", "first_idx", "items", "spread", "top")
+
+    def __init__(self, sums: np.ndarray, counts: np.ndarray, first_idx: np.ndarray, items: np.ndarray) -> None:
+        # lexsort is stable, so equal (empty) sets keep their order, same as `sorted(..., reverse=True)`.
+        order = np.lexsort((-first_idx, -counts, -sums))
+        self.sums = sums[order]
+        self.counts = counts[order]
+        # index of the first item of each set, -1 for an empty set.
+        self.first_idx = first_idx[order]
+        # the item indices of each set, None for an empty set.
+        self.items = items[order]
+        # python scalars are much faster to compare in the heap.
+        self.spread = (self.sums[0] - self.sums[-1]).item()
+        self.top = (self.sums[0].item(), self.counts[0].item(), self.first_idx[0].item())
+
+    @classmethod
+    def from_items(cls, items: List[Tuple[int, int]], k: int, dtype) -> "_State":
+        assert len(items) in [1, k], f"{len(items)} not in [1, {k}]"
+        sums = np.zeros(k, dtype=dtype)
+        counts = np.zeros(k, dtype=np.int64)
+        first_idx = np.full(k, -1, dtype=np.int64)
+        sets = np.empty(k, dtype=object)
+        for i, (idx, seqlen) in enumerate(items):
+            sums[i] = seqlen
+            counts[i] = 1
+            first_idx[i] = idx
+            sets[i] = [idx]
+        return cls(sums, counts, first_idx, sets)
+
+    def merge(self, other: "_State", seqlens: Optional[np.ndarray] = None) -> "_State":
+        # merge the i-th largest set of one state with the i-th smallest set of the other.
+        # the item lists of `self` are extended in place, as `self` is discarded after the merge.
+        other_items = other.items[::-1]
+        items = self.items
+        sums = self.sums + other.sums[::-1]
+        merged = np.flatnonzero(other.counts[::-1]).tolist()
+        if seqlens is not None:
+            # float additions are not associative, add the items one by one, in the order of the set they come from.
+            for i in merged:
+                sums[i] = np.add.accumulate(np.concatenate((self.sums[i : i + 1], seqlens[other_items[i]])))[-1]
+        for i in merged:
+            if items[i] is None:
+                items[i] = list(other_items[i])
+            else:
+                items[i].extend(other_items[i])
+        first_idx = np.where(self.counts > 0, self.first_idx, other.first_idx[::-1])
+        return _State(sums, self.counts + other.counts[::-1], first_idx, items)
+
+    def get_partitions(self) -> List[List[int]]:
+        return [list(items or []) for items in self.items]
+
+    def __lt__(self, other: "_State") -> bool:
+        # least heap, let the state with largest spread to be popped first,
+        # if the spread is the same, let the state who has the largest set
+        # to be popped first.
+        if self.spread != other.spread:
+            return self.spread > other.spread
+        return self.top > other.top
 
 
 def karmarkar_karp(seqlen_list: List[int], k_partitions: int, equal_size: bool):
     # see: https://en.wikipedia.org/wiki/Largest_differencing_method
-    class Set:
-
-        def __init__(self) -> None:
-            self.sum = 0
-            self.items = []
-
-        def add(self, idx: int, val: int):
-            self.items.append((idx, val))
-            self.sum += val
-
-        def merge(self, other):
-            for idx, val in other.items:
-                self.items.append((idx, val))
-                self.sum += val
-
-        def __lt__(self, other):
-            if self.sum != other.sum:
-                return self.sum < other.sum
-            if len(self.items) != len(other.items):
-                return len(self.items) < len(other.items)
-            return self.items < other.items
-
-    class State:
-
-        def __init__(self, items: List[Tuple[int, int]], k: int) -> None:
-            self.k = k
-            # sets should always be decreasing order
-            self.sets = [Set() for _ in range(k)]
-            assert len(items) in [1, k], f"{len(items)} not in [1, {k}]"
-            for i, (idx, seqlen) in enumerate(items):
-                self.sets[i].add(idx=idx, val=seqlen)
-            self.sets = sorted(self.sets, reverse=True)
-
-        def spread(self):
-            return self.sets[0].sum - self.sets[-1].sum
-
-        def get_partitions(self):
-            partitions = []
-            for i in range(len(self.sets)):
-                cur_partition = []
-                for idx, _ in self.sets[i].items:
-                    cur_partition.append(idx)
-                partitions.append(cur_partition)
-            return partitions
-
-        def merge(self, other):
-            for i in range(self.k):
-                self.sets[i].merge(other.sets[self.k - 1 - i])
-            self.sets = sorted(self.sets, reverse=True)
-
-        @property
-        def spread(self) -> int:
-            return self.sets[0].sum - self.sets[-1].sum
-
-        def __lt__(self, other):
-            # least heap, let the state with largest spread to be popped first,
-            # if the spread is the same, let the state who has the largest set
-            # to be popped first.
-            if self.spread != other.spread:
-                return self.spread > other.spread
-            return self.sets[0] > other.sets[0]
-
-        def __repr__(self) -> str:
-            repr_str = "["
-            for i in range(self.k):
-                if i > 0:
-                    repr_str += ","
-                repr_str += "{"
-                for j, (_, seqlen) in enumerate(self.sets[i].items):
-                    if j > 0:
-                        repr_str += ","
-                    repr_str += str(seqlen)
-                repr_str += "}"
-            repr_str += "]"
-            return repr_str
-
+    # The sets of each state are kept in numpy arrays, so that merging two states and
+    # re-sorting their sets do not go through python comparisons of every set.
+    dtype = np.asarray(seqlen_list).dtype if len(seqlen_list) > 0 else np.int64
+    # the float sums are accumulated item by item, to be the same as summing the items of each set in order.
+    seqlens = np.asarray(seqlen_list, dtype=dtype) if np.issubdtype(dtype, np.floating) else None
     sorted_seqlen_list = sorted([(seqlen, i) for i, seqlen in enumerate(seqlen_list)])
     states_pq = []
     if equal_size:
@@ -105,17 +104,16 @@ def karmarkar_karp(seqlen_list: List[int], k_partitions: int, equal_size: bool):
             for i in range(k_partitions):
                 seqlen, idx = sorted_seqlen_list[offset + i]
                 items.append((idx, seqlen))
-            heapq.heappush(states_pq, State(items=items, k=k_partitions))
+            heapq.heappush(states_pq, _State.from_items(items=items, k=k_partitions, dtype=dtype))
     else:
         for seqlen, idx in sorted_seqlen_list:
-            heapq.heappush(states_pq, State(items=[(idx, seqlen)], k=k_partitions))
+            heapq.heappush(states_pq, _State.from_items(items=[(idx, seqlen)], k=k_partitions, dtype=dtype))
 
     while len(states_pq) > 1:
         state0 = heapq.heappop(states_pq)
         state1 = heapq.heappop(states_pq)
         # merge states
-        state0.merge(state1)
-        heapq.heappush(states_pq, state0)
+        heapq.heappush(states_pq, state0.merge(state1, seqlens))
 
     final_state = states_pq[0]
     partitions = final_state.get_partitions()
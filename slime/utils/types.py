@@ -11,6 +11,8 @@ class Sample:
 
     group_index: Optional[int] = None
     index: Optional[int] = None
+    # the row of the prompt in the dataset, stable across epochs and shuffles
+    prompt_index: Optional[int] = None
     # prompt
     prompt: Union[str, list[dict[str, str]]] = ""
     tokens: list[int] = field(default_factory=list)
@@ -22,6 +24,8 @@ class Sample:
     loss_mask: Optional[list[int]] = None
     weight_versions: list[str] = field(default_factory=list)
     rollout_log_probs: Optional[list[float]] = None  # Log probabilities from rollout engine
+    # id of the generation request sent to the engine, used to abort the request of a single sample
+    rid: Optional[str] = None
 
     class Status(Enum):
         PENDING = "pending"
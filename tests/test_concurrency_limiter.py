@@ -0,0 +1,66 @@
+import asyncio
+from argparse import Namespace
+
+import pytest
+
+from slime.rollout.concurrency_limiter import (
+    AIMDLimiter,
+    GradientLimiter,
+    StaticLimiter,
+    create_concurrency_limiter,
+)
+
+
+async def _run_requests(limiter, num_requests: int, concurrency: int, latency: float = 1e-3):
+    """Send `num_requests` requests, `concurrency` at a time, with a constant latency per token."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            async with limiter.slot() as report:
+                await asyncio.sleep(0)
+                report(latency=latency)
+
+    await asyncio.gather(*[request() for _ in range(num_requests)])
+
+
+@pytest.mark.parametrize("limiter_cls", [AIMDLimiter, GradientLimiter])
+def test_limit_grows_with_queued_requests(limiter_cls):
+    limiter = limiter_cls(limit=4, min_limit=1, max_limit=16)
+    asyncio.run(_run_requests(limiter, num_requests=2000, concurrency=64))
+    assert limiter.limit > 4
+    assert limiter.limit <= 16
+
+
+@pytest.mark.parametrize("limiter_cls", [AIMDLimiter, GradientLimiter])
+def test_limit_holds_without_queued_requests(limiter_cls):
+    limiter = limiter_cls(limit=4, min_limit=1, max_limit=16)
+    asyncio.run(_run_requests(limiter, num_requests=2000, concurrency=4))
+    assert limiter.limit == pytest.approx(4)
+
+
+def test_heavy_request_does_not_deadlock():
+    async def main():
+        limiter = StaticLimiter(limit=2)
+        async with limiter.slot(weight=5):
+            assert limiter.in_flight == 5
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_create_concurrency_limiter():
+    args = Namespace(
+        rollout_num_gpus=4,
+        rollout_num_gpus_per_engine=2,
+        rollout_concurrency_limiter="aimd",
+        sglang_server_concurrency=8,
+        rollout_min_concurrency=2,
+        rollout_max_concurrency=32,
+    )
+    limiter = create_concurrency_limiter(args)
+    assert isinstance(limiter, AIMDLimiter)
+    assert (limiter.limit, limiter.min_limit, limiter.max_limit) == (16, 4, 64)
+
+    args.rollout_max_concurrency = None
+    assert create_concurrency_limiter(args).max_limit == 16
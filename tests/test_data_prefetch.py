@@ -0,0 +1,66 @@
+import pytest
+import torch
+
+from slime.utils.data_iterator import DataIterator, TokenBatch, concat_tokens_with_cp, slice_tokens_with_cp
+
+
+def _rollout_data():
+    tokens = [torch.arange(length) for length in [5, 17, 300, 3, 44, 128, 9, 1]]
+    return {"tokens": tokens, "total_lengths": [t.numel() for t in tokens]}
+
+
+def test_slice_tokens_with_cp():
+    tokens = torch.arange(1, 7)
+    assert slice_tokens_with_cp(tokens, 0, cp_rank=0, cp_size=1).tolist() == [1, 2, 3, 4, 5, 6]
+    # padded to 8 tokens, rank 0 gets the first and the last chunks of 2 tokens, rank 1 the middle ones.
+    assert slice_tokens_with_cp(tokens, 0, cp_rank=0, cp_size=2).tolist() == [1, 2, 0, 0]
+    assert slice_tokens_with_cp(tokens, 0, cp_rank=1, cp_size=2).tolist() == [3, 4, 5, 6]
+
+
+@pytest.mark.parametrize("cp_rank,cp_size", [(0, 1), (0, 2), (1, 2)])
+@pytest.mark.parametrize(
+    "schedule",
+    [dict(micro_batch_indices=[[0, 3], [1, 2, 4], [5], [6, 7]]), dict(micro_batch_size=2)],
+)
+def test_prefetched_batches_match_the_synchronous_path(cp_rank, cp_size, schedule):
+    rollout_data = _rollout_data()
+    prefetched = DataIterator(rollout_data, prefetch_depth=2, cp_rank=cp_rank, cp_size=cp_size, **schedule)
+    synchronous = DataIterator(rollout_data, **schedule)
+    # twice, the iterators are reset between the passes over the data, e.g. for each model chunk.
+    for _ in range(2):
+        for _ in range(4):
+            token_batch = prefetched.get_next(["tokens", "total_lengths"])["tokens"]
+            tokens = synchronous.get_next(["tokens"])["tokens"]
+            assert isinstance(token_batch, TokenBatch)
+            expected_tokens, expected_cu_seqlens, expected_max_seqlen = concat_tokens_with_cp(tokens, cp_rank, cp_size)
+            assert torch.equal(token_batch.tokens, expected_tokens)
+            assert torch.equal(token_batch.cu_seqlens, expected_cu_seqlens)
+            assert token_batch.max_seqlen == expected_max_seqlen
+            assert token_batch.total_lengths == [t.numel() for t in tokens]
+            unconcat_tokens = token_batch.unconcat_tokens.split(token_batch.total_lengths)
+            assert all(torch.equal(a, b) for a, b in zip(unconcat_tokens, tokens))
+        prefetched.reset()
+        synchronous.reset()
+
+
+def test_prefetch_thread_stops_on_early_reset():
+    iterator = DataIterator(_rollout_data(), micro_batch_size=1, prefetch_depth=1)
+    iterator.get_next(["tokens"])
+    thread = iterator._prefetch_thread
+    assert thread is not None and thread.is_alive()
+    # the worker is blocked on the full queue, the reset must still stop it.
+    iterator.reset()
+    assert not thread.is_alive()
+    assert iterator._prefetch_thread is None
+    # and the next pass starts over from the first micro-batch.
+    token_batch = iterator.get_next(["tokens"])["tokens"]
+    assert token_batch.total_lengths == [5]
+    iterator.reset()
+
+
+def test_prefetch_error_is_raised_to_the_consumer():
+    # the tokens must be tensors, the error of the worker thread is raised by `get_next`.
+    iterator = DataIterator({"tokens": [[1, 2], [3]]}, micro_batch_size=1, prefetch_depth=1)
+    with pytest.raises(AttributeError):
+        iterator.get_next(["tokens"])
+    iterator.reset()
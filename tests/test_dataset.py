@@ -0,0 +1,19 @@
+import json
+import random
+
+from slime.utils.data import Dataset
+
+
+def test_shuffle_keeps_the_order_of_the_sample_list_shuffle(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    prompts = [f"prompt {i}" for i in range(50)]
+    path.write_text("".join(json.dumps({"text": prompt}) + "\n" for prompt in prompts))
+    dataset = Dataset(str(path), tokenizer=None, max_length=None, seed=42)
+
+    for epoch_id in range(3):
+        dataset.shuffle(epoch_id)
+        # the order of the former shuffle of the sample list, which the checkpointed `sample_offset`s refer to.
+        random.seed(42 + epoch_id)
+        expected = list(prompts)
+        random.shuffle(expected)
+        assert [dataset[i].prompt for i in range(len(dataset))] == expected
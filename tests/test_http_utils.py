@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+from slime.utils import http_utils  # noqa: E402
+
+ROUTER = "http://router:3000/"
+
+
+def _client(status_code_for_msgpack: int, requests: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        content_type = request.headers["content-type"]
+        requests.append((str(request.url), content_type))
+        if http_utils.is_msgpack(content_type):
+            if status_code_for_msgpack != 200:
+                return httpx.Response(status_code_for_msgpack, json={"error": "msgpack"})
+            payload = msgpack.unpackb(request.content)
+            return httpx.Response(
+                200, content=msgpack.packb(payload), headers={"content-type": http_utils.MSGPACK_CONTENT_TYPE}
+            )
+        return httpx.Response(200, json=json.loads(request.content))
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture(autouse=True)
+def msgpack_router(monkeypatch):
+    monkeypatch.setattr(http_utils, "_msgpack_url_prefix", ROUTER)
+    monkeypatch.setattr(http_utils, "_json_only_urls", set())
+
+
+def test_msgpack_only_to_the_router():
+    requests = []
+    client = _client(200, requests)
+    payload = {"input_ids": [1, 2, 3]}
+    assert asyncio.run(http_utils._post(client, f"{ROUTER}generate", payload)) == payload
+    assert asyncio.run(http_utils._post(client, "http://worker:3001/abort_request", payload)) == payload
+    assert [content_type for _, content_type in requests] == [http_utils.MSGPACK_CONTENT_TYPE, "application/json"]
+
+
+def test_fall_back_to_json_on_415():
+    requests = []
+    client = _client(415, requests)
+    payload = {"text": "a"}
+    for _ in range(2):
+        assert asyncio.run(http_utils._post(client, f"{ROUTER}generate", payload)) == payload
+    # the endpoint is remembered, and only sent JSON afterwards.
+    assert [content_type for _, content_type in requests] == [
+        http_utils.MSGPACK_CONTENT_TYPE,
+        "application/json",
+        "application/json",
+    ]
+
+
+def test_no_fall_back_on_invalid_payload(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay: sleep(0))
+    requests = []
+    client = _client(422, requests)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(http_utils._post(client, f"{ROUTER}generate", {"text": "a"}, max_retries=2))
+    assert all(http_utils.is_msgpack(content_type) for _, content_type in requests)
+    assert not http_utils._json_only_urls
@@ -0,0 +1,38 @@
+import random
+
+from slime.utils.packed_sequences import PackedSequences, pack_rollout_data, unpack_rollout_data
+
+
+def _rollout_data(num_samples: int = 5):
+    rng = random.Random(0)
+    lengths = [rng.randint(0, 20) for _ in range(num_samples)]
+    return {
+        "tokens": [[rng.randrange(150_000) for _ in range(length)] for length in lengths],
+        "loss_masks": [[rng.randint(0, 1) for _ in range(length)] for length in lengths],
+        "rollout_log_probs": [[-rng.random() * 10 for _ in range(length)] for length in lengths],
+        "rewards": [rng.random() for _ in lengths],
+    }
+
+
+def test_round_trip_is_exact():
+    data = _rollout_data()
+    packed = pack_rollout_data({key: list(value) for key, value in data.items()})
+    assert all(isinstance(packed[key], PackedSequences) for key in ("tokens", "loss_masks", "rollout_log_probs"))
+    assert unpack_rollout_data(packed) == data
+
+
+def test_select():
+    data = _rollout_data()
+    packed = pack_rollout_data({key: list(value) for key, value in data.items()})
+    for indices in ([3, 0, 4], [2], []):
+        for key in ("tokens", "loss_masks", "rollout_log_probs"):
+            values = packed[key].unpacked_values()
+            for selected in (packed[key].select(indices), packed[key].select(indices, values=values)):
+                assert selected.to_lists() == [data[key][i] for i in indices]
+                assert [selected[i] for i in range(len(indices))] == [data[key][i] for i in indices]
+                assert selected.lengths.tolist() == [len(data[key][i]) for i in indices]
+
+
+def test_missing_sequences_are_kept_as_is():
+    data = {"tokens": [[1, 2]], "loss_masks": [[1, 0]], "rollout_log_probs": [None]}
+    assert pack_rollout_data(data)["rollout_log_probs"] == [None]
@@ -0,0 +1,81 @@
+import random
+import threading
+
+from slime.router.middleware_hub.radix_tree import StringRadixTrie
+
+
+def test_longest_match_among_prefixing_siblings():
+    trie = StringRadixTrie()
+    # nodes are never split, so "ab" becomes a sibling of "abc" and both start with "a".
+    trie.insert("abc", [1, 2, 3])
+    trie.insert("ab", [1, 2])
+    trie.insert("b", [4])
+    assert sorted(child.string_key for child in trie.root.children) == ["ab", "abc", "b"]
+
+    assert trie.find_longest_prefix("abcd").matched_prefix == "abc"
+    assert trie.find_longest_prefix("abd").matched_prefix == "ab"
+    assert trie.find_longest_prefix("bc").token_ids == [4]
+    assert trie.find_longest_prefix("cab").matched_prefix == ""
+
+    assert trie.remove("abc")
+    assert trie.find_longest_prefix("abcd").matched_prefix == "ab"
+    assert sorted(child.string_key for child in trie.root.children) == ["ab", "b"]
+
+
+def test_many_siblings_with_a_shared_prefix():
+    trie = StringRadixTrie(max_cache_size=10**9)
+    trie.insert("<system>", [0])
+    texts = [f"<system><turn {i}>" + "x" * i for i in range(200)]
+    for i, text in enumerate(texts):
+        trie.insert(text, list(range(i + 2)))
+    for i, text in enumerate(texts):
+        result = trie.find_longest_prefix(text + " more")
+        assert result.matched_prefix == text
+        assert result.remaining_string == " more"
+
+
+def test_eviction_detaches_the_leaves():
+    trie = StringRadixTrie(max_cache_size=10**9, max_cache_bytes=200)
+    for i in range(20):
+        trie.insert(f"prompt {i} " + "y" * 10, list(range(5)))
+    trie.evict()
+    assert trie.cur_cache_bytes <= 200
+    remaining = trie.root.children
+    assert 0 < len(remaining) < 20
+    for child in remaining:
+        assert trie.find_longest_prefix(child.string_key).matched_prefix == child.string_key
+
+
+def test_lock_free_readers_with_a_concurrent_writer():
+    trie = StringRadixTrie(max_cache_size=10**9)
+    texts = [f"shared prefix {i % 7} " + "z" * i for i in range(300)]
+    errors = []
+    done = threading.Event()
+
+    def write():
+        rng = random.Random(0)
+        for _ in range(3):
+            for text in texts:
+                trie.insert(text, list(range(len(text))))
+            for text in rng.sample(texts, 100):
+                trie.remove(text)
+        done.set()
+
+    def read():
+        rng = random.Random(1)
+        while not done.is_set():
+            text = rng.choice(texts) + "!"
+            try:
+                result = trie.find_longest_prefix(text)
+                assert text.startswith(result.matched_prefix)
+                assert len(result.token_ids) == len(result.logp) == len(result.loss_mask)
+            except Exception as e:  # noqa: BLE001
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,33 @@
+from argparse import Namespace
+
+from slime.ray.rollout_data_source import RolloutDataSourceWithBuffer
+from slime.utils.types import Sample
+
+
+def _make_args(tmp_path):
+    return Namespace(
+        rollout_global_dataset=False,
+        n_samples_per_prompt=2,
+        buffer_filter_path=None,
+        buffer_policy="fifo",
+        buffer_max_staleness=None,
+        buffer_max_groups_in_memory=None,
+        buffer_spill_dir=None,
+        save=str(tmp_path),
+        load=str(tmp_path),
+    )
+
+
+def test_buffer_round_trip_without_global_dataset(tmp_path):
+    data_source = RolloutDataSourceWithBuffer(_make_args(tmp_path))
+    groups = [[Sample(index=2 * i + j, prompt=f"prompt {i}", reward=float(j)) for j in range(2)] for i in range(3)]
+    data_source.add_samples(groups)
+    data_source.save(rollout_id=4)
+
+    resumed = RolloutDataSourceWithBuffer(_make_args(tmp_path))
+    resumed.load(rollout_id=4)
+    assert resumed.get_buffer_length() == 3
+    popped = resumed.get_samples(3)
+    assert [[(sample.index, sample.prompt, sample.reward) for sample in group] for group in popped] == [
+        [(sample.index, sample.prompt, sample.reward) for sample in group] for group in groups
+    ]
@@ -0,0 +1,80 @@
+import asyncio
+from argparse import Namespace
+
+import httpx
+import pytest
+
+from slime.router.router import SlimeRouter
+
+
+@pytest.fixture
+def workers():
+    """The weight version reported by the fake workers."""
+    return {"weight_version": "1"}
+
+
+@pytest.fixture
+def router(workers):
+    args = Namespace(
+        sglang_router_ip="127.0.0.1",
+        sglang_router_port=0,
+        sglang_server_concurrency=4,
+        rollout_max_concurrency=None,
+        rollout_num_gpus=2,
+        rollout_num_gpus_per_engine=1,
+        slime_router_middleware_paths=[],
+    )
+    router = SlimeRouter(args)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/generate":
+            # a chunked response, like the streamed generation of sglang.
+            async def chunks():
+                for chunk in [b'data: {"text": "a"}\n\n', b'data: {"text": "ab"}\n\n', b"data: [DONE]\n\n"]:
+                    yield chunk
+
+            return httpx.Response(200, content=chunks(), headers={"content-type": "text/event-stream"})
+        assert request.url.path == "/get_weight_version"
+        return httpx.Response(200, json=workers)
+
+    router.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    router.worker_urls = {"http://worker-0": 0, "http://worker-1": 0}
+    return router
+
+
+def test_weight_update_wakes_the_waiters(router, workers):
+    async def main():
+        async def update_weights():
+            await asyncio.sleep(0.3)
+            workers["weight_version"] = "2"
+
+        update = asyncio.create_task(update_weights())
+        results = await asyncio.gather(*[router.wait_for_weight_update(timeout=10) for _ in range(8)])
+        await update
+        return results
+
+    assert asyncio.run(main()) == [True] * 8
+    assert router.max_weight_version == "2"
+    assert router.num_weight_update_timeouts == 0
+
+
+def test_known_version_returns_right_away(router):
+    router.max_weight_version = "2"
+    assert asyncio.run(router.wait_for_weight_update("1", timeout=0.01))
+
+
+def test_timeout_returns_false(router):
+    assert not asyncio.run(router.wait_for_weight_update(timeout=0.5))
+    assert router.num_weight_update_timeouts == 1
+
+
+def test_proxy_streams_the_response_and_releases_the_worker(router):
+    async def main():
+        transport = httpx.ASGITransport(app=router.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://router") as client:
+            async with client.stream("POST", "/generate", json={"text": "a", "stream": True}) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                return [line async for line in response.aiter_lines() if line]
+
+    assert asyncio.run(main()) == ['data: {"text": "a"}', 'data: {"text": "ab"}', "data: [DONE]"]
+    assert router.worker_urls == {"http://worker-0": 0, "http://worker-1": 0}
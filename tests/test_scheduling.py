@@ -0,0 +1,31 @@
+import pytest
+
+from slime.rollout.scheduling import ResponseLengthPredictor, sort_groups_by_predicted_length
+from slime.utils.types import Sample
+
+
+def _group(prompt: str, response_length: int = 0, tokenized: bool = False) -> list[Sample]:
+    # about 4 characters per token, so that the units differ
+    tokens = [0] * (len(prompt) // 4 + response_length) if tokenized else []
+    return [Sample(prompt=prompt, tokens=tokens, response_length=response_length) for _ in range(2)]
+
+
+def test_predict_untokenized_after_update():
+    predictor = ResponseLengthPredictor()
+    assert predictor.predict(_group("a" * 40)) is None
+
+    # the finished groups are tokenized, the groups to schedule are not yet.
+    predictor.update(_group("a" * 40, response_length=100, tokenized=True))
+    predictor.update(_group("b" * 80, response_length=200, tokenized=True))
+    assert predictor.predict(_group("c" * 120)) == pytest.approx(300)
+    assert predictor.predict(_group("c" * 120, tokenized=True)) == pytest.approx(300)
+    # seen prompts use their own history.
+    assert predictor.predict(_group("a" * 40)) == pytest.approx(100)
+
+
+def test_sort_groups_by_predicted_length():
+    predictor = ResponseLengthPredictor()
+    predictor.update(_group("a" * 40, response_length=100, tokenized=True))
+    predictor.update(_group("b" * 80, response_length=200, tokenized=True))
+    groups = [_group("c" * 10), _group("d" * 200), _group("e" * 100)]
+    assert sort_groups_by_predicted_length(predictor, groups) == [groups[1], groups[2], groups[0]]
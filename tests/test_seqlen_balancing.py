@@ -0,0 +1,91 @@
+import heapq
+import random
+
+import pytest
+
+from slime.utils.seqlen_balancing import get_seqlen_balanced_partitions, karmarkar_karp
+
+
+def _reference_karmarkar_karp(seqlen_list, k_partitions, equal_size):
+    """The python implementation of verl, with sets of (index, seqlen) items summed one item at a time."""
+
+    class Set:
+        def __init__(self):
+            self.sum = 0
+            self.items = []
+
+        def add(self, idx, val):
+            self.items.append((idx, val))
+            self.sum += val
+
+        def merge(self, other):
+            for idx, val in other.items:
+                self.add(idx, val)
+
+        def __lt__(self, other):
+            if self.sum != other.sum:
+                return self.sum < other.sum
+            if len(self.items) != len(other.items):
+                return len(self.items) < len(other.items)
+            return self.items < other.items
+
+    class State:
+        def __init__(self, items, k):
+            self.k = k
+            self.sets = [Set() for _ in range(k)]
+            for i, (idx, seqlen) in enumerate(items):
+                self.sets[i].add(idx, seqlen)
+            self.sets = sorted(self.sets, reverse=True)
+
+        @property
+        def spread(self):
+            return self.sets[0].sum - self.sets[-1].sum
+
+        def merge(self, other):
+            for i in range(self.k):
+                self.sets[i].merge(other.sets[self.k - 1 - i])
+            self.sets = sorted(self.sets, reverse=True)
+
+        def __lt__(self, other):
+            if self.spread != other.spread:
+                return self.spread > other.spread
+            return self.sets[0] > other.sets[0]
+
+    sorted_seqlen_list = sorted([(seqlen, i) for i, seqlen in enumerate(seqlen_list)])
+    states_pq = []
+    if equal_size:
+        for offset in range(0, len(sorted_seqlen_list), k_partitions):
+            items = [(idx, seqlen) for seqlen, idx in sorted_seqlen_list[offset : offset + k_partitions]]
+            heapq.heappush(states_pq, State(items, k_partitions))
+    else:
+        for seqlen, idx in sorted_seqlen_list:
+            heapq.heappush(states_pq, State([(idx, seqlen)], k_partitions))
+    while len(states_pq) > 1:
+        state0 = heapq.heappop(states_pq)
+        state1 = heapq.heappop(states_pq)
+        state0.merge(state1)
+        heapq.heappush(states_pq, state0)
+    return [[idx for idx, _ in s.items] for s in states_pq[0].sets]
+
+
+@pytest.mark.parametrize("kind", ["int", "float"])
+@pytest.mark.parametrize("equal_size", [False, True])
+def test_same_partitions_as_reference(kind, equal_size):
+    rng = random.Random(0)
+    for _ in range(500):
+        k = rng.randint(1, 8)
+        n = k * rng.randint(1, 12)
+        if kind == "int":
+            seqlen_list = [rng.randint(1, 50) for _ in range(n)]
+        else:
+            # near ties, broken by rounding errors that depend on the order of the additions.
+            seqlen_list = [rng.choice([0.1, 0.2, 0.3, 0.7]) for _ in range(n)]
+        assert karmarkar_karp(seqlen_list, k, equal_size) == _reference_karmarkar_karp(seqlen_list, k, equal_size)
+
+
+def test_balanced_partitions():
+    seqlen_list = [8, 1, 7, 2, 6, 3, 5, 4]
+    partitions = get_seqlen_balanced_partitions(seqlen_list, k_partitions=2, equal_size=True)
+    assert sorted(sum(partitions, [])) == list(range(len(seqlen_list)))
+    assert [len(partition) for partition in partitions] == [4, 4]
+    assert [sum(seqlen_list[i] for i in partition) for partition in partitions] == [18, 18]
@@ -0,0 +1,59 @@
+import asyncio
+import json
+from argparse import Namespace
+
+import httpx
+import pytest
+
+from slime.utils import http_utils
+
+URL = "http://reward-model/score"
+
+
+def _make_args(**kwargs):
+    return Namespace(**{"service_max_retries": 3, "service_backoff_base": 0.01, "service_backoff_max": 0.02, **kwargs})
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """The requests received by the fake service, which answers with the status codes of `requests.status_codes`."""
+    requests = Namespace(received=[], status_codes=[])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        requests.received.append((payload, request.headers.get("x-api-key")))
+        status_code = requests.status_codes.pop(0) if requests.status_codes else 200
+        if status_code != 200:
+            return httpx.Response(status_code)
+        # the batched requests are answered with one output per payload.
+        return httpx.Response(
+            200, json=[{"score": p["id"]} for p in payload] if isinstance(payload, list) else payload
+        )
+
+    monkeypatch.setattr(http_utils, "_service_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(http_utils, "_request_batchers", {})
+    return requests
+
+
+def test_retry_overloaded_service(requests):
+    requests.status_codes = [503, 429]
+    output = asyncio.run(http_utils.service_post(_make_args(), URL, {"id": 1}, headers={"X-API-KEY": "key"}))
+    assert output == {"id": 1}
+    assert requests.received == [({"id": 1}, "key")] * 3
+
+
+def test_no_retry_on_client_error(requests):
+    requests.status_codes = [400]
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(http_utils.service_post(_make_args(), URL, {"id": 1}))
+    assert len(requests.received) == 1
+
+
+def test_request_batcher(requests):
+    async def main():
+        batcher = http_utils.get_request_batcher(_make_args(), URL, max_batch_size=4, max_wait=0.01)
+        return await asyncio.gather(*[batcher.submit({"id": i}) for i in range(6)])
+
+    assert asyncio.run(main()) == [{"score": i} for i in range(6)]
+    # a full batch right away, and the rest after `max_wait`.
+    assert [len(payload) for payload, _ in requests.received] == [4, 2]
@@ -0,0 +1,199 @@
+import asyncio
+from argparse import Namespace
+
+import pytest
+
+from slime.rollout import sglang_rollout
+from slime.utils.misc import SingletonMeta
+from slime.utils.prompt_stats import PromptStatsStore
+from slime.utils.types import Sample
+
+GROUP_SIZE = 4
+EASY, HARD = 0, 1
+
+
+class _Tokenizer:
+    special_tokens_map = {}
+
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": [1] * len(text)}
+
+
+def _make_args():
+    return Namespace(
+        hf_checkpoint="tokenizer",
+        sglang_router_ip="router",
+        sglang_router_port=0,
+        sglang_server_concurrency=64,
+        rollout_num_gpus=1,
+        rollout_num_gpus_per_engine=1,
+        rollout_concurrency_limiter="static",
+        rollout_min_concurrency=1,
+        rollout_max_concurrency=None,
+        rollout_tokenizer_workers=1,
+        rollout_temperature=1.0,
+        rollout_top_p=1.0,
+        rollout_top_k=-1,
+        rollout_max_response_len=16,
+        rollout_stop=None,
+        rollout_stop_token_ids=None,
+        rollout_skip_special_tokens=False,
+        rollout_length_aware_scheduling=False,
+        rollout_group_generate=False,
+        rollout_global_dataset=True,
+        rollout_batch_size=1,
+        over_sampling_batch_size=2,
+        n_samples_per_prompt=GROUP_SIZE,
+        dynamic_sampling_filter_path=(
+            "slime.rollout.filter_hub.dynamic_sampling_filters.check_reward_nonzero_std_streaming"
+        ),
+        custom_generate_function_path=None,
+        partial_rollout=False,
+        rollout_reuse_surplus_groups=False,
+        group_rm=False,
+        reward_key=None,
+        use_slime_router=False,
+        slime_router_middleware_paths=[],
+        sglang_speculative_algorithm=None,
+    )
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """A fake engine, the easy prompt is always solved and the hard one half of the time.
+
+    The first half of an easy group finishes first, then the rest of it, then the hard groups.
+    Returns the state of the engine, with the request ids aborted one by one.
+    """
+    delays = {}
+    in_flight = {}
+    engine = Namespace(aborted_rids=[], abort_delay=0.0, fail_aborts=False)
+
+    async def post(url, payload, max_retries=60):
+        if url.endswith("/abort_request"):
+            if "rid" in payload:
+                if engine.fail_aborts:
+                    raise RuntimeError("the engine restarted")
+                engine.aborted_rids.append(payload["rid"])
+                await asyncio.sleep(engine.abort_delay)
+            for rid, event in in_flight.items():
+                if payload.get("abort_all") or rid == payload.get("rid"):
+                    event.set()
+            return {}
+        event = in_flight[payload["rid"]] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), delays[payload["rid"]])
+            finish_reason = "abort"
+        except asyncio.TimeoutError:
+            finish_reason = "stop"
+        return {
+            "text": "a",
+            "meta_info": {"output_token_logprobs": [[-0.1, 1]], "finish_reason": {"type": finish_reason}},
+        }
+
+    async def get(url):
+        return {"urls": ["http://worker"]}
+
+    async def async_rm(args, sample):
+        return 1.0 if sample.prompt_index == EASY else float(sample.index % 2)
+
+    generate = sglang_rollout.generate
+
+    async def timed_generate(args, sample, sampling_params):
+        if sample.prompt_index == HARD:
+            delays[sample.rid] = 0.1
+        else:
+            delays[sample.rid] = 0.01 if sample.index % GROUP_SIZE < GROUP_SIZE // 2 else 0.05
+        return await generate(args, sample, sampling_params)
+
+    monkeypatch.setattr(sglang_rollout, "post", post)
+    monkeypatch.setattr(sglang_rollout, "get", get)
+    monkeypatch.setattr(sglang_rollout, "async_rm", async_rm)
+    monkeypatch.setattr(sglang_rollout, "generate", timed_generate)
+    monkeypatch.setattr(sglang_rollout.AutoTokenizer, "from_pretrained", lambda *args, **kwargs: _Tokenizer())
+    SingletonMeta._instances.pop(sglang_rollout.GenerateState, None)
+    yield engine
+    SingletonMeta._instances.pop(sglang_rollout.GenerateState, None)
+
+
+def _data_source():
+    num_groups = 0
+
+    def get_samples(num_samples):
+        nonlocal num_groups
+        groups = []
+        for _ in range(num_samples):
+            prompt_index = num_groups % 2
+            groups.append(
+                [
+                    Sample(
+                        prompt="easy" if prompt_index == EASY else "hard",
+                        prompt_index=prompt_index,
+                        group_index=num_groups,
+                        index=num_groups * GROUP_SIZE + i,
+                    )
+                    for i in range(GROUP_SIZE)
+                ]
+            )
+            num_groups += 1
+        return groups
+
+    return get_samples
+
+
+def test_saturated_prompt_is_cancelled_early(engine):
+    args = _make_args()
+    prompt_stats = PromptStatsStore(2)
+    sglang_rollout.GenerateState(args).prompt_stats = prompt_stats
+    data_source = _data_source()
+
+    # the easy groups are dropped by the full-group filter, and recorded in the stats until saturated.
+    for rollout_id in range(2):
+        output, _ = asyncio.run(sglang_rollout.generate_rollout_async(args, rollout_id, data_source))
+        assert [sample.prompt_index for sample in output.samples[0]] == [HARD] * GROUP_SIZE
+        assert output.metrics["rollout/dynamic_filter/drop_zero_std_1.0"] == 1
+        assert not engine.aborted_rids
+    assert prompt_stats.is_saturated(EASY, min_groups=2)
+    assert prompt_stats.num_groups[HARD] == 0
+
+    # then the easy group is given up once half of it finished, and its in-flight requests are aborted.
+    output, _ = asyncio.run(sglang_rollout.generate_rollout_async(args, 2, data_source))
+    assert [sample.prompt_index for sample in output.samples[0]] == [HARD] * GROUP_SIZE
+    assert output.metrics["rollout/dynamic_filter/drop_early_zero_std_1.0"] == 1
+    assert len(engine.aborted_rids) == GROUP_SIZE // 2
+    assert prompt_stats.num_groups[EASY] == 3 and prompt_stats.is_saturated(EASY, min_groups=3)
+
+
+def test_early_dropped_group_is_not_recycled(engine):
+    args = _make_args()
+    args.partial_rollout = True
+    prompt_stats = PromptStatsStore(2)
+    for _ in range(2):
+        prompt_stats.update([EASY] * GROUP_SIZE, [1.0] * GROUP_SIZE, [1] * GROUP_SIZE, [False] * GROUP_SIZE)
+    sglang_rollout.GenerateState(args).prompt_stats = prompt_stats
+    # the easy group is still being cancelled when the batch is full and the rollout aborts.
+    engine.abort_delay = 0.2
+
+    output, aborted_samples = asyncio.run(sglang_rollout.generate_rollout_async(args, 0, _data_source()))
+    assert [sample.prompt_index for sample in output.samples[0]] == [HARD] * GROUP_SIZE
+    assert len(engine.aborted_rids) == GROUP_SIZE // 2
+    assert aborted_samples == []
+    assert output.metrics["rollout/wasted_tokens"] == GROUP_SIZE
+    assert prompt_stats.num_groups[EASY] == 3
+
+
+def test_failed_aborts_are_ignored(engine):
+    args = _make_args()
+    prompt_stats = PromptStatsStore(2)
+    for _ in range(2):
+        prompt_stats.update([EASY] * GROUP_SIZE, [1.0] * GROUP_SIZE, [1] * GROUP_SIZE, [False] * GROUP_SIZE)
+    state = sglang_rollout.GenerateState(args)
+    state.prompt_stats = prompt_stats
+    engine.fail_aborts = True
+
+    # the cancelled requests are not aborted, the rollout goes on and ignores them when they finish.
+    output, _ = asyncio.run(sglang_rollout.generate_rollout_async(args, 0, _data_source()))
+    assert [sample.prompt_index for sample in output.samples[0]] == [HARD] * GROUP_SIZE
+    assert output.metrics["rollout/dynamic_filter/drop_early_zero_std_1.0"] == 1
+    # and the workers are listed again for the next aborts.
+    assert state.worker_urls is None